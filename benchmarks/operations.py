@@ -0,0 +1,269 @@
+"""
+Measures the throughput, latency and allocations of every
+CQLManager operation against an in-process stand-in for the
+cassandra session so that it runs without a cluster.  The
+canned session answers immediately from a fixed list of rows
+so the numbers are the overhead of ripozo-cassandra and the
+driver's statement handling.  The memory session stores the
+rows in a MemorySession, optionally with an injected latency.
+
+The results are written as JSON so that they can be
+compared between releases.
+
+    python benchmarks/operations.py --iterations 500 --output results.json
+    python benchmarks/operations.py --session memory --latency 1
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra.cqlengine import columns, connection
+from cassandra.cqlengine.models import Model
+
+from ripozo_cassandra import CQLManager
+
+import argparse
+import cassandra
+import datetime
+import decimal
+import itertools
+import json
+import os
+import platform
+import re
+import sys
+import timeit
+import uuid
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+_LIMIT = re.compile(r'LIMIT (\d+)')
+
+
+class BenchmarkModel(Model):
+    __keyspace__ = 'benchmarks'
+    __table_name__ = 'operation_model'
+    id = columns.UUID(primary_key=True, default=uuid.uuid4)
+    name = columns.Text()
+    email = columns.Text()
+    amount = columns.Decimal()
+    created = columns.DateTime()
+    tags = columns.Set(columns.Text)
+    scores = columns.List(columns.Integer)
+
+
+class _Result(list):
+    was_applied = True
+    paging_state = None
+
+    @property
+    def current_rows(self):
+        return self
+
+    def one(self):
+        return self[0]
+
+
+class _Statement(object):
+    """
+    The execution options the managers read and set on
+    the driver's statements before executing them.
+    """
+    consistency_level = None
+    serial_consistency_level = None
+    retry_policy = None
+    fetch_size = None
+    keyspace = None
+    routing_key = None
+    is_idempotent = False
+
+
+class _Bound(_Statement):
+    def __init__(self, prepared, values):
+        self.prepared_statement = prepared
+        self.query_string = prepared.query_string
+        self.values = values
+        self.raw_values = values
+        self.is_idempotent = prepared.is_idempotent
+
+
+class _Prepared(_Statement):
+    routing_key_indexes = None
+
+    def __init__(self, query_string):
+        self.query_string = query_string
+
+    def bind(self, values):
+        return _Bound(self, values)
+
+
+class CannedSession(object):
+    """
+    Answers every statement from a fixed list of rows.  Selects
+    restricted with a WHERE clause get the first row, every
+    other select gets as many rows as its LIMIT asks for and
+    every write is applied.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def prepare(self, query_string):
+        return _Prepared(query_string)
+
+    def execute(self, statement, parameters=None, paging_state=None, **kwargs):
+        query_string = getattr(statement, 'query_string', statement)
+        if not query_string.startswith('SELECT'):
+            return _Result()
+        if ' WHERE ' in query_string:
+            return _Result(self.rows[:1])
+        limit = _LIMIT.search(query_string)
+        return _Result(self.rows[:int(limit.group(1))] if limit else self.rows)
+
+
+class BenchmarkManager(CQLManager):
+    model = BenchmarkModel
+    fields = ('id', 'name', 'email', 'amount', 'created', 'tags', 'scores',)
+    create_fields = fields
+    update_fields = ('name', 'email', 'amount',)
+    session = None
+
+    def _get_session(self):
+        return self.session
+
+
+def make_rows(count):
+    return [dict(id=uuid.uuid4(), name='name {0}'.format(i), email='{0}@example.com'.format(i),
+                 amount=decimal.Decimal(i) / 100, created=datetime.datetime(2015, 6, 30),
+                 tags=set(['a', 'b', 'c']), scores=[1, 2, 3]) for i in range(count)]
+
+
+def operations(manager, rows, page_sizes):
+    """
+    :return: A list of (name, function) tuples.  Each function
+        runs the operation once.
+    """
+    counter = itertools.count()
+    ids = [row['id'] for row in rows]
+    deleted = iter(ids)
+    instances = [BenchmarkModel._construct_instance(row) for row in rows]
+
+    def _create():
+        values = dict(rows[next(counter) % len(rows)])
+        values['id'] = uuid.uuid4()
+        manager.create(values)
+
+    ops = [('create', _create),
+           ('retrieve', lambda: manager.retrieve(dict(id=ids[next(counter) % len(ids)])))]
+    for page_size in page_sizes:
+        ops.append(('retrieve_list[count={0}]'.format(page_size),
+                    lambda page_size=page_size: manager.retrieve_list({'count': page_size})))
+    ops.extend([
+        ('update', lambda: manager.update(dict(id=ids[next(counter) % len(ids)]),
+                                          dict(name='updated', amount=decimal.Decimal('1.5')))),
+        ('delete', lambda: manager.delete(dict(id=next(deleted)))),
+        ('serialize_model', lambda: manager.serialize_model(instances[next(counter) % len(instances)])),
+    ])
+    return ops
+
+
+def _percentile(ordered, percent):
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(run, iterations, warmup):
+    """
+    Runs the operation ``iterations`` times after ``warmup`` runs
+
+    :return: A dictionary with the ops/s, the p50 and p99 latencies
+        in milliseconds and the mean peak bytes allocated per run
+    :rtype: dict
+    """
+    for _ in range(warmup):
+        run()
+    timer = timeit.default_timer
+    latencies = []
+    started = timer()
+    for _ in range(iterations):
+        start = timer()
+        run()
+        latencies.append(timer() - start)
+    elapsed = timer() - started
+    latencies.sort()
+    return dict(ops_per_sec=iterations / elapsed,
+                p50_ms=_percentile(latencies, 50) * 1000,
+                p99_ms=_percentile(latencies, 99) * 1000,
+                peak_alloc_bytes=measure_allocations(run, min(iterations, 200)))
+
+
+def measure_allocations(run, iterations):
+    """
+    :return: The mean of the peak traced memory above the
+        baseline while running the operation or None if
+        tracemalloc can not measure it
+    :rtype: float
+    """
+    if tracemalloc is None or not hasattr(tracemalloc, 'reset_peak'):
+        return None
+    tracemalloc.start()
+    try:
+        total = 0
+        for _ in range(iterations):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            run()
+            total += tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return total / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000,
+                        help='The number of rows the stand-in session holds')
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--session', choices=['canned', 'memory'], default='canned')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='The milliseconds each request to the memory session takes')
+    parser.add_argument('--output', help='The file to write the JSON to.  Defaults to stdout')
+    args = parser.parse_args()
+
+    # every delete removes a row so there must be one for each run
+    rows = make_rows(max(args.rows, args.warmup + args.iterations + 200))
+    manager = BenchmarkManager()
+    if args.session == 'memory':
+        # The MemorySession is a test helper that is not installed with the package
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+        from ripozo_cassandra_tests.memory import MemorySession
+        session = MemorySession(latency=args.latency / 1000)
+        session.create_table(BenchmarkModel)
+        connection.register_connection('benchmarks', session=session, default=True)
+        BenchmarkManager.session = session
+        for row in rows:
+            manager.create(row)
+    else:
+        BenchmarkManager.session = CannedSession(rows)
+    results = dict((name, measure(run, args.iterations, args.warmup))
+                   for name, run in operations(manager, rows, args.page_sizes))
+    report = dict(python=platform.python_version(), implementation=platform.python_implementation(),
+                  driver=cassandra.__version__, session=args.session, latency_ms=args.latency,
+                  rows=len(rows), iterations=args.iterations,
+                  results=results)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Measures the rows per second of CQLManager.serialize_model
+with the compiled serializer against the previous
+``dict(obj)`` + ``valid_fields`` + ``make_json_safe`` path,
+and of building the models from the rows and serializing them
+against serializing the rows directly (``serialize_rows``).
+
+    python benchmarks/serialize_model.py --rows 1000 --repeat 5
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra.cqlengine import columns
+from cassandra.cqlengine.models import Model
+
+from ripozo.utilities import make_json_safe
+
+from ripozo_cassandra import CQLManager
+
+import argparse
+import datetime
+import decimal
+import timeit
+import uuid
+
+
+class BenchmarkModel(Model):
+    __keyspace__ = 'benchmarks'
+    id = columns.UUID(primary_key=True, default=uuid.uuid4)
+    name = columns.Text()
+    email = columns.Text()
+    amount = columns.Decimal()
+    created = columns.DateTime()
+    tags = columns.Set(columns.Text)
+    scores = columns.List(columns.Integer)
+    attributes = columns.Map(columns.Text, columns.Text)
+    payload = columns.Blob()
+
+
+class BenchmarkManager(CQLManager):
+    model = BenchmarkModel
+    fields = ('id', 'name', 'email', 'amount', 'created', 'tags', 'scores', 'attributes',)
+
+
+def make_rows(count):
+    return [dict(id=uuid.uuid4(), name='name {0}'.format(i), email='{0}@example.com'.format(i),
+                 amount=decimal.Decimal(i) / 100, created=datetime.datetime(2015, 6, 30),
+                 tags=set(['a', 'b', 'c']), scores=[1, 2, 3], attributes=dict(a='1', b='2'),
+                 payload=b'x' * 1024) for i in range(count)]
+
+
+def legacy_serialize(manager, obj):
+    return make_json_safe(manager.valid_fields(dict(obj), manager.fields))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    models = [BenchmarkModel._construct_instance(row) for row in rows]
+    manager = BenchmarkManager()
+    paths = [('dict + valid_fields + make_json_safe', lambda: [legacy_serialize(manager, obj) for obj in models]),
+             ('compiled serializer', lambda: [manager.serialize_model(obj) for obj in models]),
+             ('rows: build models + serialize', lambda: [manager.serialize_model(
+                 BenchmarkModel._construct_instance(row)) for row in rows]),
+             ('rows: row serializer', lambda: manager._serialize_rows(rows))]
+    for name, run in paths:
+        best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        print('{0:<40} {1:>12.0f} rows/s'.format(name, args.rows / best))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,4 +7,9 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import sys
+
 from ripozo_cassandra.cqlmanager import CQLManager
+
+if sys.version_info >= (3, 5):
+    from ripozo_cassandra.asyncmanager import AsyncCQLManager
@@ -0,0 +1,544 @@
+"""
+An asyncio version of the CQLManager that uses
+the driver's ``execute_async`` instead of blocking
+a thread for every round trip.  Requires python 3.5+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra.cluster import ResultSet
+from cassandra.cqlengine.query import check_applied
+from cassandra.query import BatchType
+
+from ripozo_cassandra.bulk import batch_statement
+from ripozo_cassandra.cqlmanager import CQLManager
+from ripozo_cassandra.metrics import finish_operation, measure, start_operation
+from ripozo_cassandra.slowlog import watch
+
+import asyncio
+import functools
+import logging
+import six
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def wrap_response_future(response_future, loop=None, fetch_all=True):
+    """
+    Bridges a driver ``ResponseFuture`` to an asyncio future.
+    The driver invokes its callbacks on its own event thread
+    so the result is handed back to the loop thread safely.
+
+    :param cassandra.cluster.ResponseFuture response_future:
+    :param asyncio.AbstractEventLoop loop: The loop to resolve
+        the future on.  Defaults to the current event loop
+    :param bool fetch_all: If True all of the pages are fetched
+        before the future resolves.  Otherwise it resolves with
+        the first page and its paging_state.
+    :return: A future that resolves to a ResultSet
+    :rtype: asyncio.Future
+    """
+    loop = loop or asyncio.get_event_loop()
+    future = loop.create_future()
+    rows = []
+
+    def _set_result(result):
+        if not future.done():
+            future.set_result(result)
+
+    def _set_exception(exc):
+        if not future.done():
+            future.set_exception(exc)
+
+    def _callback(page):
+        rows.extend(page)
+        if fetch_all and response_future.has_more_pages:
+            response_future.start_fetching_next_page()
+        else:
+            loop.call_soon_threadsafe(_set_result, ResultSet(response_future, rows))
+
+    def _errback(exc):
+        loop.call_soon_threadsafe(_set_exception, exc)
+
+    response_future.add_callbacks(_callback, _errback)
+    return future
+
+
+def instrumented(coroutine):
+    """
+    The coroutine version of ``ripozo_cassandra.metrics.instrumented``
+    """
+    operation = coroutine.__name__
+
+    @functools.wraps(coroutine)
+    async def wrapper(self, *args, **kwargs):
+        sink = self.metrics_sink
+        if not sink.enabled:
+            return await coroutine(self, *args, **kwargs)
+        state = start_operation(operation)
+        try:
+            result = await coroutine(self, *args, **kwargs)
+        except Exception:
+            finish_operation(sink, operation, self.model.__name__, state, failed=True)
+            raise
+        finish_operation(sink, operation, self.model.__name__, state)
+        return result
+    return wrapper
+
+
+def in_executor(method):
+    """
+    Makes a coroutine of a blocking CQLManager method
+    that runs it on the loop's default executor.
+    """
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, functools.partial(method, self, *args, **kwargs))
+    return wrapper
+
+
+_EXHAUSTED = object()
+
+
+class ExecutorIterator(object):
+    """
+    An asynchronous iterator over a blocking iterator whose
+    items are produced on the loop's default executor.
+
+    :param iterator: The blocking iterator
+    """
+
+    def __init__(self, iterator):
+        self._iterator = iterator
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        loop = asyncio.get_event_loop()
+        item = await loop.run_in_executor(None, next, self._iterator, _EXHAUSTED)
+        if item is _EXHAUSTED:
+            raise StopAsyncIteration
+        return item
+
+
+class _ModelsIterator(object):
+    """
+    Yields the models of the ScanPages of an asynchronous iterator.
+    """
+
+    def __init__(self, pages):
+        self._pages = pages
+        self._models = []
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._models:
+            page = await self._pages.__anext__()
+            self._models = list(reversed(page.models))
+        return self._models.pop()
+
+
+class _ListIterator(object):
+    """
+    The asynchronous iterator of ``AsyncCQLManager.iter_list``.
+    Each page is requested when the previous one has been
+    consumed, resuming from its paging_state.
+    """
+
+    def __init__(self, manager, statement, params):
+        self._manager = manager
+        self._statement = statement
+        self._params = params
+        self._serialize = manager._row_serializer()
+        self._rows = []
+        self._paging_state = None
+        self._started = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._rows:
+            if self._started and not self._paging_state:
+                raise StopAsyncIteration
+            result = await self._manager._execute_async(self._statement, self._params,
+                                                        paging_state=self._paging_state, fetch_all=False)
+            self._started = True
+            self._rows = list(result.current_rows)
+            self._rows.reverse()
+            self._paging_state = result.paging_state
+        return self._serialize(self._rows.pop())
+
+
+class AsyncCQLManager(CQLManager):
+    """
+    A CQLManager whose create, retrieve, retrieve_many, retrieve_list,
+    update, increment, decrement and delete are coroutines.  They return the same values as
+    the CQLManager's methods.  The writes and single model reads
+    always use prepared statements regardless of ``prepare_statements``.
+
+    retrieve_columns, count, aggregate and the bulk operations are
+    coroutines too but run the CQLManager's blocking methods on the
+    loop's default executor.  iter_list, scan and scan_pages return
+    asynchronous iterators to be used with ``async for``.
+    """
+
+    @instrumented
+    async def create(self, values, *args, **kwargs):
+        """
+        Creates an object using the specified values in the dict
+
+        :param dict values: A dictionary with the attribute names as keys
+            and the attribute values as values
+        :return: The serialized model
+        :rtype: dict
+        """
+        _LOGGER.info('Creating model of type %s', self.model.__name__)
+        values = self.valid_fields(values, self.create_fields)
+        obj = self.model(**values)
+        statement = self._insert_statement(obj)
+        copies = self._fan_out_inserts(obj)
+        if self.fail_create_if_exists:
+            check_applied(await self._execute_async(statement, write=True))
+            await self._fan_out_async(copies)
+        else:
+            await self._fan_out_async(copies, statement=statement)
+        obj._set_persisted()
+        return self._created_model(obj)
+
+    @instrumented
+    async def retrieve(self, lookup_keys, *args, **kwargs):
+        """
+        Retrieves an existing object using the lookup_keys
+
+        :param dict lookup_keys: A dictionary with the attribute names
+            as keys and the attribute values as values
+        :return: The specified model using the lookup keys
+        :rtype: dict
+        """
+        _LOGGER.info('Retrieving model of type %s', self.model.__name__)
+        cached = self._get_cached(lookup_keys)
+        if cached is not None:
+            return cached
+        result = await self._execute_async(self._select_statement(lookup_keys, columns=self.read_columns))
+        return self._cache_row(self._one_row(list(result), lookup_keys))
+
+    @instrumented
+    async def retrieve_many(self, lookup_keys_list, *args, **kwargs):
+        """
+        Retrieves the models for all of the lookup_keys at once
+        with at most ``bulk_concurrency`` queries in flight.
+
+        :param list lookup_keys_list: A list of lookup_keys dictionaries
+        :return: The serialized models in the same order as the
+            lookup_keys with None wherever no model was found
+        :rtype: list
+        """
+        _LOGGER.info('Retrieving %s models of type %s', len(lookup_keys_list), self.model.__name__)
+        results, plan = self._retrieve_many_plan(lookup_keys_list)
+        semaphore = asyncio.Semaphore(self.bulk_concurrency)
+
+        async def _outcome(statement):
+            async with semaphore:
+                try:
+                    return True, await self._execute_async(statement)
+                except Exception as exc:
+                    return False, exc
+
+        outcomes = await asyncio.gather(*[_outcome(statement) for statement, _ in plan])
+        return self._retrieve_many_results(lookup_keys_list, results, plan, outcomes)
+
+    @instrumented
+    async def retrieve_list(self, filters, *args, **kwargs):
+        """
+        Retrieves a list of all models that match the specified filters
+
+        :param dict filters: The named parameters to filter the models on
+        :return: tuple 0 index = a list of the models as dictionary objects
+            1 index = the pagination dict
+        :rtype: tuple
+        """
+        _LOGGER.info('Retrieving list of models of type %s with '
+                     'filters: %s', str(self.model), filters)
+        if self.paging_state_cursors:
+            statement, params, paging_state, pagination_count, filters = self._paged_list_statement(filters)
+            result = await self._execute_async(statement, params, paging_state=paging_state,
+                                               fetch_all=False)
+            return self._paged_list_response(result, statement, params, pagination_count, filters)
+        queryset, pagination_count, filters = self._list_queryset(filters)
+        statement, params = self._queryset_statement(queryset)
+        result = await self._execute_async(statement, params)
+        return self._list_response(list(result), pagination_count, filters)
+
+    def iter_list(self, filters, *args, **kwargs):
+        """
+        Lazily yields every model that matches the filters.
+        Rows are fetched ``stream_fetch_size`` at a time as
+        the iterator is consumed.  The pagination arguments
+        are ignored.
+
+        :param dict filters: The named parameters to filter the models on
+        :return: An asynchronous iterator of the models as dictionary objects
+        """
+        _LOGGER.info('Streaming models of type %s with filters: %s', str(self.model), filters)
+        queryset = self._filtered_queryset(self._without_pagination(filters)).limit(None)
+        statement, params = self._queryset_statement(queryset)
+        statement.fetch_size = self.stream_fetch_size
+        return _ListIterator(self, statement, params)
+
+    def scan(self, ranges=None):
+        """
+        The asynchronous version of ``CQLManager.scan``.  The
+        ranges are read on threads of the loop's default executor.
+
+        :param list ranges: The TokenRanges to read.  Defaults
+            to the whole ring.
+        :return: An asynchronous iterator of the models as dictionary objects
+        """
+        return _ModelsIterator(self.scan_pages(ranges=ranges))
+
+    def scan_pages(self, ranges=None):
+        """
+        The asynchronous version of ``CQLManager.scan_pages``.
+
+        :param list ranges: The TokenRanges to read.  Defaults
+            to the whole ring.
+        :return: An asynchronous iterator of ScanPages
+        """
+        return ExecutorIterator(CQLManager.scan_pages(self, ranges=ranges))
+
+    retrieve_columns = in_executor(CQLManager.retrieve_columns)
+    count = in_executor(CQLManager.count)
+    aggregate = in_executor(CQLManager.aggregate)
+    bulk_create = in_executor(CQLManager.bulk_create)
+    bulk_update = in_executor(CQLManager.bulk_update)
+    bulk_delete = in_executor(CQLManager.bulk_delete)
+    bulk_increment = in_executor(CQLManager.bulk_increment)
+
+    @instrumented
+    async def update(self, lookup_keys, updates, *args, **kwargs):
+        """
+        Updates the model specified by the lookup_keys with the specified updates
+
+        :param dict lookup_keys:
+        :param dict updates:
+        :return: The serialized, updated model
+        :rtype: dict
+        """
+        _LOGGER.info('Updating model of type %s', self.model.__name__)
+        updates = self.valid_fields(updates, self.update_fields)
+        if self._is_counter_model():
+            return await self._increment_async(lookup_keys, updates)
+        blind = self._blind_update_statement(lookup_keys, updates)
+        if blind is not None:
+            statement, obj = blind
+            self._check_exists(await self._execute_async(statement, write=True), lookup_keys)
+            return self._blind_update_response(obj, lookup_keys, updates)
+        obj = await self._get_model_async(lookup_keys)
+        for key, value in six.iteritems(updates):
+            setattr(obj, key, value)
+        if self._can_prepare_update(obj):
+            statement = self._update_statement(obj)
+            await self._fan_out_async(self._fan_out_updates(obj), statement=statement)
+            obj._set_persisted()
+        else:
+            copies = self._fan_out_updates(obj)
+            await asyncio.get_event_loop().run_in_executor(
+                None, functools.partial(self._retry, obj.save, self._is_idempotent_save(obj)))
+            await self._fan_out_async(copies)
+        return self._cache_model(obj)
+
+    @instrumented
+    async def delete(self, lookup_keys, *args, **kwargs):
+        """
+        Deletes the model specified by the lookup_keys
+
+        :param dict lookup_keys: A dictionary of fields and values on model to filter by
+        :return: An empty dictionary
+        :rtype: dict
+        """
+        _LOGGER.info('Deleting model of type %s', self.model.__name__)
+        blind = self._blind_delete_statement(lookup_keys)
+        if blind is not None:
+            statement, obj = blind
+            self._check_exists(await self._execute_async(statement, write=True), lookup_keys)
+            self._evict_model(obj)
+            return {}
+        obj = await self._get_model_async(lookup_keys, columns=self._key_columns())
+        await self._fan_out_async(self._fan_out_deletes(obj), statement=self._delete_statement(obj))
+        self._evict_model(obj)
+        return {}
+
+    @instrumented
+    async def increment(self, lookup_keys, deltas, *args, **kwargs):
+        """
+        Adds the deltas to the counter columns of the model
+
+        :param dict lookup_keys:
+        :param dict deltas: The amounts to add keyed by counter column
+        :return: The serialized primary keys of the model
+        :rtype: dict
+        """
+        _LOGGER.info('Incrementing counters of model of type %s', self.model.__name__)
+        return await self._increment_async(lookup_keys, self.valid_fields(deltas, self.update_fields))
+
+    @instrumented
+    async def decrement(self, lookup_keys, deltas, *args, **kwargs):
+        """
+        Subtracts the deltas from the counter columns of the model
+
+        :param dict lookup_keys:
+        :param dict deltas: The amounts to subtract keyed by counter column
+        :return: The serialized primary keys of the model
+        :rtype: dict
+        """
+        _LOGGER.info('Decrementing counters of model of type %s', self.model.__name__)
+        return await self._increment_async(lookup_keys, self.valid_fields(deltas, self.update_fields),
+                                           sign=-1)
+
+    async def _increment_async(self, lookup_keys, deltas, sign=1):
+        if self._is_primary_key(lookup_keys):
+            obj = self._primary_key_model(lookup_keys)
+        else:
+            obj = await self._get_model_async(lookup_keys, columns=tuple(self.model._primary_keys))
+        statement = self._increment_statement(obj, deltas, sign=sign)
+        if statement is not None:
+            await self._execute_async(statement, write=True)
+        return self._counter_response(obj)
+
+    async def _fan_out_async(self, copies, statement=None):
+        """
+        Writes the copies of a model, and the model itself if the
+        statement is given, without blocking.  See ``_fan_out``.
+        """
+        statements = copies if statement is None else [statement] + copies
+        if not statements:
+            return
+        if self.fan_out_batches or len(statements) == 1:
+            await self._execute_async(batch_statement(statements, batch_type=BatchType.LOGGED), write=True)
+            return
+        await asyncio.gather(*[self._execute_async(statement, write=True) for statement in statements])
+
+    async def _get_model_async(self, lookup_keys, columns=None):
+        result = await self._execute_async(self._select_statement(lookup_keys, columns=columns))
+        return self._one_model(list(result), lookup_keys)
+
+    def _execute_async(self, statement, parameters=None, paging_state=None, fetch_all=True, write=False):
+        """
+        Executes the statement without blocking.  If the limiter
+        has no permit available the statement is sent once a
+        permit is released, without blocking the loop.  Idempotent statements are
+        retried according to the retry_policy.
+
+        :param cassandra.query.Statement statement:
+        :param parameters: The parameters if the statement is not bound
+        :param bytes paging_state: The paging_state to resume from
+        :param bool fetch_all: Whether to fetch every page or only the first
+        :param bool write: Whether the statement is a write
+        :return: A future that resolves to the ResultSet
+        :rtype: asyncio.Future
+        """
+        if self.retry_policy is not None:
+            return asyncio.ensure_future(self._execute_retrying(statement, parameters, paging_state,
+                                                                fetch_all, write))
+        return self._execute_attempt(statement, parameters, paging_state, fetch_all, write)
+
+    async def _execute_retrying(self, statement, parameters, paging_state, fetch_all, write):
+        policy = self.retry_policy
+        deadline = policy.start()
+        attempt = 0
+        while True:
+            try:
+                return await self._execute_attempt(statement, parameters, paging_state, fetch_all, write)
+            except Exception as exc:
+                attempt += 1
+                delay = policy.next_delay(exc, statement.is_idempotent, attempt, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    def _execute_attempt(self, statement, parameters, paging_state, fetch_all, write):
+        started = None
+        if self.limiter is not None:
+            started = self.limiter.try_acquire()
+            if started is None:
+                return asyncio.ensure_future(self._execute_waiting(statement, parameters, paging_state,
+                                                                   fetch_all, write))
+        return self._send_async(statement, parameters, paging_state, fetch_all, write, started)
+
+    async def _execute_waiting(self, statement, parameters, paging_state, fetch_all, write):
+        started = await self._acquire_async()
+        return await self._send_async(statement, parameters, paging_state, fetch_all, write, started)
+
+    async def _acquire_async(self):
+        """
+        Waits up to the limiter's ``max_wait`` for a permit without
+        blocking the loop.  A waiter that is cancelled holds no permit.
+
+        :return: The time the permit was taken
+        :rtype: float
+        :raises SaturatedException: If no permit was available in time
+        """
+        limiter = self.limiter
+        loop = asyncio.get_event_loop()
+        deadline = None if limiter.max_wait is None else loop.time() + limiter.max_wait
+        while True:
+            released = loop.create_future()
+
+            def _wake(released=released):
+                loop.call_soon_threadsafe(lambda: released.done() or released.set_result(None))
+
+            # Listen before trying so a release in between is not missed
+            limiter.add_listener(_wake)
+            try:
+                started = limiter.try_acquire()
+                if started is not None:
+                    return started
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    raise limiter.reject()
+                try:
+                    await asyncio.wait_for(released, remaining)
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                limiter.remove_listener(_wake)
+
+    def _send_async(self, statement, parameters, paging_state, fetch_all, write, started):
+        """
+        Sends the statement and releases the limiter's
+        permit taken at ``started`` when it completes.
+        """
+        self._set_execution_options(statement, write=write)
+        measurement = measure(self.metrics_sink, self.model, 'query')
+        watched = watch(self.slow_query_log, self.model, statement, parameters).start()
+        try:
+            response_future = self._get_session().execute_async(
+                statement, parameters, paging_state=paging_state,
+                **self._execution_kwargs(write=write, trace=watched.trace))
+        except Exception as exc:
+            if started is not None:
+                self.limiter.release(started, exc)
+            watched.stop(error=exc)
+            raise
+        future = wrap_response_future(response_future, fetch_all=fetch_all)
+
+        def _stop(done):
+            error = None if done.cancelled() else done.exception()
+            if started is not None:
+                self.limiter.release(started, error)
+            if done.cancelled():
+                return
+            result = None if error is not None else done.result()
+            if error is None:
+                measurement.stop(result)
+            watched.stop(result, error)
+
+        future.add_done_callback(_stop)
+        return future
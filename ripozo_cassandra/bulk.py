@@ -0,0 +1,61 @@
+"""
+Helpers for grouping the statements of the
+CQLManager's bulk operations into batches.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import namedtuple, OrderedDict
+
+from cassandra.query import BatchStatement, BatchType
+
+#: The result of a single item in a bulk operation.
+#: ``value`` is the serialized model if the item succeeded
+#: and ``error`` is the exception if it did not.
+BulkResult = namedtuple('BulkResult', ['value', 'error'])
+
+
+def partition_batches(entries, partition_key, batch_size):
+    """
+    Groups the entries by their partition and splits
+    the groups into chunks of at most batch_size entries.
+    Entries keep their relative order within a group.
+
+    :param list entries: The entries to group
+    :param function partition_key: Takes an entry and returns
+        a hashable key identifying its partition
+    :param int batch_size: The maximum number of entries in a batch
+    :return: A list of lists of entries
+    :rtype: list
+    """
+    groups = OrderedDict()
+    for entry in entries:
+        groups.setdefault(partition_key(entry), []).append(entry)
+    batches = []
+    for group in groups.values():
+        for start in range(0, len(group), batch_size):
+            batches.append(group[start:start + batch_size])
+    return batches
+
+
+def batch_statement(statements, batch_type=BatchType.UNLOGGED):
+    """
+    Wraps the statements in a batch.  A single statement
+    is returned as is since a batch would only add overhead.
+    The batch is idempotent if it is not a counter batch
+    and all of its statements are.
+
+    :param list statements: The bound statements to batch
+    :param cassandra.query.BatchType batch_type:
+    :rtype: cassandra.query.Statement
+    """
+    if len(statements) == 1:
+        return statements[0]
+    batch = BatchStatement(batch_type=batch_type)
+    for statement in statements:
+        batch.add(statement)
+    batch.is_idempotent = batch_type != BatchType.COUNTER and \
+        all(statement.is_idempotent for statement in statements)
+    return batch
@@ -0,0 +1,191 @@
+"""
+Caches for the CQLManager's read-through retrieve cache.
+Any object implementing the BaseCache interface can be
+used, e.g. to share the cache between processes.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+
+import hashlib
+import six
+import struct
+import threading
+import time
+
+_LENGTH = struct.Struct('>I')
+
+
+def _encode(value):
+    """
+    Encodes a value the same way on every python version.
+    The type of the value and its length are part of the
+    encoding so that different values never collide.
+    """
+    if value is None:
+        return b'n'
+    if isinstance(value, bool):
+        tag, data = b'?', b'1' if value else b'0'
+    elif isinstance(value, six.binary_type):
+        tag, data = b'b', value
+    elif isinstance(value, six.text_type):
+        tag, data = b't', value.encode('utf-8')
+    elif isinstance(value, six.integer_types):
+        tag, data = b'i', str(value).encode('ascii')
+    elif isinstance(value, float):
+        tag, data = b'f', value.hex().encode('ascii')
+    elif isinstance(value, (tuple, list)):
+        tag, data = b'(', b''.join(_encode(item) for item in value)
+    else:
+        tag, data = b's', six.text_type(value).encode('utf-8')
+    return tag + _LENGTH.pack(len(data)) + data
+
+
+def make_key(namespace, values):
+    """
+    Makes a cache key that is safe to use with shared
+    backends such as memcached.  The key is the same on
+    python 2 and 3 so that processes running either can
+    share a cache.
+
+    :param unicode namespace: Identifies the table the values are for
+    :param tuple values: The normalized values identifying the entry.
+        Bytes, text, numbers, None and tuples of them are encoded
+        exactly, other values as their text.
+    :return: The key
+    :rtype: unicode
+    """
+    digest = hashlib.sha1(_encode(tuple(values))).hexdigest()
+    return '{0}:{1}'.format(namespace, digest)
+
+
+@six.add_metaclass(ABCMeta)
+class BaseCache(object):
+    """
+    The interface of a retrieve cache.  The counters
+    are kept by the cache so that a cache shared between
+    managers reports the totals for all of them.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @abstractmethod
+    def get(self, key):
+        """
+        :param unicode key:
+        :return: The cached value or None if it is not cached
+        """
+        pass
+
+    @abstractmethod
+    def set(self, key, value):
+        """
+        :param unicode key:
+        :param dict value:
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        """
+        :param unicode key:
+        """
+        pass
+
+    def stats(self):
+        """
+        :return: A dictionary with the hits, misses and evictions
+        :rtype: dict
+        """
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions)
+
+
+class LRUCache(BaseCache):
+    """
+    A thread safe, in process cache that evicts the least
+    recently used entry once it holds ``maxsize`` entries.
+    If ``ttl`` is set, entries expire that many seconds
+    after they were set.  Expired entries count as evictions.
+
+    :param int maxsize: The maximum number of entries
+    :param float ttl: The number of seconds an entry lives
+        or None if entries do not expire
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, timer=time.time):
+        super(LRUCache, self).__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[0] is not None and entry[0] <= self._timer():
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else self._timer() + self.ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ClientCache(BaseCache):
+    """
+    Adapts a shared cache client such as a memcached or
+    redis client.  The client must implement ``get(key)``,
+    ``set(key, value, ttl)`` and ``delete(key)`` and take
+    care of serializing the values.
+
+    :param client: The cache client
+    :param int ttl: The number of seconds an entry lives.  It
+        is passed as the third argument of the client's set.
+    """
+
+    def __init__(self, client, ttl=0):
+        super(ClientCache, self).__init__()
+        self.client = client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = self.client.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.client.set(key, value, self.ttl)
+
+    def delete(self, key):
+        self.client.delete(key)
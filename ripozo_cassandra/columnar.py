@@ -0,0 +1,82 @@
+"""
+Builds the columns returned by ``CQLManager.retrieve_columns``.
+If the driver was built with numpy support a session using its
+NumpyProtocolHandler returns every page as one numpy array per
+column.  Otherwise the columns are built from the rows in python.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra.query import tuple_factory
+
+try:
+    from cassandra.protocol import NumpyProtocolHandler
+except ImportError:  # pragma: no cover
+    NumpyProtocolHandler = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def numpy_session(cluster, keyspace=None):
+    """
+    Connects a session that returns pages as numpy arrays, for use
+    as a manager's ``columnar_session``.  It sets the session's
+    row_factory so the cluster must not use execution profiles.
+
+    :param cassandra.cluster.Cluster cluster:
+    :param unicode keyspace:
+    :rtype: cassandra.cluster.Session
+    """
+    if NumpyProtocolHandler is None or numpy is None:
+        raise ImportError('The cassandra driver was built without numpy support')
+    session = cluster.connect(keyspace)
+    session.client_protocol_handler = NumpyProtocolHandler
+    session.row_factory = tuple_factory
+    return session
+
+
+def rows_to_columns(rows, names):
+    """
+    :param list rows: The rows as dictionaries
+    :param list names: The names of the columns to build
+    :return: A list of the values of each column keyed by name
+    :rtype: dict
+    """
+    columns = dict((name, []) for name in names)
+    appends = [(name, columns[name].append) for name in names]
+    for row in rows:
+        for name, append in appends:
+            append(row[name])
+    return columns
+
+
+def pages_to_columns(pages, names):
+    """
+    Joins the pages returned by the NumpyProtocolHandler.  Columns
+    with null values are numpy masked arrays.
+
+    :param list pages: A dictionary of arrays keyed by column name per page
+    :param list names: The names of the columns to build
+    :return: An array of the values of each column keyed by name
+    :rtype: dict
+    """
+    pages = [page for page in pages if page]
+    if not pages:
+        return dict((name, numpy.array([])) for name in names)
+    if len(pages) == 1:
+        return dict((name, pages[0][name]) for name in names)
+    return dict((name, numpy.ma.concatenate([page[name] for page in pages])) for name in names)
+
+
+def column_length(columns):
+    """
+    :param dict columns:
+    :return: The number of values in the columns
+    :rtype: int
+    """
+    return len(next(iter(columns.values()))) if columns else 0
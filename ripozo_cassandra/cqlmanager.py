@@ -7,18 +7,42 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from ripozo.exceptions import NotFoundException
+from ripozo.decorators import classproperty
+from ripozo.exceptions import NotFoundException, ValidationException
 from ripozo.manager_base import BaseManager
 from ripozo.utilities import make_json_safe
 from ripozo import fields
 
-from cassandra.cqlengine.query import DoesNotExist, Token
+from cassandra.concurrent import execute_concurrent
+from cassandra.cqlengine import connection, ValidationError
+from cassandra.cqlengine.query import DoesNotExist, LWTException, Token, check_applied
+from cassandra.query import BatchType, SimpleStatement
 
+from ripozo_cassandra.cache import make_key
+from ripozo_cassandra.columnar import column_length, pages_to_columns, rows_to_columns
+from ripozo_cassandra.bulk import BulkResult, batch_statement, partition_batches
+from ripozo_cassandra.cursors import PROCESS_SECRET, decode_cursor, encode_cursor
+from ripozo_cassandra.fanout import changed_columns, copy_layout, copy_sources
+from ripozo_cassandra.limits import execute_limited, permit
+from ripozo_cassandra.keys import key_layout, pagination_plan, route_query
+from ripozo_cassandra.metrics import NULL_SINK, finish_operation, instrumented, measure, start_operation
+from ripozo_cassandra.scan import combine_aggregates, sample_ranges, scan_pages, split_ring
+from ripozo_cassandra.serializers import compile_row_serializer, compile_serializer
+from ripozo_cassandra.slowlog import watch
+from ripozo_cassandra.statements import StatementCache, select_cql, \
+    insert_cql, update_cql, delete_cql, counter_cql, aggregate_cql, aggregate_alias
+
+import functools
 import logging
 import six
 
 _LOGGER = logging.getLogger(__name__)
 
+#: The protocol version the primary keys of the retrieve_cache
+#: keys are serialized with.  It only matters for collections,
+#: which are serialized the same from version 3 on.
+_KEY_PROTOCOL_VERSION = 4
+
 _COLUMN_FIELD_MAP = {
     'ascii': fields.StringField,
     'inet': fields.StringField,
@@ -45,9 +69,155 @@ class CQLManager(BaseManager):
     Works with serializing the models as json and deserializing them to cqlengine models
 
     :param cassandra.cqlengine.models.Model model:
+    :param bool prepare_statements: If True (the default) create,
+        retrieve, update and delete run prepared statements that
+        are prepared once per operation and set of columns and
+        reused with bound values afterwards.  Otherwise every call
+        builds a fresh cqlengine query.
+    :param int bulk_batch_size: The maximum number of statements
+        in one of the unlogged batches sent by the bulk operations.
+    :param int bulk_concurrency: The maximum number of batches
+        the bulk operations have in flight at once.
+    :param bool paging_state_cursors: If True, ``retrieve_list`` pages
+        with the driver's ``fetch_size`` and ``paging_state`` instead
+        of the pagination_pk query args.  The next page is requested
+        with an opaque cursor in the ``pagination_cursor_query_arg``.
+    :param unicode pagination_cursor_query_arg: The name of the query
+        arg holding the cursor
+    :param bytes cursor_secret: The secret used to sign the cursors.
+        If it is not set a random secret is used that is only valid
+        for the lifetime of the process.
+    :param bool project_reads: If True (the default) retrieve and
+        retrieve_list only select the columns in ``fields`` and the
+        primary keys instead of every column on the model.  Updates
+        still read the full model.
+    :param ripozo_cassandra.cache.BaseCache retrieve_cache: An optional
+        read-through cache for retrieve.  Lookups by the full primary key
+        are served from the cache and create, update and delete refresh
+        or invalidate the entry.  Entries are keyed by the primary key
+        only, so managers of the same model with different ``fields``
+        can share a cache and see each other's writes.
+    :param bool blind_writes: If True, update and delete do not read
+        the model first when the lookup_keys are the full primary key.
+        They issue an ``UPDATE`` of only the changed columns or a
+        ``DELETE`` directly and update only returns the primary
+        keys and the changed columns.
+    :param bool blind_writes_if_exists: If True blind writes use
+        ``IF EXISTS`` and raise a NotFoundException when the row does
+        not exist.  This makes every blind write a lightweight
+        transaction, several round trips slower than a plain write, and
+        the model's other writes should then be lightweight transactions
+        as well since plain writes may be ordered before them.  By
+        default the existence is not checked and a blind update of a
+        missing row creates it.
+    :param int stream_fetch_size: The number of rows ``iter_list``
+        fetches from cassandra at a time.
+    :param ripozo_cassandra.metrics.BaseSink metrics_sink: Receives the
+        calls, errors, latencies split into query, decode and serialize
+        time and the rows and bytes returned by each operation.  The
+        default sink disables the measurements.  ``iter_list`` only
+        measures the query for its first page.
+    :param int scan_splits: The number of token ranges ``scan``
+        splits the ring into.
+    :param int scan_concurrency: The number of token ranges
+        ``scan`` reads at once.
+    :param int read_consistency: The ConsistencyLevel of the reads
+        unless the statement has its own.  Defaults to the driver's.
+    :param int write_consistency: The ConsistencyLevel of the writes
+        unless the statement has its own.  Defaults to the driver's.
+    :param read_execution_profile: The name of the execution profile
+        registered on the cluster, or the ExecutionProfile, the reads
+        are executed with.  Reads are marked idempotent so a profile
+        with a speculative execution policy retries them speculatively.
+        See ``ripozo_cassandra.profiles``.
+    :param write_execution_profile: The execution profile of the writes
+    :param float request_timeout: The timeout in seconds of every
+        request except the concurrent ones of the bulk operations and
+        retrieve_many, which use the profile's ``request_timeout``.
+    :param cassandra.cluster.Session columnar_session: An optional
+        session using the driver's NumpyProtocolHandler that
+        ``retrieve_columns`` reads numpy arrays with.  See
+        ``ripozo_cassandra.columnar.numpy_session``.
+    :param tuple query_tables: The cqlengine models of materialized
+        views or lookup tables that hold the model's rows keyed by
+        other columns.  A list retrieval whose filters do not restrict
+        the model's partition key is run on the first of them whose
+        partition key is restricted and that has the filtered columns,
+        the primary keys and the ``fields``.  The primary keys of
+        the table are always selected so that it can be paged.
+        Retrievals with an ``order_by`` are never routed.
+    :param tuple fan_out_tables: The denormalized copies of the model's
+        rows that create, update and delete keep in sync, as cqlengine
+        models with the model's column names or ``fanout.FanOutTable``.
+        A copy whose primary key changes is deleted and written again
+        under its new key.  Blind writes are disabled since the keys of
+        the copies are not known without reading the model.  Counter
+        columns are not copied.
+    :param bool fan_out_batches: If True (the default) the write of
+        the model and of its copies go out as one logged batch.
+        Otherwise they are executed concurrently.  The bulk operations
+        write the copies after the model's batches, as one logged batch
+        per model if True.
+    :param ripozo_cassandra.limits.AdaptiveLimiter limiter: An optional
+        limit on the requests in flight that can be shared between
+        managers.  A request that gets no permit within the limiter's
+        ``max_wait`` raises a SaturatedException.
+    :param ripozo_cassandra.retries.RetryPolicy retry_policy: If set,
+        idempotent requests that fail with a transient error are
+        retried with a jittered backoff.  Lightweight transactions
+        and counter updates are never retried.
+    :param ripozo_cassandra.cache.BaseCache count_cache: An optional
+        cache of the approximate counts and aggregates.  Use a cache
+        with a TTL since they are not invalidated by writes.
+    :param int count_sample: The number of the ``scan_splits`` token
+        ranges an approximate count or aggregate reads.
+    :param bool serialize_rows: If True (the default) the reads
+        serialize the rows returned by cassandra directly instead of
+        building a cqlengine model per row first.  Models are still
+        built for the writes, for polymorphic models and when
+        ``serialize_model`` is overridden.
+    :param ripozo_cassandra.slowlog.SlowQueryLog slow_query_log: An
+        optional log of the statements that take longer than its
+        threshold, with their bound key values, page size, row count
+        and coordinator and, for a sample of the requests, the
+        events of cassandra's query trace.
     """
     fail_create_if_exists = True
     allow_filtering = False
+    prepare_statements = True
+    bulk_batch_size = 50
+    bulk_concurrency = 16
+    paging_state_cursors = False
+    pagination_cursor_query_arg = 'cursor'
+    cursor_secret = None
+    project_reads = True
+    retrieve_cache = None
+    blind_writes = False
+    blind_writes_if_exists = False
+    stream_fetch_size = 1000
+    metrics_sink = NULL_SINK
+    scan_splits = 64
+    scan_concurrency = 8
+    read_consistency = None
+    write_consistency = None
+    read_execution_profile = None
+    write_execution_profile = None
+    request_timeout = None
+    columnar_session = None
+    query_tables = ()
+    fan_out_tables = ()
+    fan_out_batches = True
+    limiter = None
+    retry_policy = None
+    count_cache = None
+    count_sample = 8
+    serialize_rows = True
+    slow_query_log = None
+    _statement_cache = None
+    _serializers = None
+    _pagination_plans = None
+    _query_routes = None
+    _read_columns = None
 
     @classmethod
     def get_field_type(cls, name):
@@ -58,10 +228,48 @@ class CQLManager(BaseManager):
             return field_class(name)
         return fields.BaseField(name)
 
+    @classproperty
+    def statement_cache(cls):
+        """
+        The cache of prepared statements for this manager class.
+        Use ``statement_cache.stats()`` to get the hits and misses
+        for each statement.
+
+        :rtype: ripozo_cassandra.statements.StatementCache
+        """
+        if cls.__dict__.get('_statement_cache') is None:
+            cls._statement_cache = StatementCache()
+        return cls._statement_cache
+
     @property
     def queryset(self):
         return self.model.objects.all()
 
+    @property
+    def read_columns(self):
+        """
+        The columns selected by retrieve and retrieve_list: the
+        primary keys and the columns in ``fields`` in the order
+        they are defined on the model.  None if every column is
+        selected.  Computed once per model and fields.
+
+        :rtype: tuple
+        """
+        if not self.project_reads or not self.fields:
+            return None
+        cls = type(self)
+        if cls.__dict__.get('_read_columns') is None:
+            cls._read_columns = {}
+        key = (self.model, tuple(self.fields))
+        columns = cls._read_columns.get(key)
+        if columns is None:
+            names = set(self.fields) | set(self.model._primary_keys)
+            if self.model._is_polymorphic:
+                names.add(self.model._discriminator_column_name)
+            columns = cls._read_columns[key] = tuple(name for name in self.model._columns if name in names)
+        return columns
+
+    @instrumented
     def create(self, values, *args, **kwargs):
         """
         Creates an object using the specified values in the dict
@@ -74,12 +282,18 @@ class CQLManager(BaseManager):
         """
         _LOGGER.info('Creating model of type %s', self.model.__name__)
         values = self.valid_fields(values, self.create_fields)
-        if self.fail_create_if_exists:
+        if self.prepare_statements:
+            obj = self.model(**values)
+            self._insert_model(obj)
+        elif self.fail_create_if_exists:
             obj = self.model.if_not_exists().create(**values)
+            self._fan_out(self._fan_out_inserts(obj))
         else:
-            obj = self.model.create(**values)
-        return self.serialize_model(obj)
+            obj = self._retry(functools.partial(self.model.create, **values))
+            self._fan_out(self._fan_out_inserts(obj))
+        return self._created_model(obj)
 
+    @instrumented
     def retrieve(self, lookup_keys, *args, **kwargs):
         """
         Retrieves an existing object using the lookupkeys
@@ -91,9 +305,36 @@ class CQLManager(BaseManager):
         :rtype: dict
         """
         _LOGGER.info('Retrieving model of type %s', self.model.__name__)
-        obj = self._get_model(lookup_keys)
-        return self.serialize_model(obj)
+        cached = self._get_cached(lookup_keys)
+        if cached is not None:
+            return cached
+        if self.prepare_statements:
+            rows = list(self._execute(self._select_statement(lookup_keys, columns=self.read_columns)))
+            return self._cache_row(self._one_row(rows, lookup_keys))
+        obj = self._get_model(lookup_keys, columns=self.read_columns)
+        return self._cache_model(obj)
+
+    @instrumented
+    def retrieve_many(self, lookup_keys_list, *args, **kwargs):
+        """
+        Retrieves the models for all of the lookup_keys at once.
+        Full primary keys that only differ in the last clustering key
+        are fetched with one ``IN`` query per ``bulk_batch_size`` keys.
+        Every other lookup gets its own prepared statement.  The
+        statements are executed concurrently, at most
+        ``bulk_concurrency`` at a time.
+
+        :param list lookup_keys_list: A list of lookup_keys dictionaries
+        :return: The serialized models in the same order as the
+            lookup_keys with None wherever no model was found
+        :rtype: list
+        """
+        _LOGGER.info('Retrieving %s models of type %s', len(lookup_keys_list), self.model.__name__)
+        results, plan = self._retrieve_many_plan(lookup_keys_list)
+        outcomes = self._execute_concurrent([statement for statement, _ in plan])
+        return self._retrieve_many_results(lookup_keys_list, results, plan, outcomes)
 
+    @instrumented
     def retrieve_list(self, filters, *args, **kwargs):
         """
         Retrieves a list of all models that match the specified filters
@@ -107,51 +348,817 @@ class CQLManager(BaseManager):
         logger = logging.getLogger(__name__)
         logger.info('Retrieving list of models of type %s with '
                     'filters: %s', str(self.model), filters)
-        obj_list = []
-        models = self.queryset
-        if self.allow_filtering:
-            logger.debug('Allowing filtering on list retrieval')
-            models = models.allow_filtering()
+        if self.paging_state_cursors:
+            statement, params, paging_state, pagination_count, filters = self._paged_list_statement(filters)
+            result = self._execute(statement, params, paging_state=paging_state)
+            return self._paged_list_response(result, statement, params, pagination_count, filters)
+        queryset, pagination_count, filters = self._list_queryset(filters)
+        statement, params = self._queryset_statement(queryset)
+        rows = list(self._execute(statement, params))
+        return self._list_response(rows, pagination_count, filters)
+
+    @instrumented
+    def retrieve_columns(self, filters, *args, **kwargs):
+        """
+        Retrieves the same page of models as ``retrieve_list`` but as
+        one column of values per field instead of a dictionary per
+        model.  No models are built and the values are not made json
+        safe.  The columns are numpy arrays if the ``columnar_session``
+        uses the driver's NumpyProtocolHandler and lists otherwise.
+
+        :param dict filters: The named parameters to filter the models on
+        :return: tuple 0 index = a dictionary of the columns keyed by field
+            1 index = the pagination dict
+        :rtype: tuple
+        """
+        _LOGGER.info('Retrieving columns of models of type %s with '
+                     'filters: %s', str(self.model), filters)
+        columns = self.model._columns
+        names = [(name, columns[name].db_field_name) for name in self.fields if name in columns]
+        if self.paging_state_cursors:
+            statement, params, paging_state, pagination_count, filters = self._paged_list_statement(filters)
+            result, values = self._columnar_page(statement, params, paging_state=paging_state,
+                                                 model=self._query_model(filters))
+            return (dict((name, values[db_name]) for name, db_name in names),
+                    self._paged_list_meta(result, statement, params, pagination_count, filters))
+        queryset, pagination_count, filters = self._list_queryset(filters)
+        statement, params = self._queryset_statement(queryset)
+        _, values = self._columnar_page(statement, params, all_pages=True, model=queryset.model)
+        last_model = None
+        if column_length(values) > pagination_count:
+            last_model = queryset.model._construct_instance(dict((db_name, column[pagination_count])
+                                                             for db_name, column in six.iteritems(values)))
+            values = dict((db_name, column[:pagination_count]) for db_name, column in six.iteritems(values))
+        return (dict((name, values[db_name]) for name, db_name in names),
+                self._list_meta(last_model, pagination_count, filters))
+
+    def _columnar_page(self, statement, params, paging_state=None, all_pages=False, model=None):
+        """
+        Executes the select and builds a column per selected column.
+        A ``columnar_session`` gets the read consistency and
+        request_timeout but not the read_execution_profile since
+        the NumpyProtocolHandler needs the tuple_factory.
+
+        :param cassandra.query.SimpleStatement statement:
+        :param dict params:
+        :param bytes paging_state:
+        :param bool all_pages: Whether to read every page or only the first
+        :param type model: The model of the table the statement
+            selects from.  Defaults to the manager's model
+        :return: The ResultSet and the columns keyed by db field name
+        :rtype: tuple
+        """
+        model = model or self.model
+        select = self._query_columns(model) or tuple(model._columns)
+        db_names = [model._columns[name].db_field_name for name in select]
+        if self.columnar_session is None:
+            result = self._execute(statement, params, paging_state=paging_state)
+            rows = list(result) if all_pages else result.current_rows
+            with measure(self.metrics_sink, self.model, 'decode'):
+                return result, rows_to_columns(rows, db_names)
+        self._set_execution_options(statement)
+        kwargs = self._execution_kwargs()
+        kwargs.pop('execution_profile', None)
+        with permit(self.limiter):
+            with measure(self.metrics_sink, self.model, 'query'):
+                result = self._retry(functools.partial(self.columnar_session.execute, statement, params,
+                                                       paging_state=paging_state, **kwargs))
+                pages = list(result) if all_pages else result.current_rows
+        with measure(self.metrics_sink, self.model, 'decode'):
+            return result, pages_to_columns(pages, db_names)
+
+    def iter_list(self, filters, *args, **kwargs):
+        """
+        Lazily yields every model that matches the filters.
+        Rows are fetched ``stream_fetch_size`` at a time as the
+        generator is consumed so the memory used does not depend
+        on the size of the result.  Every page is a separate
+        request resumed from the paging_state of the previous
+        one.  The pagination arguments are ignored.
+
+        :param dict filters: The named parameters to filter the models on
+        :return: A generator of the models as dictionary objects
+        :rtype: generator
+        """
+        _LOGGER.info('Streaming models of type %s with filters: %s', str(self.model), filters)
+        queryset = self._filtered_queryset(self._without_pagination(filters)).limit(None)
+        statement, params = self._queryset_statement(queryset)
+        statement.fetch_size = self.stream_fetch_size
+        sink = self.metrics_sink
+        state = start_operation('iter_list') if sink.enabled else None
+        try:
+            result = self._execute(statement, params)
+        except Exception:
+            if state is not None:
+                finish_operation(sink, 'iter_list', self.model.__name__, state, failed=True)
+            raise
+        if state is not None:
+            finish_operation(sink, 'iter_list', self.model.__name__, state)
+        serialize = self._row_serializer()
+        while True:
+            for row in result.current_rows:
+                yield serialize(row)
+            if not result.paging_state:
+                return
+            # Each page is requested explicitly so that it goes through
+            # the limiter, the retry_policy and the slow_query_log
+            result = self._execute(statement, params, paging_state=result.paging_state)
+
+    def scan(self, ranges=None):
+        """
+        Yields every model in the table.  The token ring is split
+        into ``scan_splits`` ranges that are read concurrently,
+        ``scan_concurrency`` at a time, so the models are yielded
+        in no particular order.  Use ``scan_pages`` to be able
+        to resume an interrupted scan.
+
+        :param list ranges: The TokenRanges to read.  Defaults
+            to the whole ring.
+        :return: A generator of the models as dictionary objects
+        :rtype: generator
+        """
+        for page in self.scan_pages(ranges=ranges):
+            for obj in page.models:
+                yield obj
+
+    def scan_pages(self, ranges=None):
+        """
+        Reads every model in the table a page of ``stream_fetch_size``
+        rows at a time from ``scan_concurrency`` token ranges at once.
+        Each page holds the range to continue from.  A scan is resumed
+        by passing the ``resume`` of the last page of every unfinished
+        range along with the ranges that were never started.
+
+        :param list ranges: The TokenRanges to read.  Defaults
+            to the whole ring split into ``scan_splits`` ranges.
+        :return: A generator of ScanPages
+        :rtype: generator
+        """
+        _LOGGER.info('Scanning models of type %s', self.model.__name__)
+        if ranges is None:
+            ranges = split_ring(self.scan_splits)
+        select = self.read_columns or tuple(self.model._columns)
+        prepared = self._prepare('scan', select_cql(self.model, select, (), token_range=True), select)
+        return scan_pages(functools.partial(self._scan_page, prepared), ranges, self.scan_concurrency)
+
+    def _scan_page(self, prepared, token_range):
+        """
+        Reads the next page of the token range
+
+        :param cassandra.query.PreparedStatement prepared:
+        :param ripozo_cassandra.scan.TokenRange token_range:
+        :return: The serialized models and the TokenRange to
+            continue from or None if the range is finished
+        :rtype: tuple
+        """
+        statement = prepared.bind([token_range.start, token_range.end])
+        statement.fetch_size = self.stream_fetch_size
+        result = self._execute(statement, paging_state=token_range.paging_state)
+        serialize = self._row_serializer()
+        models = [serialize(row) for row in result.current_rows]
+        if not result.has_more_pages:
+            return models, None
+        return models, token_range._replace(paging_state=result.paging_state)
+
+    @instrumented
+    def count(self, filters, approximate=False, *args, **kwargs):
+        """
+        Counts the models that match the filters.  See ``aggregate``.
+
+        :param dict filters: The named parameters to filter the models on
+        :param bool approximate: Whether an estimate is good enough
+        :return: The number of models
+        :rtype: int
+        """
+        _LOGGER.info('Counting models of type %s with filters: %s', self.model.__name__, filters)
+        return self._aggregate(filters, (('count', None),), approximate)['count']
+
+    @instrumented
+    def aggregate(self, filters, column, functions=('min', 'max', 'sum'), approximate=False, *args, **kwargs):
+        """
+        Aggregates a column of the models that match the filters.
+        Filters that restrict the partition key, of the model or of
+        one of its ``query_tables``, are served with a single query.
+        Otherwise the token ring is split into ``scan_splits`` ranges
+        that are aggregated concurrently, ``scan_concurrency`` at a
+        time, and combined.  The pagination arguments are ignored.
+
+        An approximate aggregate only reads ``count_sample`` of the
+        ranges and scales the count and sum to the whole ring.  It is
+        cached in the ``count_cache`` if there is one.
+
+        :param dict filters: The named parameters to filter the models on
+        :param unicode column: The name of the column to aggregate
+        :param tuple functions: The aggregates, any of "min", "max" and "sum"
+        :param bool approximate: Whether an estimate is good enough
+        :return: The aggregates and the "count" of the models
+            keyed by function
+        :rtype: dict
+        """
+        _LOGGER.info('Aggregating %s of models of type %s with filters: %s',
+                     column, self.model.__name__, filters)
+        aggregates = (('count', None),) + tuple((function, column) for function in functions)
+        values = self._aggregate(filters, aggregates, approximate)
+        to_python = self.model._columns[column].to_python
+        result = dict((function, to_python(values[aggregate_alias(function, column)]))
+                      for function in functions)
+        result['count'] = values['count']
+        return result
+
+    def _aggregate(self, filters, aggregates, approximate=False):
+        """
+        :param dict filters:
+        :param tuple aggregates: (function, column name) tuples
+        :param bool approximate:
+        :return: The aggregates keyed by their aggregate_alias
+        :rtype: dict
+        """
+        filters = self._without_pagination(filters)
+        cache_key = None
+        if approximate and self.count_cache is not None:
+            cache_key = make_key(self.model.column_family_name(),
+                                 ('aggregate', aggregates, tuple(sorted(six.iteritems(filters)))))
+            cached = self.count_cache.get(cache_key)
+            if cached is not None:
+                return dict(cached)
+        model = self._query_model(filters, ordered=False)
+        where = tuple(sorted(filters))
+        columns = model._columns
+        values = [columns[name].to_database(filters[name]) for name in where]
+        if all(name in filters for name in key_layout(model).partition_keys):
+            cql = aggregate_cql(model, aggregates, where, allow_filtering=self.allow_filtering)
+            prepared = self._prepare('aggregate', cql, (model.column_family_name(),), aggregates, where)
+            rows = list(self._execute(prepared.bind(values)))
+            scale = 1
+        else:
+            ranges = split_ring(self.scan_splits)
+            sampled = sample_ranges(ranges, self.count_sample) if approximate else ranges
+            cql = aggregate_cql(model, aggregates, where, token_range=True,
+                                allow_filtering=self.allow_filtering)
+            prepared = self._prepare('aggregate_range', cql, (model.column_family_name(),), aggregates, where)
+            statements = [prepared.bind(values + [token_range.start, token_range.end])
+                          for token_range in sampled]
+            rows = []
+            for success, result in self._execute_concurrent(statements, concurrency=self.scan_concurrency):
+                if not success:
+                    raise result
+                rows.extend(result)
+            scale = len(ranges) / len(sampled)
+        result = {}
+        for function, name in aggregates:
+            alias = aggregate_alias(function, name)
+            result[alias] = combine_aggregates(function, [row[alias] for row in rows], scale=scale)
+        if cache_key is not None:
+            self.count_cache.set(cache_key, dict(result))
+        return result
+
+    def _without_pagination(self, filters):
+        filters = filters.copy()
+        for arg in (self.pagination_count_query_arg, self.pagination_pk_query_arg,
+                    self.pagination_cursor_query_arg):
+            filters.pop(arg, None)
+        return filters
+
+    @instrumented
+    def bulk_create(self, values_list):
+        """
+        Creates a model for each of the values dictionaries.
+        The inserts are grouped by partition into unlogged
+        batches that are executed concurrently.  If
+        ``fail_create_if_exists`` is True and a batch is rejected
+        because one of its rows exists, its inserts are retried
+        individually so that only the existing rows fail.
+
+        :param list values_list: A list of dictionaries with the
+            attribute names as keys and attribute values as values
+        :return: A BulkResult for each item in the same order as
+            the values_list.  The value is the serialized model.
+        :rtype: list
+        """
+        _LOGGER.info('Bulk creating %s models of type %s', len(values_list), self.model.__name__)
+        results = [None] * len(values_list)
+        entries = []
+        copies = []
+        for index, values in enumerate(values_list):
+            values = self.valid_fields(values, self.create_fields)
+            try:
+                obj = self.model(**values)
+                entries.append((index, obj, self._insert_statement(obj)))
+            except ValidationError as exc:
+                results[index] = BulkResult(None, exc)
+                continue
+            copies.append((index, self._fan_out_inserts(obj)))
+
+        retries = []
+        for batch, (success, result) in self._execute_batches(entries):
+            if success and self.fail_create_if_exists:
+                try:
+                    check_applied(result)
+                except LWTException as exc:
+                    if len(batch) > 1:
+                        retries.extend(batch)
+                        continue
+                    success, result = False, exc
+            self._set_bulk_results(results, batch, success, result, created=True)
+        if not retries:
+            self._fan_out_bulk(results, copies)
+            return results
+        statements = [statement for _, _, statement in retries]
+        for entry, (success, result) in zip(retries, self._execute_concurrent(statements, write=True)):
+            if success:
+                try:
+                    check_applied(result)
+                except LWTException as exc:
+                    success, result = False, exc
+            self._set_bulk_results(results, [entry], success, result, created=True)
+        self._fan_out_bulk(results, copies)
+        return results
+
+    @instrumented
+    def bulk_update(self, updates_list):
+        """
+        Updates the models specified by the lookup_keys
+        with their updates.  The models are read concurrently
+        and the changed columns are written in unlogged batches
+        grouped by partition.
+
+        :param list updates_list: A list of (lookup_keys, updates) tuples
+        :return: A BulkResult for each item in the same order as
+            the updates_list.  The value is the serialized model.
+        :rtype: list
+        """
+        _LOGGER.info('Bulk updating %s models of type %s', len(updates_list), self.model.__name__)
+        results = [None] * len(updates_list)
+        entries = []
+        copies = []
+        lookup_keys_list = [lookup_keys for lookup_keys, _ in updates_list]
+        for index, obj in self._bulk_get_models(lookup_keys_list, results):
+            updates = self.valid_fields(updates_list[index][1], self.update_fields)
+            try:
+                for key, value in six.iteritems(updates):
+                    setattr(obj, key, value)
+                if not self._can_prepare_update(obj):
+                    self._save_model(obj)
+                    self._set_bulk_results(results, [(index, obj, None)], True, None)
+                    continue
+                statement = self._update_statement(obj)
+            except ValidationError as exc:
+                results[index] = BulkResult(None, exc)
+                continue
+            if statement is None:
+                self._set_bulk_results(results, [(index, obj, None)], True, None)
+            else:
+                entries.append((index, obj, statement))
+                copies.append((index, self._fan_out_updates(obj)))
+        for batch, (success, result) in self._execute_batches(entries):
+            self._set_bulk_results(results, batch, success, result)
+        self._fan_out_bulk(results, copies)
+        return results
+
+    @instrumented
+    def bulk_delete(self, lookup_keys_list):
+        """
+        Deletes the models specified by each of the lookup_keys.
+        The models are read concurrently to ensure that they
+        exist and then deleted in unlogged batches grouped
+        by partition.
+
+        :param list lookup_keys_list: A list of lookup_keys dictionaries
+        :return: A BulkResult for each item in the same order as
+            the lookup_keys_list.  The value is an empty dictionary.
+        :rtype: list
+        """
+        _LOGGER.info('Bulk deleting %s models of type %s', len(lookup_keys_list), self.model.__name__)
+        results = [None] * len(lookup_keys_list)
+        entries = [(index, obj, self._delete_statement(obj))
+                   for index, obj in self._bulk_get_models(lookup_keys_list, results,
+                                                           columns=self._key_columns())]
+        for batch, (success, result) in self._execute_batches(entries):
+            for index, obj, _ in batch:
+                if success:
+                    self._evict_model(obj)
+                    results[index] = BulkResult({}, None)
+                else:
+                    results[index] = BulkResult(None, result)
+        self._fan_out_bulk(results, [(index, self._fan_out_deletes(obj)) for index, obj, _ in entries])
+        return results
+
+    @instrumented
+    def increment(self, lookup_keys, deltas, *args, **kwargs):
+        """
+        Adds the deltas to the counter columns of the model with a
+        single ``UPDATE ... SET "c" = "c" + ?``.  The model is only
+        read if the lookup_keys are not the primary key.
+
+        :param dict lookup_keys:
+        :param dict deltas: The amounts to add keyed by counter column
+        :return: The serialized primary keys of the model
+        :rtype: dict
+        """
+        _LOGGER.info('Incrementing counters of model of type %s', self.model.__name__)
+        return self._increment(lookup_keys, self.valid_fields(deltas, self.update_fields))
+
+    @instrumented
+    def decrement(self, lookup_keys, deltas, *args, **kwargs):
+        """
+        Subtracts the deltas from the counter columns of the model.
+        See ``increment``.
+
+        :param dict lookup_keys:
+        :param dict deltas: The amounts to subtract keyed by counter column
+        :return: The serialized primary keys of the model
+        :rtype: dict
+        """
+        _LOGGER.info('Decrementing counters of model of type %s', self.model.__name__)
+        return self._increment(lookup_keys, self.valid_fields(deltas, self.update_fields), sign=-1)
+
+    @instrumented
+    def bulk_increment(self, increments_list):
+        """
+        Adds the deltas to the counter columns of each model.  The
+        increments are sent in counter batches grouped by partition
+        and executed concurrently.  Models whose lookup_keys are not
+        the primary key are read concurrently first.
+
+        :param list increments_list: A list of (lookup_keys, deltas) tuples
+        :return: A BulkResult for each item in the same order as the
+            increments_list.  The value is the serialized primary keys.
+        :rtype: list
+        """
+        _LOGGER.info('Bulk incrementing %s models of type %s', len(increments_list), self.model.__name__)
+        results = [None] * len(increments_list)
+        targets = []
+        lookups = []
+        for index, (lookup_keys, _) in enumerate(increments_list):
+            if not self._is_primary_key(lookup_keys):
+                lookups.append(index)
+                continue
+            try:
+                targets.append((index, self._primary_key_model(lookup_keys)))
+            except ValidationError as exc:
+                results[index] = BulkResult(None, exc)
+        lookup_results = [None] * len(lookups)
+        for position, obj in self._bulk_get_models([increments_list[index][0] for index in lookups],
+                                                   lookup_results, columns=tuple(self.model._primary_keys)):
+            targets.append((lookups[position], obj))
+        for position, result in enumerate(lookup_results):
+            if result is not None:
+                results[lookups[position]] = result
+        entries = []
+        for index, obj in targets:
+            try:
+                statement = self._increment_statement(obj, self.valid_fields(increments_list[index][1],
+                                                                             self.update_fields))
+            except ValidationError as exc:
+                results[index] = BulkResult(None, exc)
+                continue
+            if statement is None:
+                results[index] = BulkResult(self._counter_response(obj), None)
+            else:
+                entries.append((index, obj, statement))
+        for batch, (success, result) in self._execute_batches(entries, batch_type=BatchType.COUNTER):
+            for index, obj, _ in batch:
+                results[index] = BulkResult(self._counter_response(obj) if success else None,
+                                            None if success else result)
+        return results
+
+    def _bulk_get_models(self, lookup_keys_list, results, columns=None):
+        """
+        Concurrently gets the models for the lookup keys.
+        Failures are recorded in the results.
+
+        :param list lookup_keys_list:
+        :param list results: The list of BulkResults to record errors in
+        :param tuple columns: The columns to select.  Defaults to all of them
+        :return: A list of (index, model) tuples for the models that were found
+        :rtype: list
+        """
+        indexes = []
+        statements = []
+        for index, lookup_keys in enumerate(lookup_keys_list):
+            try:
+                statements.append(self._select_statement(lookup_keys, columns=columns))
+                indexes.append(index)
+            except ValidationError as exc:
+                results[index] = BulkResult(None, exc)
+        found = []
+        for index, (success, result) in zip(indexes, self._execute_concurrent(statements)):
+            if not success:
+                results[index] = BulkResult(None, result)
+                continue
+            try:
+                found.append((index, self._one_model(list(result), lookup_keys_list[index])))
+            except (NotFoundException, self.model.MultipleObjectsReturned) as exc:
+                results[index] = BulkResult(None, exc)
+        return found
+
+    def _retrieve_many_plan(self, lookup_keys_list):
+        """
+        Serves what it can from the retrieve_cache and builds
+        the statements for the rest of the lookup_keys.
+
+        :param list lookup_keys_list:
+        :return: The list of results with the cached models filled
+            in and a list of (statement, targets) tuples.  targets is a
+            list of (index, primary key values) tuples.  The primary
+            key values are None if the lookup_keys are not the full
+            primary key.
+        :rtype: tuple
+        """
+        results = [self._get_cached(lookup_keys) for lookup_keys in lookup_keys_list]
+        columns = self.read_columns
+        primary_keys = tuple(self.model._primary_keys)
+        plan = []
+        entries = []
+        for index, lookup_keys in enumerate(lookup_keys_list):
+            if results[index] is not None:
+                continue
+            if self.model._clustering_keys and self._is_primary_key(lookup_keys):
+                entries.append((index, tuple(self._bind_values(primary_keys, lookup_keys))))
+            else:
+                plan.append((self._select_statement(lookup_keys, columns=columns), [(index, None)]))
+        for batch in partition_batches(entries, lambda entry: entry[1][:-1], self.bulk_batch_size):
+            if len(batch) == 1:
+                index = batch[0][0]
+                statement = self._select_statement(lookup_keys_list[index], columns=columns)
+            else:
+                where, in_column = primary_keys[:-1], primary_keys[-1]
+                select = columns or tuple(self.model._columns)
+                cql = select_cql(self.model, select, where, in_column=in_column)
+                prepared = self._prepare('retrieve_many', cql, select, where)
+                statement = prepared.bind(list(batch[0][1][:-1]) + [[values[-1] for _, values in batch]])
+            plan.append((statement, batch))
+        return results, plan
+
+    def _retrieve_many_results(self, lookup_keys_list, results, plan, outcomes):
+        """
+        Fills in the results of retrieve_many from the
+        results of executing the statements in the plan.
+
+        :return: The results
+        :rtype: list
+        """
+        primary_keys = tuple(self.model._primary_keys)
+        for (_, targets), (success, result) in zip(plan, outcomes):
+            if not success:
+                raise result
+            if targets[0][1] is None:
+                index = targets[0][0]
+                try:
+                    row = self._one_row(list(result), lookup_keys_list[index])
+                except NotFoundException:
+                    continue
+                results[index] = self._cache_row(row)
+                continue
+            found = dict((tuple(self._bind_values(primary_keys, self._row_values(row, primary_keys))), row)
+                         for row in result)
+            for index, values in targets:
+                if values in found:
+                    results[index] = self._cache_row(found[values])
+        return results
+
+    def _set_bulk_results(self, results, batch, success, result, created=False):
+        for index, obj, _ in batch:
+            if success:
+                obj._set_persisted()
+                serialized = self._created_model(obj) if created else self._cache_model(obj)
+                results[index] = BulkResult(serialized, None)
+            else:
+                results[index] = BulkResult(None, result)
+
+    def _fan_out_bulk(self, results, copies):
+        """
+        Concurrently writes the copies of the models whose
+        writes succeeded.  If a copy fails to be written
+        the model's result is replaced with the error.
 
+        :param list results: The list of BulkResults
+        :param list copies: A list of (index, statements) tuples
+        """
+        pending = []
+        for index, statements in copies:
+            if not statements or results[index].error is not None:
+                continue
+            if self.fan_out_batches:
+                statements = [batch_statement(statements, batch_type=BatchType.LOGGED)]
+            pending.extend((index, statement) for statement in statements)
+        if not pending:
+            return
+        outcomes = self._execute_concurrent([statement for _, statement in pending], write=True)
+        for (index, _), (success, result) in zip(pending, outcomes):
+            if not success and results[index].error is None:
+                results[index] = BulkResult(None, result)
+
+    def _execute_batches(self, entries, batch_type=BatchType.UNLOGGED):
+        """
+        Groups the statements by the partition of their model
+        into batches and executes them concurrently.
+
+        :param list entries: A list of (index, model, statement) tuples
+        :param cassandra.query.BatchType batch_type:
+        :return: A list of (batch entries, (success, result or exception))
+        :rtype: list
+        """
+        partition_keys = tuple(self.model._partition_keys)
+        batches = partition_batches(entries,
+                                    lambda entry: tuple(self._bind_model_values(partition_keys,
+                                                                                entry[1])),
+                                    self.bulk_batch_size)
+        statements = [batch_statement([statement for _, _, statement in batch], batch_type=batch_type)
+                      for batch in batches]
+        return list(zip(batches, self._execute_concurrent(statements, write=True)))
+
+    def _execute_concurrent(self, statements, write=False, concurrency=None):
+        """
+        Executes the statements with at most ``concurrency``,
+        by default ``bulk_concurrency``, in flight at once.  With a
+        limiter every statement takes its own permit.  With a
+        retry_policy the idempotent statements that failed are
+        retried together.
+
+        :param list statements:
+        :param bool write: Whether the statements are writes
+        :param int concurrency:
+        :return: A list of (success, result or exception) tuples
+            in the same order as the statements
+        :rtype: list
+        """
+        for statement in statements:
+            self._set_execution_options(statement, write=write)
+        execute = functools.partial(self._execute_concurrent_once, write=write,
+                                    concurrency=concurrency or self.bulk_concurrency)
+        if self.retry_policy is not None:
+            return self.retry_policy.call_many(execute, statements)
+        return execute(statements)
+
+    def _execute_concurrent_once(self, statements, write=False, concurrency=None):
+        kwargs = self._execution_kwargs(write=write, timeout=False)
+        with measure(self.metrics_sink, self.model, 'query'):
+            if self.limiter is not None:
+                return execute_limited(self._get_session(), statements, self.limiter, concurrency, **kwargs)
+            pairs = [(statement, None) for statement in statements]
+            return execute_concurrent(self._get_session(), pairs, concurrency=concurrency,
+                                      raise_on_first_error=False, **kwargs)
+
+    def _list_queryset(self, filters):
+        """
+        Builds the queryset for a list retrieval.
+
+        :param dict filters: The filters including the pagination arguments
+        :return: A tuple of the queryset limited to one more model
+            than the page size, the pagination count, and the filters
+            without the pagination arguments
+        :rtype: tuple
+        """
         pagination_count, filters = self.get_pagination_count(filters)
         last_pagination_pk, filters = self.get_pagination_pks(filters)
         if not last_pagination_pk:
             last_pagination_pk = []
 
+        models = self._filtered_queryset(filters)
+        models = self.pagination_filtration(models,
+                                            last_pagination_pk=last_pagination_pk,
+                                            filters=filters)
+        models = models.limit(pagination_count + 1)
+        return models, pagination_count, filters
+
+    def _filtered_queryset(self, filters):
+        """
+        :param dict filters: The filters without any pagination arguments
+        :return: The queryset with the filters and ordering applied
+        :rtype: cassandra.cqlengine.query.ModelQuerySet
+        """
+        model = self._query_model(filters)
+        if model is self.model:
+            models = self.queryset
+        else:
+            _LOGGER.debug('Routing list retrieval to %s', model.column_family_name())
+            models = model.objects.all()
+        columns = self._query_columns(model)
+        if columns is not None:
+            models = models.only(columns)
+        if self.allow_filtering:
+            _LOGGER.debug('Allowing filtering on list retrieval')
+            models = models.allow_filtering()
         if filters is not None:
             for key, value in six.iteritems(filters):
-                models = models.filter(getattr(self.model, key) == value)
+                models = models.filter(getattr(model, key) == value)
         if self.order_by is not None:
             models = models.order_by(self.order_by)
+        return models
 
-        models = self.pagination_filtration(models,
-                                            last_pagination_pk=last_pagination_pk,
-                                            filters=filters)
-        models = models.limit(pagination_count + 1)
+    def _paged_list_statement(self, filters):
+        """
+        Builds the statement for a list retrieval that
+        pages with the driver's paging_state.
+
+        :param dict filters: The filters including the pagination arguments
+        :return: A tuple of the statement, its parameters, the
+            paging_state decoded from the cursor (or None), the
+            pagination count and the filters without the pagination arguments
+        :rtype: tuple
+        :raises: ValidationException if the pagination count is not
+            positive since a fetch_size below one disables paging
+        """
+        pagination_count, filters = self.get_pagination_count(filters)
+        if pagination_count < 1:
+            raise ValidationException('The {0} must be at least 1'.format(self.pagination_count_query_arg),
+                                      status_code=400)
+        cursor = filters.pop(self.pagination_cursor_query_arg, None)
+        filters.pop(self.pagination_pk_query_arg, None)
+        queryset = self._filtered_queryset(filters).limit(None)
+        statement, params = self._queryset_statement(queryset)
+        statement.fetch_size = pagination_count
+        paging_state = None
+        if cursor:
+            paging_state = decode_cursor(cursor, self.cursor_secret or PROCESS_SECRET,
+                                         self._cursor_context(statement, params))
+        return statement, params, paging_state, pagination_count, filters
+
+    def _paged_list_response(self, result, statement, params, pagination_count, filters):
+        """
+        Serializes the current page of the result and builds
+        the pagination meta data with the cursor for the next page.
+
+        :param cassandra.cluster.ResultSet result:
+        :param cassandra.query.SimpleStatement statement:
+        :param dict params:
+        :param int pagination_count:
+        :param dict filters:
+        :return: The list of serialized models and the pagination dict
+        :rtype: tuple
+        """
+        obj_list = self._serialize_rows(result.current_rows)
+        return obj_list, self._paged_list_meta(result, statement, params, pagination_count, filters)
+
+    def _paged_list_meta(self, result, statement, params, pagination_count, filters):
+        """
+        :return: The pagination dict with the cursor for the next page
+        :rtype: dict
+        """
+        cursor = query_args = None
+        if result.paging_state:
+            cursor = encode_cursor(result.paging_state, self.cursor_secret or PROCESS_SECRET,
+                                   self._cursor_context(statement, params))
+            query_args = '{0}={1}'.format(self.pagination_count_query_arg, pagination_count)
+            for filter_name, filter_value in six.iteritems(filters):
+                query_args = '{0}&{1}={2}'.format(query_args, filter_name, filter_value)
+            query_args = '{0}&{1}={2}'.format(query_args, self.pagination_cursor_query_arg, cursor)
+        return {self.pagination_cursor_query_arg: cursor,
+                self.pagination_count_query_arg: pagination_count,
+                self.pagination_next: query_args}
+
+    @staticmethod
+    def _cursor_context(statement, params):
+        return '{0}|{1}'.format(statement.query_string, sorted(six.iteritems(params)))
+
+    def _list_response(self, rows, pagination_count, filters):
+        """
+        Serializes the rows selected by the ``_list_queryset``
+        and builds the pagination meta data.
 
+        :param list rows: The rows, including the extra one
+            used for finding the next batch
+        :param int pagination_count:
+        :param dict filters:
+        :return: The list of serialized models and the pagination dict
+        :rtype: tuple
+        """
         last_model = None
-        # Handle the extra model used for finding the next batch
-        if len(models) > pagination_count:
-            last_model = models[-1]
-            models = models[:pagination_count]
+        # Handle the extra row used for finding the next batch
+        if len(rows) > pagination_count:
+            last_model = self._query_model(filters)._construct_instance(rows[pagination_count])
+            rows = rows[:pagination_count]
+        obj_list = self._serialize_rows(rows)
+        return obj_list, self._list_meta(last_model, pagination_count, filters)
 
-        for obj in models:
-            obj_list.append(self.serialize_model(obj))
+    def _list_meta(self, last_model, pagination_count, filters):
+        """
+        :param cqlengine.Model last_model: The first model of the
+            next page or None if this is the last page
+        :return: The pagination dict with the pagination keys of the next page
+        :rtype: dict
+        """
         if not pagination_count or not last_model:
-            return obj_list, {self.pagination_pk_query_arg: None,
-                              self.pagination_count_query_arg: pagination_count,
-                              self.pagination_next: None}
+            return {self.pagination_pk_query_arg: None,
+                    self.pagination_count_query_arg: pagination_count,
+                    self.pagination_next: None}
         else:
+            primary_keys = self._query_model(filters)._primary_keys
             query_args, pagination_keys = self.get_next_query_args(last_model,
                                                                    pagination_count,
-                                                                   filters=filters)
-            return obj_list, {self.pagination_pk_query_arg: pagination_keys,
-                              self.pagination_count_query_arg: pagination_count,
-                              self.pagination_next: query_args}
+                                                                   filters=filters,
+                                                                   primary_keys=primary_keys)
+            return {self.pagination_pk_query_arg: pagination_keys,
+                    self.pagination_count_query_arg: pagination_count,
+                    self.pagination_next: query_args}
 
+    @instrumented
     def update(self, lookup_keys, updates, *args, **kwargs):
         """
-        Updates the model specified by the lookup_key with the specified updates
+        Updates the model specified by the lookup_key with the specified updates.
+        The updates of a model with counter columns are deltas that are
+        added to the counters (see ``increment``).
 
         :param lookup_keys:
         :type lookup_keys: dict
@@ -161,13 +1168,21 @@ class CQLManager(BaseManager):
         :rtype: cqlengine.Model
         """
         _LOGGER.info('Updating model of type %s', self.model.__name__)
-        obj = self._get_model(lookup_keys)
         updates = self.valid_fields(updates, self.update_fields)
+        if self._is_counter_model():
+            return self._increment(lookup_keys, updates)
+        blind = self._blind_update_statement(lookup_keys, updates)
+        if blind is not None:
+            statement, obj = blind
+            self._check_exists(self._execute(statement, write=True), lookup_keys)
+            return self._blind_update_response(obj, lookup_keys, updates)
+        obj = self._get_model(lookup_keys)
         for key, value in six.iteritems(updates):
             setattr(obj, key, value)
-        obj.save()
-        return self.serialize_model(obj)
+        self._save_model(obj)
+        return self._cache_model(obj)
 
+    @instrumented
     def delete(self, lookup_keys, *args, **kwargs):
         """
         Deletes the model specified by the lookup_keys
@@ -176,18 +1191,35 @@ class CQLManager(BaseManager):
         :type lookup_keys: dict
         """
         _LOGGER.info('Deleting model of type %s', self.model.__name__)
-        obj = self._get_model(lookup_keys)
-        obj.delete()
+        blind = self._blind_delete_statement(lookup_keys)
+        if blind is not None:
+            statement, obj = blind
+            self._check_exists(self._execute(statement, write=True), lookup_keys)
+            self._evict_model(obj)
+            return {}
+        obj = self._get_model(lookup_keys, columns=self._key_columns())
+        if self.prepare_statements:
+            self._delete_model(obj)
+        else:
+            copies = self._fan_out_deletes(obj)
+            self._retry(obj.delete)
+            self._fan_out(copies)
+        self._evict_model(obj)
         return {}
 
-    def _get_model(self, lookup_keys):
+    def _get_model(self, lookup_keys, columns=None):
         """
         Gets the model specified by the lookupkeys
 
         :param lookup_keys: A dictionary of fields and values on the model to filter by
         :type lookup_keys: dict
+        :param tuple columns: The columns to select.  Defaults to all of them
         """
+        if self.prepare_statements:
+            return self._select_model(lookup_keys, columns=columns)
         queryset = self.queryset
+        if columns is not None:
+            queryset = queryset.only(columns)
         for key, value in six.iteritems(lookup_keys):
             queryset = queryset.filter(getattr(self.model, key) == value)
         try:
@@ -197,7 +1229,667 @@ class CQLManager(BaseManager):
             raise NotFoundException('The model {0} could not be found.  '
                                     'lookup_keys: {1}'.format(self.model.__name__, lookup_keys))
 
-    def get_next_query_args(self, last_model, pagination_count, filters=None):
+    def _blind_update_statement(self, lookup_keys, updates):
+        """
+        Builds the statement for an update that does not
+        read the model first.
+
+        :param dict lookup_keys:
+        :param dict updates: The valid updates
+        :return: A tuple of the bound statement and a model holding
+            the primary keys and the updated values, or None if
+            blind writes are disabled or the update can not be
+            written blindly
+        :rtype: tuple
+        """
+        if not self.blind_writes or not self._is_primary_key(lookup_keys) \
+                or self.model._is_polymorphic or self.fan_out_tables:
+            return None
+        columns = self.model._columns
+        changed = tuple(name for name in columns if name in updates)
+        if not changed or any(columns[name].primary_key or columns[name].db_type == 'counter'
+                              for name in changed):
+            return None
+        values = dict(lookup_keys)
+        values.update(updates)
+        obj = self.model(**dict((name, columns[name].validate(value))
+                                for name, value in six.iteritems(values)))
+        where = tuple(self.model._primary_keys)
+        if_exists = self.blind_writes_if_exists
+        prepared = self._prepare('blind_update', update_cql(self.model, changed, where,
+                                                            if_exists=if_exists),
+                                 changed, where, (if_exists,))
+        return prepared.bind(self._bind_model_values(changed + where, obj)), obj
+
+    def _blind_update_response(self, obj, lookup_keys, updates):
+        """
+        Serializes the primary keys and updated columns of a blind
+        update and invalidates the retrieve_cache entry since
+        the full model is not known.
+
+        :rtype: dict
+        """
+        self._evict_model(obj)
+        written = set(lookup_keys) | set(updates)
+        with measure(self.metrics_sink, self.model, 'serialize'):
+            return self._serialize_only(obj, [name for name in self.fields if name in written])
+
+    def _serialize_only(self, obj, fields_list):
+        """
+        Serializes exactly the fields in the fields_list.  Unlike
+        serialize_model an empty fields_list is not replaced by
+        ``fields`` since the model only holds the written values.
+
+        :param cqlengine.Model obj: An instance of the model
+        :param list fields_list:
+        :rtype: dict
+        """
+        return self._get_serializer(type(obj), fields_list)(obj)
+
+    def _blind_delete_statement(self, lookup_keys):
+        """
+        :return: A tuple of the bound delete statement and a model
+            holding the primary keys, or None if blind writes are
+            disabled or the lookup_keys are not the primary key or
+            the model has fan_out_tables
+        :rtype: tuple
+        """
+        if not self.blind_writes or not self._is_primary_key(lookup_keys) or self.fan_out_tables:
+            return None
+        obj = self._primary_key_model(lookup_keys)
+        where, where_values = self._primary_key_values(obj)
+        if_exists = self.blind_writes_if_exists
+        prepared = self._prepare('blind_delete', delete_cql(self.model, where, if_exists=if_exists),
+                                 where, (if_exists,))
+        return prepared.bind(where_values), obj
+
+    def _check_exists(self, result, lookup_keys):
+        """
+        Raises a NotFoundException if a blind write
+        was not applied because the row did not exist.
+        """
+        if not self.blind_writes_if_exists:
+            return
+        try:
+            check_applied(result)
+        except LWTException:
+            raise NotFoundException('The model {0} could not be found.  '
+                                    'lookup_keys: {1}'.format(self.model.__name__, lookup_keys))
+
+    def _is_counter_model(self):
+        """
+        :return: True if the model has counter columns.  Updates of
+            these models add the values to the counters.
+        :rtype: bool
+        """
+        return any(column.db_type == 'counter' for column in self.model._columns.values())
+
+    def _primary_key_model(self, lookup_keys):
+        """
+        :param dict lookup_keys: The primary key values
+        :return: An unsaved model holding the validated primary keys
+        :rtype: cqlengine.Model
+        """
+        columns = self.model._columns
+        return self.model(**dict((name, columns[name].validate(value))
+                                 for name, value in six.iteritems(lookup_keys)))
+
+    def _increment(self, lookup_keys, deltas, sign=1):
+        """
+        Adds the deltas to the counters of the model.  The primary
+        keys are read first if the lookup_keys are not the primary key.
+
+        :param dict lookup_keys:
+        :param dict deltas: The valid deltas
+        :param int sign: -1 to subtract the deltas
+        :return: The serialized primary keys
+        :rtype: dict
+        """
+        if self._is_primary_key(lookup_keys):
+            obj = self._primary_key_model(lookup_keys)
+        else:
+            obj = self._get_model(lookup_keys, columns=tuple(self.model._primary_keys))
+        statement = self._increment_statement(obj, deltas, sign=sign)
+        if statement is not None:
+            self._execute(statement, write=True)
+        return self._counter_response(obj)
+
+    def _increment_statement(self, obj, deltas, sign=1):
+        """
+        :param cqlengine.Model obj: A model holding the primary keys
+        :param dict deltas: The valid deltas
+        :param int sign: -1 to subtract the deltas
+        :return: The bound statement adding the deltas to the counter
+            columns or None if there are no counter columns in the deltas
+        :rtype: cassandra.query.BoundStatement
+        """
+        columns = self.model._columns
+        names = tuple(name for name in columns
+                      if name in deltas and columns[name].db_type == 'counter')
+        if not names:
+            return None
+        values = [sign * columns[name].to_database(columns[name].validate(deltas[name])) for name in names]
+        where, where_values = self._primary_key_values(obj)
+        prepared = self._prepare('increment', counter_cql(self.model, names, where), names, where)
+        return prepared.bind(values + where_values)
+
+    def _counter_response(self, obj):
+        """
+        Serializes the primary keys of a model whose counters were
+        changed and invalidates its retrieve_cache entry since the
+        new counts are not known.
+
+        :rtype: dict
+        """
+        self._evict_model(obj)
+        primary_keys = self.model._primary_keys
+        return self._serialize_only(obj, [name for name in self.fields if name in primary_keys])
+
+    def _is_primary_key(self, values):
+        """
+        :return: True if the keys of values are exactly
+            the model's primary keys
+        :rtype: bool
+        """
+        primary_keys = self.model._primary_keys
+        return len(values) == len(primary_keys) and all(name in values for name in primary_keys)
+
+    def _cache_key(self, values):
+        """
+        The entries are keyed by the table and the primary key
+        alone so that a write through any manager of the model
+        refreshes or invalidates the entry the others read.
+        The primary key is encoded with the CQL serialization of
+        its columns so that the key does not depend on the python
+        version or on how the values were passed.
+
+        :param dict values: The lookup keys
+        :return: The key of the retrieve_cache entry or None
+            if the values are not exactly the primary key
+        :rtype: unicode
+        """
+        if not self._is_primary_key(values):
+            return None
+        columns = self.model._columns
+        primary_keys = self.model._primary_keys
+        encoded = tuple(columns[name].cql_type.serialize(columns[name].to_database(values[name]),
+                                                         _KEY_PROTOCOL_VERSION)
+                        for name in primary_keys)
+        return make_key(self.model.column_family_name(), encoded)
+
+    def _get_cached(self, lookup_keys):
+        """
+        :return: The ``fields`` of the cached serialized model
+            or None if it is not cached or the entry, cached by
+            a manager with other fields, does not have all of them
+        :rtype: dict
+        """
+        if self.retrieve_cache is None:
+            return None
+        key = self._cache_key(lookup_keys)
+        if key is None:
+            return None
+        cached = self.retrieve_cache.get(key)
+        if cached is None:
+            return None
+        columns = self.model._columns
+        names = [name for name in self.fields if name in columns]
+        if not all(name in cached for name in names):
+            return None
+        return dict((name, cached[name]) for name in names)
+
+    def _cache_model(self, obj):
+        """
+        Serializes the model and refreshes its
+        retrieve_cache entry
+
+        :param cqlengine.Model obj:
+        :return: The serialized model
+        :rtype: dict
+        """
+        with measure(self.metrics_sink, self.model, 'serialize'):
+            serialized = self.serialize_model(obj)
+        if self.retrieve_cache is not None:
+            key = self._cache_key(dict((name, getattr(obj, name)) for name in self.model._primary_keys))
+            self.retrieve_cache.set(key, dict(serialized))
+        return serialized
+
+    def _created_model(self, obj):
+        """
+        Serializes a created model.  Its retrieve_cache entry is only
+        refreshed if ``fail_create_if_exists`` is True.  Otherwise the
+        insert may have updated an existing row whose columns that are
+        not set on the model kept their values, so the entry is evicted.
+
+        :param cqlengine.Model obj:
+        :return: The serialized model
+        :rtype: dict
+        """
+        if self.fail_create_if_exists:
+            return self._cache_model(obj)
+        self._evict_model(obj)
+        with measure(self.metrics_sink, self.model, 'serialize'):
+            return self.serialize_model(obj)
+
+    def _cache_row(self, row):
+        """
+        Serializes a row of the model's table and
+        refreshes its retrieve_cache entry
+
+        :param dict row:
+        :return: The serialized model
+        :rtype: dict
+        """
+        if not self._serializes_rows():
+            with measure(self.metrics_sink, self.model, 'decode'):
+                obj = self.model._construct_instance(row)
+            return self._cache_model(obj)
+        with measure(self.metrics_sink, self.model, 'serialize'):
+            serialized = self._row_serializer()(row)
+        if self.retrieve_cache is not None:
+            key = self._cache_key(self._row_values(row, self.model._primary_keys))
+            self.retrieve_cache.set(key, dict(serialized))
+        return serialized
+
+    def _row_values(self, row, names):
+        """
+        :param dict row: A row of the model's table
+        :param names: The names of the columns
+        :return: The python values of the columns keyed by name
+        :rtype: dict
+        """
+        columns = self.model._columns
+        return dict((name, columns[name].to_python(row[columns[name].db_field_name])) for name in names)
+
+    def _evict_model(self, obj):
+        if self.retrieve_cache is not None:
+            key = self._cache_key(dict((name, getattr(obj, name)) for name in self.model._primary_keys))
+            self.retrieve_cache.delete(key)
+
+    def _get_session(self):
+        return connection.get_session(self.model._get_connection())
+
+    def _prepare(self, operation, cql, *columns):
+        """
+        Gets the prepared statement for the operation on
+        the specified columns, preparing the cql on the first use.
+
+        :param unicode operation: The name of the operation (e.g. "retrieve")
+        :param unicode cql: The CQL to prepare if it has not been yet
+        :param tuple columns: The tuples of column names that
+            make up the shape of the statement
+        :rtype: cassandra.query.PreparedStatement
+        """
+        key = (self.model.column_family_name(), operation) + columns
+        return self.statement_cache.get(self._get_session(), key, cql)
+
+    def _execute(self, statement, parameters=None, paging_state=None, write=False):
+        """
+        Executes the statement on the model's session, holding
+        a permit of the limiter while it is in flight and retrying
+        it according to the retry_policy
+
+        :param cassandra.query.Statement statement:
+        :param parameters: The parameters if the statement is not bound
+        :param bytes paging_state: The paging_state to resume from
+        :param bool write: Whether the statement is a write
+        :return: The result set
+        :rtype: cassandra.cluster.ResultSet
+        """
+        self._set_execution_options(statement, write=write)
+        return self._retry(functools.partial(self._execute_once, statement, parameters, paging_state, write),
+                           statement.is_idempotent)
+
+    def _execute_once(self, statement, parameters, paging_state, write):
+        watched = watch(self.slow_query_log, self.model, statement, parameters)
+        with permit(self.limiter):
+            with watched:
+                kwargs = self._execution_kwargs(write=write, trace=watched.trace)
+                measurement = measure(self.metrics_sink, self.model, 'query')
+                result = self._get_session().execute(statement, parameters,
+                                                     paging_state=paging_state, **kwargs)
+        measurement.stop(result)
+        watched.stop(result)
+        return result
+
+    def _retry(self, function, idempotent=True):
+        """
+        Calls the function, retrying it according to
+        the retry_policy if the request is idempotent.
+
+        :param function function: Sends the request
+        :param bool idempotent:
+        :return: The return value of the function
+        """
+        if self.retry_policy is None:
+            return function()
+        return self.retry_policy.call(function, idempotent)
+
+    def _set_execution_options(self, statement, write=False):
+        """
+        Sets the read or write consistency on a statement that does
+        not have a consistency level yet.  Reads are marked idempotent
+        so that they can be executed speculatively and retried.
+
+        :param cassandra.query.Statement statement:
+        :param bool write:
+        """
+        consistency = self.write_consistency if write else self.read_consistency
+        if consistency is not None and statement.consistency_level is None:
+            statement.consistency_level = consistency
+        if not write:
+            statement.is_idempotent = True
+        if self.retry_policy is not None:
+            statement.retry_policy = self.retry_policy
+
+    def _execution_kwargs(self, write=False, timeout=True, trace=False):
+        """
+        :param bool write:
+        :param bool timeout: Whether to include the request_timeout
+        :param bool trace: Whether to enable query tracing
+        :return: The execution_profile, timeout and trace keyword
+            arguments for executing a read or write
+        :rtype: dict
+        """
+        kwargs = {}
+        profile = self.write_execution_profile if write else self.read_execution_profile
+        if profile is not None:
+            kwargs['execution_profile'] = profile
+        if timeout and self.request_timeout is not None:
+            kwargs['timeout'] = self.request_timeout
+        if trace:
+            kwargs['trace'] = True
+        return kwargs
+
+    def _queryset_statement(self, queryset):
+        """
+        Renders the select query of a cqlengine queryset
+        the same way cqlengine does before executing it.
+
+        :param cassandra.cqlengine.query.ModelQuerySet queryset:
+        :return: The statement and its parameters
+        :rtype: tuple
+        """
+        select = queryset._select_query()
+        params = select.get_context()
+        statement = SimpleStatement(six.text_type(select),
+                                    consistency_level=queryset._consistency,
+                                    fetch_size=select.fetch_size)
+        model = queryset.model
+        if model._partition_key_index:
+            key_values = select.partition_key_values(model._partition_key_index)
+            if not any(v is None for v in key_values):
+                protocol_version = self._get_session().cluster.protocol_version
+                statement.routing_key = model._routing_key_from_values(key_values, protocol_version)
+                statement.keyspace = model._get_keyspace()
+        return statement, params
+
+    def _bind_values(self, names, values):
+        columns = self.model._columns
+        return [columns[name].to_database(values[name]) for name in names]
+
+    def _bind_model_values(self, names, obj):
+        columns = self.model._columns
+        return [columns[name].to_database(getattr(obj, name)) for name in names]
+
+    def _primary_key_values(self, obj):
+        names = tuple(self.model._primary_keys)
+        return names, self._bind_model_values(names, obj)
+
+    def _select_model(self, lookup_keys, columns=None):
+        """
+        Gets the model specified by the lookup_keys
+        using a prepared statement
+
+        :param dict lookup_keys:
+        :param tuple columns: The columns to select.  Defaults to all of them
+        :rtype: cqlengine.Model
+        """
+        rows = list(self._execute(self._select_statement(lookup_keys, columns=columns)))
+        return self._one_model(rows, lookup_keys)
+
+    def _select_statement(self, lookup_keys, columns=None):
+        where = tuple(sorted(lookup_keys))
+        select = columns or tuple(self.model._columns)
+        prepared = self._prepare('retrieve', select_cql(self.model, select, where, limit=2),
+                                 select, where)
+        return prepared.bind(self._bind_values(where, lookup_keys))
+
+    def _one_model(self, rows, lookup_keys):
+        row = self._one_row(rows, lookup_keys)
+        with measure(self.metrics_sink, self.model, 'decode'):
+            return self.model._construct_instance(row)
+
+    def _one_row(self, rows, lookup_keys):
+        if not rows:
+            raise NotFoundException('The model {0} could not be found.  '
+                                    'lookup_keys: {1}'.format(self.model.__name__, lookup_keys))
+        if len(rows) > 1:
+            raise self.model.MultipleObjectsReturned('Multiple objects found')
+        return rows[0]
+
+    def _insert_model(self, obj):
+        """
+        Inserts the unsaved model and its copies using prepared
+        statements.  Null columns are left out of the statements
+        so that no tombstones are written.  Raises a LWTException
+        if ``fail_create_if_exists`` is True and the row already
+        exists, in which case the copies are not written.
+
+        :param cqlengine.Model obj:
+        """
+        statement = self._insert_statement(obj)
+        copies = self._fan_out_inserts(obj)
+        if self.fail_create_if_exists:
+            check_applied(self._execute(statement, write=True))
+            self._fan_out(copies)
+        else:
+            self._fan_out(copies, statement=statement)
+        obj._set_persisted()
+
+    def _insert_statement(self, obj):
+        obj.validate()
+        names = tuple(name for name, col in six.iteritems(self.model._columns)
+                      if not col._val_is_null(obj._values[name].value))
+        prepared = self._prepare('create', insert_cql(self.model, names,
+                                                      if_not_exists=self.fail_create_if_exists),
+                                 names, (self.fail_create_if_exists,))
+        return prepared.bind(self._bind_model_values(names, obj))
+
+    def _save_model(self, obj):
+        """
+        Writes the changed columns of a persisted model and of
+        its copies.  Changes to primary keys or counter columns
+        are handed off to cqlengine since they can not be
+        expressed as a simple assignment.
+
+        :param cqlengine.Model obj:
+        """
+        if not self.prepare_statements or not self._can_prepare_update(obj):
+            copies = self._fan_out_updates(obj)
+            self._retry(obj.save, idempotent=self._is_idempotent_save(obj))
+            self._fan_out(copies)
+            return
+        statement = self._update_statement(obj)
+        self._fan_out(self._fan_out_updates(obj), statement=statement)
+        obj._set_persisted()
+
+    def _can_prepare_update(self, obj):
+        """
+        :return: False if the changes to the model have to be
+            written by cqlengine, i.e. the model is polymorphic or
+            a primary key or counter column has changed
+        :rtype: bool
+        """
+        if self.model._is_polymorphic:
+            return False
+        columns = self.model._columns
+        return not any(columns[name].primary_key or columns[name].db_type == 'counter'
+                       for name in obj.get_changed_columns())
+
+    def _is_idempotent_save(self, obj):
+        """
+        :return: False if saving the model with cqlengine adds to
+            a changed counter or list column
+        :rtype: bool
+        """
+        columns = self.model._columns
+        return not any(columns[name].db_type == 'counter' or columns[name].db_type.startswith('list')
+                       for name in obj.get_changed_columns())
+
+    def _update_statement(self, obj):
+        """
+        :return: The bound statement writing the changed columns or
+            None if nothing changed
+        :rtype: cassandra.query.BoundStatement
+        """
+        obj.validate()
+        changed = tuple(name for name in self.model._columns
+                        if obj._values[name].changed)
+        if not changed:
+            return None
+        where, where_values = self._primary_key_values(obj)
+        prepared = self._prepare('update', update_cql(self.model, changed, where),
+                                 changed, where)
+        return prepared.bind(self._bind_model_values(changed, obj) + where_values)
+
+    def _delete_model(self, obj):
+        """
+        Deletes the persisted model using a prepared statement
+
+        :param cqlengine.Model obj:
+        """
+        self._fan_out(self._fan_out_deletes(obj), statement=self._delete_statement(obj))
+
+    def _delete_statement(self, obj):
+        where, where_values = self._primary_key_values(obj)
+        prepared = self._prepare('delete', delete_cql(self.model, where), where)
+        return prepared.bind(where_values)
+
+    def _fan_out(self, copies, statement=None):
+        """
+        Writes the copies of a model, and the model itself if the
+        statement is given, in one logged batch if ``fan_out_batches``
+        is True or concurrently otherwise.
+
+        :param list copies: The statements writing the copies
+        :param cassandra.query.Statement statement: The statement
+            writing the model
+        """
+        statements = copies if statement is None else [statement] + copies
+        if not statements:
+            return
+        if self.fan_out_batches or len(statements) == 1:
+            self._execute(batch_statement(statements, batch_type=BatchType.LOGGED), write=True)
+            return
+        for success, result in self._execute_concurrent(statements, write=True):
+            if not success:
+                raise result
+
+    def _copy_layouts(self):
+        return [copy_layout(self.model, table) for table in self.fan_out_tables]
+
+    def _key_columns(self):
+        """
+        :return: The columns read before deleting a model: the
+            primary keys and the columns of the keys of its copies
+        :rtype: tuple
+        """
+        names = set(self.model._primary_keys) | copy_sources(self._copy_layouts())
+        return tuple(name for name in self.model._columns if name in names)
+
+    def _fan_out_inserts(self, obj):
+        """
+        :param cqlengine.Model obj: A validated model
+        :return: The statements inserting the copies of the model
+        :rtype: list
+        """
+        statements = [self._copy_insert(layout, obj) for layout in self._copy_layouts()]
+        return [statement for statement in statements if statement is not None]
+
+    def _fan_out_updates(self, obj):
+        """
+        :param cqlengine.Model obj: A persisted model with changes
+        :return: The statements updating the changed columns of
+            its copies.  A copy whose key changed is deleted and
+            inserted under the new key.
+        :rtype: list
+        """
+        layouts = self._copy_layouts()
+        if not layouts:
+            return []
+        obj.validate()
+        changed = set(name for name in self.model._columns if obj._values[name].changed)
+        statements = []
+        for layout in layouts:
+            columns, moved = changed_columns(layout, changed)
+            if moved:
+                statements.append(self._copy_delete(layout, obj, previous=True))
+                statements.append(self._copy_insert(layout, obj))
+            elif columns and not self._copy_key_is_null(layout, obj):
+                names = tuple(name for name, _ in columns)
+                where = tuple(name for name, _ in layout.primary_keys)
+                prepared = self._prepare('fan_out_update', update_cql(layout.model, names, where),
+                                         (layout.model.column_family_name(),), names, where)
+                statements.append(prepared.bind(self._copy_values(layout, columns, obj) +
+                                                self._copy_values(layout, layout.primary_keys, obj)))
+        return [statement for statement in statements if statement is not None]
+
+    def _fan_out_deletes(self, obj):
+        """
+        :param cqlengine.Model obj: A model holding the ``_key_columns``
+        :return: The statements deleting the copies of the model
+        :rtype: list
+        """
+        statements = [self._copy_delete(layout, obj) for layout in self._copy_layouts()]
+        return [statement for statement in statements if statement is not None]
+
+    def _copy_insert(self, layout, obj):
+        """
+        :return: The statement inserting the copy or None
+            if a primary key of the copy is null
+        :rtype: cassandra.query.BoundStatement
+        """
+        if self._copy_key_is_null(layout, obj):
+            return None
+        model_columns = self.model._columns
+        columns = tuple((name, source) for name, source in layout.columns
+                        if not model_columns[source]._val_is_null(getattr(obj, source)))
+        names = tuple(name for name, _ in columns)
+        prepared = self._prepare('fan_out_insert', insert_cql(layout.model, names),
+                                 (layout.model.column_family_name(),), names)
+        return prepared.bind(self._copy_values(layout, columns, obj))
+
+    def _copy_delete(self, layout, obj, previous=False):
+        """
+        :param bool previous: Whether to delete the copy under
+            the key the model had when it was read
+        :return: The statement deleting the copy or None
+            if a primary key of the copy is null
+        :rtype: cassandra.query.BoundStatement
+        """
+        if self._copy_key_is_null(layout, obj, previous=previous):
+            return None
+        where = tuple(name for name, _ in layout.primary_keys)
+        prepared = self._prepare('fan_out_delete', delete_cql(layout.model, where),
+                                 (layout.model.column_family_name(),), where)
+        return prepared.bind(self._copy_values(layout, layout.primary_keys, obj, previous=previous))
+
+    def _copy_key_is_null(self, layout, obj, previous=False):
+        model_columns = self.model._columns
+        return any(model_columns[source]._val_is_null(self._source_value(obj, source, previous))
+                   for _, source in layout.primary_keys)
+
+    def _copy_values(self, layout, columns, obj, previous=False):
+        table_columns = layout.model._columns
+        return [table_columns[name].to_database(self._source_value(obj, source, previous))
+                for name, source in columns]
+
+    @staticmethod
+    def _source_value(obj, name, previous):
+        return obj._values[name].previous_value if previous else getattr(obj, name)
+
+    def get_next_query_args(self, last_model, pagination_count, filters=None, primary_keys=None):
         filters = filters or {}
         if last_model is None:
             return None, None
@@ -206,43 +1898,92 @@ class CQLManager(BaseManager):
         for filter_name, filter_value in six.iteritems(filters):
             query_args = '{0}&{1}={2}'.format(query_args, filter_name, filter_value)
         pagination_keys = []
-        for p_name in last_model._primary_keys:
+        for p_name in primary_keys or last_model._primary_keys:
             value = getattr(last_model, p_name)
             query_args = '{0}&{1}={2}'.format(query_args, self.pagination_pk_query_arg, value)
             pagination_keys.append(value)
         return query_args, pagination_keys
 
     def pagination_filtration(self, queryset, last_pagination_pk=None, filters=None):
-        if filters is None:
-            return queryset
-        if last_pagination_pk is None:
-            last_pagination_pk = []
-        if len(last_pagination_pk) == 0:
-            return queryset
-        partition_key_count = len(self.model._partition_keys)
-        if len(dict(filters.items() + self.model._partition_keys.items())) < len(filters) + len(self.model._partition_keys):
-            # There is some overlap between the partition keys filters
-            # TODO make a better way to do filtering
-            for i in range(len(self.model._partition_keys)):
-                key = self.model._partition_keys.items()[i][0]
-                if key in filters:
-                    continue
-                value = last_pagination_pk[i]
-                queryset = queryset.filter(**{'{0}__gte'.format(key): value})
-        else:
-            queryset = queryset.filter(pk__token__gte=Token(last_pagination_pk))
-        if len(self.model._primary_keys) <= partition_key_count:
-            return queryset
+        """
+        Restricts the queryset to the models from the last_pagination_pk
+        onwards using the pagination plan for the shape of the filters.
 
-        clustering_pagination = last_pagination_pk[partition_key_count:]
-        for i in range(len(clustering_pagination)):
-            key = self.model._clustering_keys.items()[i][0]
-            if key in filters:
-                continue
-            value = clustering_pagination[i]
-            queryset = queryset.filter(getattr(self.model, key) >= value)
+        :param cassandra.cqlengine.query.ModelQuerySet queryset:
+        :param list last_pagination_pk: The primary key values of the
+            first model of the page
+        :param dict filters: The filters without the pagination arguments
+        :rtype: cassandra.cqlengine.query.ModelQuerySet
+        """
+        if filters is None or not last_pagination_pk:
+            return queryset
+        model = queryset.model
+        plan = self._get_pagination_plan(filters, model=model)
+        for index, name in plan.partition_bounds:
+            queryset = queryset.filter(**{'{0}__gte'.format(name): last_pagination_pk[index]})
+        if plan.token_count is not None:
+            queryset = queryset.filter(pk__token__gte=Token(last_pagination_pk[:plan.token_count]))
+        for index, name in plan.clustering_bounds:
+            if index < len(last_pagination_pk):
+                queryset = queryset.filter(getattr(model, name) >= last_pagination_pk[index])
         return queryset
 
+    @classmethod
+    def _get_pagination_plan(cls, filters, model=None):
+        """
+        Gets the pagination plan for the model and the
+        names of the filters, planning it on the first use.
+
+        :param dict filters:
+        :param type model: The model of the table being paged.
+            Defaults to the manager's model
+        :rtype: ripozo_cassandra.keys.PaginationPlan
+        """
+        if cls.__dict__.get('_pagination_plans') is None:
+            cls._pagination_plans = {}
+        key = (model or cls.model, frozenset(filters))
+        plan = cls._pagination_plans.get(key)
+        if plan is None:
+            plan = cls._pagination_plans[key] = pagination_plan(key_layout(key[0]), key[1])
+        return plan
+
+    def _query_model(self, filters, ordered=None):
+        """
+        Gets the model of the table a list retrieval with the
+        filters is routed to, choosing it on the first use.
+
+        :param dict filters: The filters without the pagination arguments
+        :param bool ordered: Whether the rows are read in the
+            ``order_by``.  Defaults to whether there is one
+        :return: The manager's model or one of the ``query_tables``
+        :rtype: type
+        """
+        cls = type(self)
+        if cls.__dict__.get('_query_routes') is None:
+            cls._query_routes = {}
+        if ordered is None:
+            ordered = self.order_by is not None
+        key = (self.model, frozenset(filters or ()), ordered)
+        model = cls._query_routes.get(key)
+        if model is None:
+            columns = self.read_columns or tuple(self.model._columns)
+            model = cls._query_routes[key] = route_query(self.model, self.query_tables, key[1], columns,
+                                                         ordered=key[2])
+        return model
+
+    def _query_columns(self, model):
+        """
+        :param type model: The model of the table a list
+            retrieval is routed to
+        :return: The ``read_columns`` and the primary keys of the
+            table or None if every column is selected
+        :rtype: tuple
+        """
+        columns = self.read_columns
+        if columns is None or model is self.model:
+            return columns
+        return columns + tuple(name for name in model._primary_keys if name not in columns)
+
     def serialize_model(self, obj, fields_list=None):
         """
         Takes a cqlengine.Model and jsonifies it.
@@ -256,6 +1997,66 @@ class CQLManager(BaseManager):
         :rtype: dict
         """
         fields_list = fields_list or self.fields
+        if self.model is not None and isinstance(obj, self.model):
+            return self._get_serializer(type(obj), fields_list)(obj)
         base = dict(obj)
         base = self.valid_fields(base, fields_list)
         return make_json_safe(base)
+
+    @classmethod
+    def _get_serializer(cls, model, fields_list, rows=False):
+        """
+        Gets the serializer compiled for the model and fields,
+        compiling it on the first use.
+
+        :param type model: The class of the model being serialized
+        :param list fields_list: The fields to serialize
+        :param bool rows: Whether to get the serializer of the
+            model's rows instead of its instances
+        :return: The serializer function
+        :rtype: function
+        """
+        if cls.__dict__.get('_serializers') is None:
+            cls._serializers = {}
+        key = (model, tuple(fields_list), rows)
+        serializer = cls._serializers.get(key)
+        if serializer is None:
+            compile_function = compile_row_serializer if rows else compile_serializer
+            serializer = cls._serializers[key] = compile_function(model, fields_list)
+        return serializer
+
+    def _serializes_rows(self):
+        """
+        :return: Whether the rows can be serialized without
+            building the models
+        :rtype: bool
+        """
+        return self.serialize_rows and not self.model._is_polymorphic and \
+            six.get_unbound_function(type(self).serialize_model) is \
+            six.get_unbound_function(CQLManager.serialize_model)
+
+    def _row_serializer(self):
+        """
+        :return: A function serializing a row of the model's
+            table, by way of the model if the rows can not be
+            serialized directly
+        :rtype: function
+        """
+        if self._serializes_rows():
+            return self._get_serializer(self.model, self.fields, rows=True)
+        return lambda row: self.serialize_model(self.model._construct_instance(row))
+
+    def _serialize_rows(self, rows):
+        """
+        :param list rows: Rows of the model's table
+        :return: The serialized models
+        :rtype: list
+        """
+        if self._serializes_rows():
+            serialize = self._get_serializer(self.model, self.fields, rows=True)
+            with measure(self.metrics_sink, self.model, 'serialize'):
+                return [serialize(row) for row in rows]
+        with measure(self.metrics_sink, self.model, 'decode'):
+            models = [self.model._construct_instance(row) for row in rows]
+        with measure(self.metrics_sink, self.model, 'serialize'):
+            return [self.serialize_model(obj) for obj in models]
@@ -0,0 +1,88 @@
+"""
+Opaque, tamper checked pagination cursors wrapping
+the driver's paging_state.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from ripozo.exceptions import ValidationException
+
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import six
+
+_DIGEST_SIZE = 16
+
+#: The secret used when a manager does not specify a ``cursor_secret``.
+#: It is only valid for the lifetime of the process so
+#: deployments with more than one process must set a secret.
+PROCESS_SECRET = os.urandom(32)
+
+
+def _constant_time_compare(first, second):
+    """
+    Compares two byte strings in a time that does not depend
+    on where they differ, for pythons before 2.7.7 that do
+    not have ``hmac.compare_digest``.
+    """
+    if len(first) != len(second):
+        return False
+    result = 0
+    for first_byte, second_byte in zip(six.iterbytes(first), six.iterbytes(second)):
+        result |= first_byte ^ second_byte
+    return result == 0
+
+
+_compare_digest = getattr(hmac, 'compare_digest', _constant_time_compare)
+
+
+def _signature(paging_state, secret, context):
+    if isinstance(secret, six.text_type):
+        secret = secret.encode('utf-8')
+    message = context.encode('utf-8') + b'\0' + paging_state
+    return hmac.new(secret, message, hashlib.sha256).digest()[:_DIGEST_SIZE]
+
+
+def encode_cursor(paging_state, secret, context):
+    """
+    Encodes the paging_state as a url safe cursor signed
+    with the secret.
+
+    :param bytes paging_state: The paging_state from the driver's ResultSet
+    :param bytes secret: The secret used to sign the cursor
+    :param unicode context: Identifies the query the paging_state belongs
+        to.  A cursor can only be decoded with the same context.
+    :return: The cursor
+    :rtype: unicode
+    """
+    raw = _signature(paging_state, secret, context) + paging_state
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, secret, context):
+    """
+    Decodes a cursor created by ``encode_cursor``.
+
+    :param unicode cursor: The cursor from the query args
+    :param bytes secret: The secret used to sign the cursor
+    :param unicode context: The context the cursor was encoded with
+    :return: The paging_state
+    :rtype: bytes
+    :raises: ValidationException if the cursor is malformed, was
+        tampered with, or belongs to a different query
+    """
+    if isinstance(cursor, six.text_type):
+        cursor = cursor.encode('ascii', 'replace')
+    try:
+        raw = base64.urlsafe_b64decode(cursor + b'=' * (-len(cursor) % 4))
+    except (binascii.Error, TypeError, ValueError):
+        raw = b''
+    signature, paging_state = raw[:_DIGEST_SIZE], raw[_DIGEST_SIZE:]
+    if not paging_state or not _compare_digest(signature, _signature(paging_state, secret, context)):
+        raise ValidationException('The pagination cursor is invalid', status_code=400)
+    return paging_state
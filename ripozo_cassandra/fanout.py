@@ -0,0 +1,94 @@
+"""
+Describes the denormalized copies of a model's rows that a
+manager keeps in sync with its writes.  A copy is a table
+with its own primary key holding some of the model's columns,
+e.g. a lookup table of users by email::
+
+    class MyManager(CQLManager):
+        model = User
+        fan_out_tables = (UserByEmail, fan_out_table(UserByName, {'name': 'username'}))
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import namedtuple
+
+#: A copy of the model's rows in the table of the cqlengine
+#: ``model``.  ``columns`` are (table column, model column) tuples
+#: of the table's columns that hold a model column with another name.
+#: Every other column holds the model's column of the same name.
+FanOutTable = namedtuple('FanOutTable', ['model', 'columns'])
+
+#: The resolved columns of a FanOutTable as (table column,
+#: model column) tuples in the table's column order.
+#: ``primary_keys`` are the tuples of the table's primary keys.
+CopyLayout = namedtuple('CopyLayout', ['model', 'columns', 'primary_keys'])
+
+
+def fan_out_table(model, columns=None):
+    """
+    :param type model: The cqlengine model class of the copy
+    :param dict columns: The model's column held by each of the
+        table's columns, for the columns whose names differ
+    :rtype: FanOutTable
+    """
+    return FanOutTable(model, tuple(sorted((columns or {}).items())))
+
+
+def copy_layout(model, table):
+    """
+    :param type model: The cqlengine model class of the manager
+    :param table: A FanOutTable or the cqlengine model class of
+        a copy whose columns are named like the model's
+    :return: The CopyLayout of the table, cached on the model class
+    :rtype: CopyLayout
+    :raises ValueError: If a column of the table is not
+        a column of the model
+    """
+    layouts = model.__dict__.get('_copy_layouts')
+    if layouts is None:
+        layouts = model._copy_layouts = {}
+    key = table
+    layout = layouts.get(key)
+    if layout is not None:
+        return layout
+    if not isinstance(table, FanOutTable):
+        table = FanOutTable(table, ())
+    mapping = dict(table.columns)
+    columns = []
+    for name in table.model._columns:
+        source = mapping.get(name, name)
+        if source not in model._columns:
+            raise ValueError('The column {0} of {1} is not a column of {2}'.format(
+                name, table.model.__name__, model.__name__))
+        columns.append((name, source))
+    primary_keys = tuple((name, source) for name, source in columns
+                         if name in table.model._primary_keys)
+    layout = layouts[key] = CopyLayout(table.model, tuple(columns), primary_keys)
+    return layout
+
+
+def copy_sources(layouts):
+    """
+    :param list layouts: The CopyLayouts
+    :return: The names of the model's columns that
+        the primary keys of the copies are built from
+    :rtype: set
+    """
+    return set(source for layout in layouts for _, source in layout.primary_keys)
+
+
+def changed_columns(layout, changed):
+    """
+    :param CopyLayout layout:
+    :param set changed: The names of the model's changed columns
+    :return: The (table column, model column) tuples of the
+        copy's columns that changed and whether any of
+        them is a primary key of the copy
+    :rtype: tuple
+    """
+    columns = tuple((name, source) for name, source in layout.columns if source in changed)
+    return columns, any(source in changed for _, source in layout.primary_keys)
+
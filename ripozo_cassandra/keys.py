@@ -0,0 +1,93 @@
+"""
+Describes the primary key layout of the models, plans
+the pagination restrictions of a list retrieval from it
+and picks the table a list retrieval is routed to.  They
+are computed once and reused for every request.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import namedtuple
+
+#: The names of the partition, clustering and primary keys
+#: of a model in their order in the primary key.
+KeyLayout = namedtuple('KeyLayout', ['partition_keys', 'clustering_keys', 'primary_keys'])
+
+#: How a page after the last_pagination_pk is selected for a
+#: shape of filters.  ``partition_bounds`` and ``clustering_bounds``
+#: are (index in the primary key, name) tuples of the keys that
+#: are restricted to be greater or equal to the last value.  If
+#: ``token_count`` is not None the token of the first
+#: ``token_count`` values is restricted instead of the partition keys.
+PaginationPlan = namedtuple('PaginationPlan', ['partition_bounds', 'token_count', 'clustering_bounds'])
+
+
+def key_layout(model):
+    """
+    :param type model: The cqlengine model class
+    :return: The KeyLayout of the model, cached on the model
+        class so that it goes away with the class
+    :rtype: KeyLayout
+    """
+    layout = model.__dict__.get('_key_layout')
+    if layout is None:
+        layout = KeyLayout(tuple(model._partition_keys), tuple(model._clustering_keys),
+                           tuple(model._primary_keys))
+        model._key_layout = layout
+    return layout
+
+
+def pagination_plan(layout, filter_names):
+    """
+    Plans the restrictions for the page after the last_pagination_pk.
+    If any partition key is filtered on, the other partition keys are
+    compared directly.  Otherwise the token of the partition key is.
+    The clustering keys that are not filtered on are compared directly.
+
+    :param KeyLayout layout:
+    :param frozenset filter_names: The names of the filtered columns
+    :rtype: PaginationPlan
+    """
+    partition_count = len(layout.partition_keys)
+    if any(name in filter_names for name in layout.partition_keys):
+        partition_bounds = tuple((index, name) for index, name in enumerate(layout.partition_keys)
+                                 if name not in filter_names)
+        token_count = None
+    else:
+        partition_bounds = ()
+        token_count = partition_count
+    clustering_bounds = tuple((partition_count + index, name)
+                              for index, name in enumerate(layout.clustering_keys)
+                              if name not in filter_names)
+    return PaginationPlan(partition_bounds, token_count, clustering_bounds)
+
+
+def route_query(model, query_tables, filter_names, columns, ordered=False):
+    """
+    Picks the table to run a list retrieval on.  The model's own
+    table is used if the filters restrict its whole partition key.
+    Otherwise it is the first of the query_tables whose partition
+    key is restricted and that has every filtered and selected column.
+    If there is none, or the retrieval is ordered, the model's own
+    table is used since the order of another table's clustering keys
+    is not the requested one.
+
+    :param type model: The cqlengine model class
+    :param tuple query_tables: The cqlengine model classes of the
+        materialized views or lookup tables holding the model's rows
+    :param frozenset filter_names: The names of the filtered columns
+    :param tuple columns: The names of the selected columns
+    :param bool ordered: Whether the retrieval has an order_by
+    :return: The model class of the table
+    :rtype: type
+    """
+    if ordered or not filter_names or all(name in filter_names for name in key_layout(model).partition_keys):
+        return model
+    for table in query_tables:
+        if all(name in filter_names for name in key_layout(table).partition_keys) \
+                and all(name in table._columns for name in filter_names) \
+                and all(name in table._columns for name in columns):
+            return table
+    return model
@@ -0,0 +1,283 @@
+"""
+Limits the number of requests the managers have in flight.
+An AdaptiveLimiter can be shared by any number of managers,
+e.g. one per model or one per cluster::
+
+    CLUSTER_LIMITER = AdaptiveLimiter(latency_target=0.05, max_wait=0.5)
+
+    class MyManager(CQLManager):
+        limiter = CLUSTER_LIMITER
+
+The limit adapts AIMD style: every request that completes within
+the ``latency_target`` adds ``1 / limit`` to it, i.e. about one
+per ``limit`` requests, and a request that is slower or fails with
+a timeout or overloaded error multiplies it by ``backoff``.  The
+limit is decreased at most once per batch of requests in flight
+so that one slow spike does not collapse it to the minimum.
+
+Every request holds its own permit, including each of the
+statements the bulk operations execute concurrently
+(see ``execute_limited``).
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra import OperationTimedOut, ReadTimeout, WriteTimeout
+from cassandra.concurrent import ExecutionResult
+from cassandra.protocol import OverloadedErrorMessage
+
+from ripozo.exceptions import ManagerException
+
+import threading
+import timeit
+
+timer = timeit.default_timer
+
+#: The errors that signal an overloaded cluster
+OVERLOAD_ERRORS = (OperationTimedOut, ReadTimeout, WriteTimeout, OverloadedErrorMessage)
+
+
+class SaturatedException(ManagerException):
+    """
+    Raised when a request could not get a permit
+    from the limiter before its deadline.
+    """
+
+    def __init__(self, message, status_code=503, *args, **kwargs):
+        super(SaturatedException, self).__init__(message, status_code=status_code, *args, **kwargs)
+
+
+class AdaptiveLimiter(object):
+    """
+    A thread safe AIMD limit on the requests in flight.
+
+    :param int limit: The initial limit
+    :param int min_limit:
+    :param int max_limit:
+    :param float latency_target: The latency in seconds above
+        which a request is counted as a sign of overload
+    :param float backoff: The factor the limit is multiplied
+        by when the cluster is overloaded
+    :param float max_wait: How long in seconds a request waits
+        for a permit when the limit is reached before a
+        SaturatedException is raised.  0 (the default) fails
+        fast and None waits indefinitely.
+    """
+
+    def __init__(self, limit=32, min_limit=1, max_limit=1024, latency_target=0.1,
+                 backoff=0.5, max_wait=0.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.rejected = 0
+        self._limit = float(limit)
+        self._decreased_at = float('-inf')
+        self._condition = threading.Condition(threading.Lock())
+        self._listeners = []
+
+    @property
+    def limit(self):
+        """
+        :return: The current number of requests allowed in flight
+        :rtype: int
+        """
+        return int(self._limit)
+
+    def try_acquire(self):
+        """
+        Takes a permit if one is available without waiting.
+
+        :return: The time the permit was taken to pass to
+            ``release`` or None if the limit is reached
+        :rtype: float
+        """
+        with self._condition:
+            if self.in_flight >= int(self._limit):
+                return None
+            self.in_flight += 1
+        return timer()
+
+    def acquire(self):
+        """
+        Takes a permit, waiting up to ``max_wait``
+        for one if the limit is reached.
+
+        :return: The time the permit was taken to pass to ``release``
+        :rtype: float
+        :raises SaturatedException: If no permit was available in time
+        """
+        deadline = None if self.max_wait is None else timer() + self.max_wait
+        with self._condition:
+            while self.in_flight >= int(self._limit):
+                remaining = None if deadline is None else deadline - timer()
+                if remaining is not None and remaining <= 0:
+                    self.rejected += 1
+                    raise SaturatedException('{0} requests are in flight'.format(self.in_flight))
+                self._condition.wait(remaining)
+            self.in_flight += 1
+        return timer()
+
+    def reject(self):
+        """
+        Counts a request that gave up waiting for a permit.
+
+        :return: The exception to raise
+        :rtype: SaturatedException
+        """
+        with self._condition:
+            self.rejected += 1
+            return SaturatedException('{0} requests are in flight'.format(self.in_flight))
+
+    def add_listener(self, listener):
+        """
+        :param function listener: Called without arguments, from the
+            releasing thread, every time a permit is released.  Lets
+            waiters that can not block on the limiter's lock, such as
+            coroutines, retry ``try_acquire``.
+        """
+        with self._condition:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._condition:
+            self._listeners.remove(listener)
+
+    def release(self, started, error=None):
+        """
+        Returns a permit and adapts the limit to the
+        latency and outcome of its request.
+
+        :param float started: The time returned when the permit was taken
+        :param Exception error: The exception the request failed with
+        """
+        now = timer()
+        overloaded = isinstance(error, OVERLOAD_ERRORS) or now - started > self.latency_target
+        with self._condition:
+            self.in_flight -= 1
+            if overloaded:
+                # Only the requests sent after the last decrease
+                # reflect it so the others do not decrease it again
+                if started >= self._decreased_at:
+                    self._limit = max(float(self.min_limit), self._limit * self.backoff)
+                    self._decreased_at = now
+            elif error is None:
+                self._limit = min(float(self.max_limit), self._limit + 1 / self._limit)
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def snapshot(self):
+        """
+        :return: The limit, the requests in flight and the
+            number of requests rejected so far
+        :rtype: dict
+        """
+        with self._condition:
+            return dict(limit=int(self._limit), in_flight=self.in_flight, rejected=self.rejected)
+
+
+class _Permit(object):
+    """
+    Holds a permit of the limiter for the duration of a with block.
+    """
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.started = None
+
+    def __enter__(self):
+        self.started = self.limiter.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.limiter.release(self.started, exc_value)
+        return False
+
+
+class _NoPermit(object):
+    """
+    Shared by every request without a limiter.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_PERMIT = _NoPermit()
+
+
+def permit(limiter):
+    """
+    :param AdaptiveLimiter limiter: The limiter or None
+    :return: A context manager holding a permit of the limiter
+        or doing nothing if the limiter is None
+    """
+    if limiter is None:
+        return _NO_PERMIT
+    return _Permit(limiter)
+
+
+def execute_limited(session, statements, limiter, concurrency, **kwargs):
+    """
+    Executes the statements concurrently like the driver's
+    ``execute_concurrent`` but every statement takes its own
+    permit of the limiter before it is sent.  The permit is
+    released with the latency and error of its request when it
+    completes.  The calling thread blocks while waiting for
+    permits; the driver's event thread never does.
+
+    :param cassandra.cluster.Session session:
+    :param list statements:
+    :param AdaptiveLimiter limiter:
+    :param int concurrency: The maximum number of statements in flight
+    :param kwargs: The keyword arguments of ``execute_async``
+    :return: A list of (success, result or exception) tuples
+        in the same order as the statements
+    :rtype: list
+    """
+    slots = threading.Semaphore(concurrency)
+
+    def _succeeded(rows, started):
+        limiter.release(started)
+        slots.release()
+
+    def _failed(exc, started):
+        limiter.release(started, exc)
+        slots.release()
+
+    pending = []
+    for statement in statements:
+        slots.acquire()
+        try:
+            started = limiter.acquire()
+        except SaturatedException as exc:
+            slots.release()
+            pending.append(exc)
+            continue
+        try:
+            future = session.execute_async(statement, **kwargs)
+        except Exception as exc:
+            _failed(exc, started)
+            pending.append(exc)
+            continue
+        future.add_callbacks(_succeeded, _failed, callback_args=(started,), errback_args=(started,))
+        pending.append(future)
+    outcomes = []
+    for future in pending:
+        if isinstance(future, Exception):
+            outcomes.append(ExecutionResult(False, future))
+            continue
+        try:
+            outcomes.append(ExecutionResult(True, future.result()))
+        except Exception as exc:
+            outcomes.append(ExecutionResult(False, exc))
+    return outcomes
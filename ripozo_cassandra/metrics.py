@@ -0,0 +1,379 @@
+"""
+Instrumentation for the managers.  A manager reports its
+measurements to its ``metrics_sink``.  The default sink
+does nothing; a MemorySink aggregates counters and latency
+histograms per operation and model that can be read with
+:py:meth:`MemorySink.snapshot`.
+
+The latencies are split into phases:
+
+- ``total``: the whole operation
+- ``query``: waiting on cassandra, including the driver
+  decoding the response into rows
+- ``decode``: building the cqlengine models from the rows.
+  Reads that serialize the rows directly do not build them.
+- ``serialize``: serializing the models or rows to dictionaries
+
+``rows`` and ``bytes`` are the number of rows and the estimated
+size of the values in each response.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import bisect
+import functools
+import six
+import threading
+import timeit
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # pragma: no cover
+    ContextVar = None
+
+timer = timeit.default_timer
+
+#: The upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BOUNDS = tuple(0.00005 * 2 ** i for i in range(22))
+
+#: The upper bounds of the rows and bytes histogram buckets
+SIZE_BOUNDS = tuple(2 ** i for i in range(32))
+
+
+class _LocalVar(object):
+    """
+    The parts of a ContextVar used here for pythons without contextvars
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self):
+        return getattr(self._local, 'value', None)
+
+    def set(self, value):
+        token = self.get()
+        self._local.value = value
+        return token
+
+    def reset(self, token):
+        self._local.value = token
+
+
+_OPERATION = ContextVar('ripozo_cassandra_operation', default=None) if ContextVar else _LocalVar()
+
+
+def current_operation():
+    """
+    :return: The name of the manager operation being measured
+        in this thread or task, or None
+    :rtype: unicode
+    """
+    return _OPERATION.get()
+
+
+def start_operation(operation):
+    """
+    Marks the start of a manager operation.
+
+    :param unicode operation: The name of the operation
+    :return: The state to pass to ``finish_operation``
+    :rtype: tuple
+    """
+    return _OPERATION.set(operation), timer()
+
+
+def finish_operation(sink, operation, model, state, failed=False):
+    """
+    Records the total latency and the call or error
+    of an operation started with ``start_operation``
+
+    :param BaseSink sink:
+    :param unicode operation:
+    :param unicode model: The name of the model
+    :param tuple state: The state returned by ``start_operation``
+    :param bool failed: Whether the operation raised an exception
+    """
+    token, started = state
+    _OPERATION.reset(token)
+    sink.timing(operation, model, 'total', timer() - started)
+    sink.increment(operation, model, 'errors' if failed else 'calls')
+
+
+def instrumented(method):
+    """
+    Measures a manager method as an operation
+    named after the method.
+    """
+    operation = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        sink = self.metrics_sink
+        if not sink.enabled:
+            return method(self, *args, **kwargs)
+        state = start_operation(operation)
+        try:
+            result = method(self, *args, **kwargs)
+        except Exception:
+            finish_operation(sink, operation, self.model.__name__, state, failed=True)
+            raise
+        finish_operation(sink, operation, self.model.__name__, state)
+        return result
+    return wrapper
+
+
+class _Measurement(object):
+    """
+    Times a phase of the current operation from its creation
+    until ``stop`` is called or the with block exits.
+    """
+
+    def __init__(self, sink, operation, model, phase):
+        self.sink = sink
+        self.operation = operation
+        self.model = model
+        self.phase = phase
+        self.started = timer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stop(self, result=None):
+        """
+        Records the time since the measurement started.
+
+        :param cassandra.cluster.ResultSet result: If given the number of
+            rows and estimated bytes in its current page are recorded too.
+        """
+        self.sink.timing(self.operation, self.model, self.phase, timer() - self.started)
+        rows = getattr(result, 'current_rows', None)
+        if isinstance(rows, list) and getattr(result, 'column_names', None) \
+                and result.column_names[0] != '[applied]':
+            self.sink.observe(self.operation, self.model, 'rows', len(rows))
+            self.sink.observe(self.operation, self.model, 'bytes', estimate_bytes(rows))
+
+
+class _NoMeasurement(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def stop(self, result=None):
+        pass
+
+
+_NO_MEASUREMENT = _NoMeasurement()
+
+
+def measure(sink, model, phase):
+    """
+    Starts timing a phase of the current operation.  Nothing is
+    recorded if the sink is disabled or no operation is being measured.
+
+    :param BaseSink sink:
+    :param type model: The cqlengine model class
+    :param unicode phase: query, decode or serialize
+    :return: A context manager that also has a ``stop(result=None)`` method
+    """
+    if not sink.enabled:
+        return _NO_MEASUREMENT
+    operation = current_operation()
+    if operation is None:
+        return _NO_MEASUREMENT
+    return _Measurement(sink, operation, model.__name__, phase)
+
+
+def estimate_bytes(rows):
+    """
+    Estimates the size of the values in the rows.  Text
+    and blobs count their length and other values 8 bytes.
+
+    :param list rows: The rows as dictionaries or tuples
+    :rtype: int
+    """
+    return sum(_value_bytes(value) for row in rows
+               for value in (row.values() if isinstance(row, dict) else row))
+
+
+def _value_bytes(value):
+    if value is None:
+        return 0
+    if isinstance(value, (six.text_type, six.binary_type, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_value_bytes(key) + _value_bytes(val) for key, val in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)) or type(value).__name__ == 'SortedSet':
+        return sum(_value_bytes(item) for item in value)
+    if hasattr(value, 'items'):
+        return sum(_value_bytes(key) + _value_bytes(val) for key, val in value.items())
+    return 8
+
+
+class Histogram(object):
+    """
+    Counts observations in buckets with fixed upper bounds.
+    The percentiles are the upper bound of the bucket the
+    percentile falls in, capped at the largest observation.
+
+    :param tuple bounds: The sorted upper bounds of the buckets
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def percentile(self, percent):
+        if not self.count:
+            return None
+        rank = percent / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                bound = self.bounds[index] if index < len(self.bounds) else self.maximum
+                return min(bound, self.maximum)
+        return self.maximum
+
+    def snapshot(self):
+        """
+        :return: The count, sum, min, max, mean,
+            p50, p90 and p99 of the observations
+        :rtype: dict
+        """
+        return dict(count=self.count, sum=self.total, min=self.minimum, max=self.maximum,
+                    mean=self.total / self.count if self.count else None,
+                    p50=self.percentile(50), p90=self.percentile(90), p99=self.percentile(99))
+
+
+class BaseSink(object):
+    """
+    Receives the measurements of the managers.  Every method
+    does nothing so a sink only needs to implement the
+    measurements it is interested in.  If ``enabled`` is
+    False the managers do not take any measurements.
+    """
+    enabled = True
+
+    def timing(self, operation, model, phase, seconds):
+        """
+        :param unicode operation: The name of the manager operation
+        :param unicode model: The name of the model
+        :param unicode phase: total, query, decode or serialize
+        :param float seconds:
+        """
+        pass
+
+    def observe(self, operation, model, name, value):
+        """
+        :param unicode operation:
+        :param unicode model:
+        :param unicode name: rows or bytes
+        :param int value:
+        """
+        pass
+
+    def increment(self, operation, model, name, value=1):
+        """
+        :param unicode operation:
+        :param unicode model:
+        :param unicode name: calls or errors
+        :param int value:
+        """
+        pass
+
+    def snapshot(self):
+        """
+        :return: The aggregated measurements
+        :rtype: dict
+        """
+        return {}
+
+
+class NullSink(BaseSink):
+    """
+    The default sink.  It disables the measurements.
+    """
+    enabled = False
+
+
+#: The sink the managers use unless one is set
+NULL_SINK = NullSink()
+
+
+class MemorySink(BaseSink):
+    """
+    A thread safe sink that keeps the counters and
+    histograms of each operation and model in memory.
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, operation, model):
+        key = (operation, model)
+        entry = self._stats.get(key)
+        if entry is None:
+            entry = self._stats[key] = dict(calls=0, errors=0, histograms={})
+        return entry
+
+    def _histogram(self, operation, model, name, bounds):
+        histograms = self._entry(operation, model)['histograms']
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram(bounds)
+        return histogram
+
+    def timing(self, operation, model, phase, seconds):
+        with self._lock:
+            self._histogram(operation, model, phase, LATENCY_BOUNDS).observe(seconds)
+
+    def observe(self, operation, model, name, value):
+        with self._lock:
+            self._histogram(operation, model, name, SIZE_BOUNDS).observe(value)
+
+    def increment(self, operation, model, name, value=1):
+        with self._lock:
+            self._entry(operation, model)[name] += value
+
+    def snapshot(self):
+        """
+        :return: A dictionary keyed by operation whose values are
+            dictionaries keyed by model name.  Each holds the ``calls``
+            and ``errors`` counts and a histogram snapshot for each
+            phase, ``rows`` and ``bytes`` that was measured.
+        :rtype: dict
+        """
+        snapshot = {}
+        with self._lock:
+            for (operation, model), entry in self._stats.items():
+                stats = dict(calls=entry['calls'], errors=entry['errors'])
+                for name, histogram in entry['histograms'].items():
+                    stats[name] = histogram.snapshot()
+                snapshot.setdefault(operation, {})[model] = stats
+        return snapshot
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
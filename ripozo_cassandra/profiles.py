@@ -0,0 +1,51 @@
+"""
+Builds the driver execution profiles for the managers'
+``read_execution_profile`` and ``write_execution_profile``.
+Register them on the cluster before using them by name::
+
+    cluster.add_execution_profile('fast_reads', execution_profile(
+        ConsistencyLevel.LOCAL_ONE, speculative_delay=0.02))
+
+    class MyManager(CQLManager):
+        read_execution_profile = 'fast_reads'
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra.cluster import ExecutionProfile
+from cassandra.policies import ConstantSpeculativeExecutionPolicy, DCAwareRoundRobinPolicy, \
+    TokenAwarePolicy
+from cassandra.query import dict_factory
+
+
+def execution_profile(consistency_level, local_dc=None, speculative_delay=None,
+                      speculative_attempts=1, request_timeout=10.0, serial_consistency_level=None):
+    """
+    Builds an execution profile that routes the requests to a
+    replica of the partition in the local data center.  The rows
+    are returned as dictionaries since cqlengine needs them.
+
+    :param int consistency_level: The ConsistencyLevel
+    :param unicode local_dc: The local data center.  Defaults to
+        the data center of the contact points.
+    :param float speculative_delay: If set, an idempotent request that
+        has not been answered after this many seconds is sent to
+        another replica as well.
+    :param int speculative_attempts: The maximum number of
+        speculative requests per request
+    :param float request_timeout: The timeout in seconds
+    :param int serial_consistency_level: The SerialConsistencyLevel
+        of lightweight transactions
+    :rtype: cassandra.cluster.ExecutionProfile
+    """
+    speculative_policy = None
+    if speculative_delay is not None:
+        speculative_policy = ConstantSpeculativeExecutionPolicy(speculative_delay, speculative_attempts)
+    return ExecutionProfile(load_balancing_policy=TokenAwarePolicy(DCAwareRoundRobinPolicy(local_dc=local_dc)),
+                            consistency_level=consistency_level,
+                            serial_consistency_level=serial_consistency_level,
+                            request_timeout=request_timeout,
+                            row_factory=dict_factory,
+                            speculative_execution_policy=speculative_policy)
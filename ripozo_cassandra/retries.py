@@ -0,0 +1,147 @@
+"""
+Retries the managers' requests that fail with a transient
+error if retrying them is safe.  A statement is idempotent
+unless it is a lightweight transaction or adds to a counter
+or list (see ``statements.is_idempotent_cql``); retrying
+those could apply them twice or report a conflict with
+their own first attempt.
+
+A manager's ``retry_policy`` is also used by the driver for the
+errors the coordinator reports, which it retries once on the
+next replica of the query plan.  The errors that reach the manager
+are retried after a jittered exponential backoff until the
+``max_attempts`` or the ``deadline`` is reached.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra import OperationTimedOut, ReadTimeout, Unavailable, WriteTimeout
+from cassandra.cluster import NoHostAvailable
+from cassandra.policies import RetryPolicy as DriverRetryPolicy
+from cassandra.protocol import OverloadedErrorMessage
+
+import random
+import time
+import timeit
+
+timer = timeit.default_timer
+
+#: The errors that are retried
+TRANSIENT_ERRORS = (OperationTimedOut, ReadTimeout, WriteTimeout, Unavailable,
+                    OverloadedErrorMessage, NoHostAvailable)
+
+
+class RetryPolicy(DriverRetryPolicy):
+    """
+    :param int max_attempts: The maximum number of times a
+        request is sent by the manager, including the first
+    :param float base_delay: The maximum delay in seconds before the
+        first retry.  It doubles with every retry.
+    :param float max_delay: The maximum delay in seconds before a retry
+    :param float deadline: The time in seconds after the first
+        attempt after which a request is not retried anymore
+    :param bool next_host: Whether the driver retries an idempotent
+        request once on the next replica when the coordinator
+        reports a timeout, an unavailable error or an error
+        of the host itself
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.01, max_delay=0.5, deadline=2.0, next_host=True):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.next_host = next_host
+
+    def on_read_timeout(self, query, consistency, required_responses,
+                        received_responses, data_retrieved, retry_num):
+        return self._next_host(query, consistency, retry_num)
+
+    def on_write_timeout(self, query, consistency, write_type,
+                         required_responses, received_responses, retry_num):
+        return self._next_host(query, consistency, retry_num)
+
+    def on_unavailable(self, query, consistency, required_replicas, alive_replicas, retry_num):
+        return self._next_host(query, consistency, retry_num)
+
+    def on_request_error(self, query, consistency, error, retry_num):
+        return self._next_host(query, consistency, retry_num)
+
+    def _next_host(self, query, consistency, retry_num):
+        if self.next_host and retry_num == 0 and query is not None and query.is_idempotent:
+            return self.RETRY_NEXT_HOST, consistency
+        return self.RETHROW, None
+
+    def start(self):
+        """
+        :return: The deadline of a request that is attempted now
+        :rtype: float
+        """
+        return timer() + self.deadline
+
+    def next_delay(self, error, idempotent, attempt, deadline):
+        """
+        :param Exception error: The error the attempt failed with
+        :param bool idempotent: Whether the request is idempotent
+        :param int attempt: The number of attempts made so far
+        :param float deadline: The deadline returned by ``start``
+        :return: The time in seconds to wait before the next
+            attempt or None if the error should be raised
+        :rtype: float
+        """
+        if not idempotent or attempt >= self.max_attempts or not isinstance(error, TRANSIENT_ERRORS):
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if timer() + delay > deadline:
+            return None
+        return delay
+
+    def call(self, function, idempotent):
+        """
+        Calls the function until it succeeds or its error
+        should not be retried.
+
+        :param function function: Sends the request
+        :param bool idempotent: Whether the request is idempotent
+        :return: The return value of the function
+        """
+        deadline = self.start()
+        attempt = 0
+        while True:
+            try:
+                return function()
+            except Exception as exc:
+                attempt += 1
+                delay = self.next_delay(exc, idempotent, attempt, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    def call_many(self, execute, statements):
+        """
+        Executes the statements and retries the ones that failed
+        with a transient error together until they succeed or
+        should not be retried anymore.
+
+        :param function execute: Takes a list of statements and returns
+            a list of (success, result or exception) tuples
+        :param list statements:
+        :return: The (success, result or exception) tuples of the
+            last attempt of every statement in the same order
+        :rtype: list
+        """
+        deadline = self.start()
+        outcomes = list(execute(statements))
+        attempt = 1
+        while True:
+            delays = [(index, self.next_delay(result, statements[index].is_idempotent, attempt, deadline))
+                      for index, (success, result) in enumerate(outcomes) if not success]
+            pending = [index for index, delay in delays if delay is not None]
+            if not pending:
+                return outcomes
+            time.sleep(max(delay for _, delay in delays if delay is not None))
+            for index, outcome in zip(pending, execute([statements[index] for index in pending])):
+                outcomes[index] = outcome
+            attempt += 1
@@ -0,0 +1,119 @@
+"""
+Helpers for reading or aggregating a whole table by splitting
+the token ring into ranges that are read concurrently.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import deque, namedtuple
+
+import numbers
+
+#: The smallest token of the Murmur3Partitioner.  No partition has it.
+MIN_TOKEN = -2 ** 63
+
+#: The largest token of the Murmur3Partitioner
+MAX_TOKEN = 2 ** 63 - 1
+
+#: The tokens after ``start`` up to and including ``end``.
+#: ``paging_state`` is where a partially read range resumes.
+TokenRange = namedtuple('TokenRange', ['start', 'end', 'paging_state'])
+
+#: A page of a scan.  ``models`` are the serialized models
+#: read from the ``token_range`` and ``resume`` is the range
+#: to read the rest of it from, or None if it was finished.
+ScanPage = namedtuple('ScanPage', ['token_range', 'models', 'resume'])
+
+
+def split_ring(splits, minimum=MIN_TOKEN, maximum=MAX_TOKEN):
+    """
+    Splits the token ring into contiguous ranges of
+    (almost) equal width that cover all of it.
+
+    :param int splits: The number of ranges
+    :param int minimum: The exclusive start of the ring
+    :param int maximum: The inclusive end of the ring
+    :return: A list of TokenRanges
+    :rtype: list
+    """
+    width = (maximum - minimum) // splits
+    ends = [minimum + width * index for index in range(1, splits)] + [maximum]
+    starts = [minimum] + ends[:-1]
+    return [TokenRange(start, end, None) for start, end in zip(starts, ends)]
+
+
+def scan_pages(fetch_page, ranges, concurrency):
+    """
+    Reads the ranges on a pool of threads with at most
+    ``concurrency`` pages in flight.  The pages of a range are
+    read one after another and a range that has more pages is
+    continued before a new range is started.
+
+    :param function fetch_page: Takes a TokenRange and returns a
+        tuple of the models of its next page and the TokenRange to
+        continue from or None if the range is finished
+    :param list ranges: The TokenRanges to read
+    :param int concurrency: The number of threads
+    :return: A generator of ScanPages in the order they were read
+    :rtype: generator
+    """
+    # Imported here so that the rest of the package works on
+    # python 2 without the futures backport
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    waiting = deque(ranges)
+    pending = {}
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        while waiting or pending:
+            while waiting and len(pending) < concurrency:
+                token_range = waiting.popleft()
+                pending[executor.submit(fetch_page, token_range)] = token_range
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                token_range = pending.pop(future)
+                models, resume = future.result()
+                if resume is not None:
+                    waiting.appendleft(resume)
+                yield ScanPage(token_range, models, resume)
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def sample_ranges(ranges, sample):
+    """
+    :param list ranges: The TokenRanges
+    :param int sample: The number of ranges to keep
+    :return: ``sample`` ranges spread evenly over the ranges
+    :rtype: list
+    """
+    if sample >= len(ranges):
+        return list(ranges)
+    step = len(ranges) / sample
+    return [ranges[int(index * step)] for index in range(sample)]
+
+
+def combine_aggregates(function, values, scale=1):
+    """
+    Combines the aggregates of the token ranges into the
+    aggregate of the table.
+
+    :param unicode function: "count", "sum", "min" or "max"
+    :param list values: The aggregate of each range
+    :param float scale: The factor the counts and sums are multiplied
+        by to estimate the table's from a sample of the ranges
+    :return: The aggregate of all of the ranges
+    """
+    present = [value for value in values if value is not None]
+    if function in ('min', 'max'):
+        return (min if function == 'min' else max)(present) if present else None
+    total = sum(present)
+    if scale == 1:
+        return total
+    if isinstance(total, numbers.Integral):
+        return int(round(total * scale))
+    return total * type(total)(scale)
@@ -0,0 +1,143 @@
+"""
+Compiles row serializers for the CQLManager.  A serializer
+pulls only the requested columns off of a model and converts
+each value with a function chosen by the column's ``db_type``.
+The output is the same as running ``make_json_safe`` on the
+model's dictionary.
+
+A row serializer produces the same dictionary straight from a
+row returned by the driver's ``dict_factory``, without building
+the cqlengine model and its value managers first.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra.cqlengine import columns
+
+from ripozo.utilities import make_json_safe
+
+_IDENTITY_TYPES = frozenset([
+    'ascii', 'bigint', 'blob', 'boolean', 'counter', 'double', 'float',
+    'inet', 'int', 'smallint', 'text', 'timeuuid', 'tinyint', 'uuid',
+    'varchar', 'varint',
+])
+
+
+def _decimal(value):
+    return None if value is None else float(value)
+
+
+def _sequence(converter):
+    if converter is None:
+        return lambda value: None if value is None else list(value)
+    return lambda value: None if value is None else [converter(val) for val in value]
+
+
+def _mapping(converter):
+    if converter is None:
+        return lambda value: None if value is None else dict(value)
+    return lambda value: None if value is None else dict((key, converter(val))
+                                                         for key, val in value.items())
+
+
+def _python(column, converter):
+    to_python = column.to_python
+    if isinstance(column, columns.BaseContainerColumn):
+        # cqlengine turns null collections into empty ones
+        if converter is None:
+            return to_python
+        return lambda value: converter(to_python(value))
+    if converter is None:
+        return lambda value: None if value is None else to_python(value)
+    return lambda value: None if value is None else converter(to_python(value))
+
+
+def column_converter(column):
+    """
+    Chooses the function that makes the column's values json
+    safe.  Returns None when the values can be used as they are.
+
+    :param cassandra.cqlengine.columns.Column column:
+    :return: A function taking the python value and returning
+        the json safe value or None
+    :rtype: function
+    """
+    db_type = column.db_type
+    if db_type in _IDENTITY_TYPES:
+        return None
+    if db_type == 'decimal':
+        return _decimal
+    if isinstance(column, (columns.List, columns.Set)) and not db_type.startswith('frozen'):
+        return _sequence(column_converter(column.value_col))
+    if isinstance(column, columns.Map) and not db_type.startswith('frozen'):
+        return _mapping(column_converter(column.value_col))
+    return make_json_safe
+
+
+def compile_serializer(model, fields_list):
+    """
+    Compiles a function that serializes an instance of
+    the model to a json safe dictionary with the fields
+    in the fields_list.  Fields that are not columns on the
+    model are skipped.
+
+    :param type model: The cqlengine model class
+    :param list fields_list: The names of the fields to serialize
+    :return: A function that takes a model instance and returns a dict
+    :rtype: function
+    """
+    model_columns = model._columns
+    plain = tuple(name for name in fields_list
+                  if name in model_columns and column_converter(model_columns[name]) is None)
+    converted = tuple((name, column_converter(model_columns[name])) for name in fields_list
+                      if name in model_columns and column_converter(model_columns[name]) is not None)
+
+    def serialize(obj):
+        values = obj._values
+        serialized = dict((name, values[name].value) for name in plain)
+        for name, converter in converted:
+            serialized[name] = converter(values[name].value)
+        return serialized
+    return serialize
+
+
+def compile_row_serializer(model, fields_list):
+    """
+    Compiles a function that serializes a row of the model's
+    table to the same dictionary that the serializer compiled by
+    ``compile_serializer`` returns for the model built from the
+    row.  Columns missing from the row are serialized as they
+    are by a model without a value for them.  Polymorphic
+    models are not supported.
+
+    :param type model: The cqlengine model class
+    :param list fields_list: The names of the fields to serialize
+    :return: A function that takes a row as a dictionary
+        keyed by db field name and returns a dict
+    :rtype: function
+    """
+    model_columns = model._columns
+    plain = []
+    converted = []
+    for name in fields_list:
+        if name not in model_columns:
+            continue
+        column = model_columns[name]
+        converter = column_converter(column)
+        if converter is None and type(column).__module__ == columns.__name__ \
+                and column.db_type in _IDENTITY_TYPES:
+            # The driver already returns the python values
+            plain.append((name, column.db_field_name))
+        else:
+            converted.append((name, column.db_field_name, _python(column, converter)))
+    plain = tuple(plain)
+    converted = tuple(converted)
+
+    def serialize(row):
+        serialized = dict((name, row.get(db_name)) for name, db_name in plain)
+        for name, db_name, converter in converted:
+            serialized[name] = converter(row.get(db_name))
+        return serialized
+    return serialize
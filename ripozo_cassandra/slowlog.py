@@ -0,0 +1,317 @@
+"""
+Logs the statements of a manager that take longer than a
+threshold, with what is needed to find the partition and
+the replica that made them slow::
+
+    class MyManager(CQLManager):
+        slow_query_log = SlowQueryLog(threshold=0.2, trace_sample=0.01, redact=True)
+
+Every slow statement is logged as a warning and kept in the
+``entries()`` of the log.  A ``trace_sample`` of the requests
+is sent with cassandra's query tracing enabled.  The trace
+events of a traced request that turns out to be slow are
+fetched in the background, off the request path, and attached
+to its entry once they are available.  Tracing writes the
+events to the ``system_traces`` keyspace so keep the sample small.
+
+Only the statements the manager executes one at a time are
+watched, not the concurrent ones of the bulk operations,
+retrieve_many, count, aggregate and scan.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import deque, namedtuple
+
+from cassandra.cluster import FETCH_SIZE_UNSET
+from cassandra.query import BatchStatement, BoundStatement
+
+from ripozo_cassandra.metrics import current_operation
+
+import datetime
+import hashlib
+import hmac
+import logging
+import os
+import random
+import six
+import threading
+import timeit
+
+_LOGGER = logging.getLogger(__name__)
+
+timer = timeit.default_timer
+
+#: A statement that took at least the threshold.  ``statement`` is the
+#: CQL with its bind markers and ``values`` are the values bound to the
+#: partition key if it is known and to every marker otherwise.
+#: ``fetch_size`` is the page size, ``rows`` the number of rows in the
+#: first page and ``coordinator`` the host that coordinated the request.
+#: ``trace`` is a tuple of TraceSteps if the request was traced.
+SlowQuery = namedtuple('SlowQuery', ['model', 'operation', 'statement', 'values', 'fetch_size',
+                                     'rows', 'coordinator', 'latency', 'error', 'trace'])
+
+#: An event of a query trace.  ``elapsed`` is the time in seconds since
+#: the ``source`` host started working on the request.
+TraceStep = namedtuple('TraceStep', ['description', 'source', 'elapsed', 'thread'])
+
+
+class SlowQueryLog(object):
+    """
+    A thread safe log of slow statements that can
+    be shared by any number of managers.
+
+    :param float threshold: The latency in seconds from which
+        a statement is logged
+    :param float trace_sample: The fraction of the requests
+        sent with query tracing enabled
+    :param bool redact: If True the bound values are replaced
+        by a keyed hash so that equal values can still be told apart
+    :param bytes redact_key: The key of the hash.  Defaults to a
+        random key for the lifetime of the process.  Set it to be
+        able to compare the hashes logged by different processes.
+    :param int max_entries: The number of the most recent
+        entries kept
+    :param float trace_wait: How long in seconds to wait
+        for the trace events of a slow request
+    :param executor: A ``concurrent.futures`` style executor the
+        trace events are fetched on.  Defaults to a daemon thread
+        per trace.
+    """
+
+    def __init__(self, threshold=0.5, trace_sample=0.0, redact=False, max_entries=100, trace_wait=2.0,
+                 redact_key=None, executor=None):
+        self.threshold = threshold
+        self.trace_sample = trace_sample
+        self.redact = redact
+        self.redact_key = redact_key or os.urandom(32)
+        self.trace_wait = trace_wait
+        self.executor = executor
+        self._entries = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def sample_trace(self):
+        """
+        :return: Whether to trace the next request
+        :rtype: bool
+        """
+        return self.trace_sample > 0 and random.random() < self.trace_sample
+
+    def observe(self, model, statement, parameters, latency, result=None, error=None, traced=False):
+        """
+        Records the statement if it was slow.
+
+        :param type model: The cqlengine model class of the manager
+        :param cassandra.query.Statement statement:
+        :param parameters: The parameters if the statement is not bound
+        :param float latency: The time the request took in seconds
+        :param cassandra.cluster.ResultSet result: The result if it succeeded
+        :param Exception error: The error if it failed
+        :param bool traced: Whether the request was traced
+        :return: The entry or None if the statement was not slow.  The
+            trace of a traced request is not part of the returned entry
+            but is added to the one in ``entries()`` once it is fetched.
+        :rtype: SlowQuery
+        """
+        if latency < self.threshold:
+            return None
+        rows = getattr(result, 'current_rows', None)
+        fetch_size = statement.fetch_size
+        entry = SlowQuery(model.__name__, current_operation(), statement_cql(statement),
+                          self._values(statement, parameters),
+                          None if fetch_size is FETCH_SIZE_UNSET else fetch_size,
+                          len(rows) if isinstance(rows, list) else None,
+                          coordinator(result), latency, error, None)
+        with self._lock:
+            self._entries.append(entry)
+        if traced and result is not None:
+            self._submit(self._attach_trace, entry, result)
+        _LOGGER.warning('Slow statement on %s (%.3fs): %s values=%s fetch_size=%s rows=%s coordinator=%s%s',
+                        entry.model, latency, entry.statement, entry.values, entry.fetch_size,
+                        entry.rows, entry.coordinator, '' if error is None else ' error={0!r}'.format(error))
+        return entry
+
+    def entries(self):
+        """
+        :return: The most recent entries, oldest first
+        :rtype: list
+        """
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _values(self, statement, parameters):
+        values = bound_values(statement, parameters)
+        if self.redact:
+            return [redact_value(value, self.redact_key) for value in values]
+        return values
+
+    def _submit(self, function, *args):
+        if self.executor is not None:
+            self.executor.submit(function, *args)
+            return
+        thread = threading.Thread(target=function, args=args)
+        thread.daemon = True
+        thread.start()
+
+    def _attach_trace(self, entry, result):
+        """
+        Fetches the trace events of a slow request, which polls the
+        ``system_traces`` keyspace, and replaces its entry with one
+        that has them.
+        """
+        try:
+            trace = result.get_query_trace(max_wait_sec=self.trace_wait)
+        except Exception as exc:
+            _LOGGER.info('The trace of a slow statement is not available: %s', exc)
+            return
+        if trace is None:
+            return
+        steps = tuple(TraceStep(event.description, six.text_type(event.source), _seconds(event.source_elapsed),
+                                event.thread_name) for event in trace.events)
+        with self._lock:
+            for index, existing in enumerate(self._entries):
+                if existing is entry:
+                    self._entries[index] = entry._replace(trace=steps)
+                    break
+        _LOGGER.info('Trace of the slow statement on %s: %s', entry.model, entry.statement)
+
+
+class _Watch(object):
+    """
+    Times a request from the start of a with block until
+    ``stop`` is called or the block raises.
+    """
+
+    def __init__(self, log, model, statement, parameters):
+        self.log = log
+        self.model = model
+        self.statement = statement
+        self.parameters = parameters
+        self.trace = log.sample_trace()
+        self.started = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_value is not None:
+            self.stop(error=exc_value)
+        return False
+
+    def start(self):
+        self.started = timer()
+        return self
+
+    def stop(self, result=None, error=None):
+        """
+        :return: The entry or None if the request was not slow
+        :rtype: SlowQuery
+        """
+        return self.log.observe(self.model, self.statement, self.parameters, timer() - self.started,
+                                result=result, error=error, traced=self.trace)
+
+
+class _NoWatch(object):
+    trace = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def start(self):
+        return self
+
+    def stop(self, result=None, error=None):
+        return None
+
+
+_NO_WATCH = _NoWatch()
+
+
+def watch(log, model, statement, parameters=None):
+    """
+    :param SlowQueryLog log: The log or None
+    :param type model: The cqlengine model class of the manager
+    :param cassandra.query.Statement statement:
+    :param parameters: The parameters if the statement is not bound
+    :return: A context manager timing the request with a
+        ``stop(result=None, error=None)`` method and a ``trace``
+        attribute telling whether to trace the request.  It does
+        nothing if the log is None.
+    """
+    if log is None:
+        return _NO_WATCH
+    return _Watch(log, model, statement, parameters)
+
+
+def statement_cql(statement):
+    """
+    :param cassandra.query.Statement statement:
+    :return: The CQL of the statement with its bind markers
+    :rtype: unicode
+    """
+    if isinstance(statement, BoundStatement):
+        return statement.prepared_statement.query_string
+    if isinstance(statement, BatchStatement):
+        return 'BATCH of {0} statements'.format(len(statement._statements_and_parameters))
+    return getattr(statement, 'query_string', six.text_type(statement))
+
+
+def bound_values(statement, parameters=None):
+    """
+    :param cassandra.query.Statement statement:
+    :param parameters: The parameters if the statement is not bound
+    :return: The values bound to the partition key if it is
+        known and to every bind marker otherwise
+    :rtype: list
+    """
+    if isinstance(statement, BoundStatement):
+        values = list(statement.raw_values)
+        indexes = statement.prepared_statement.routing_key_indexes
+        if indexes:
+            return [values[index] for index in indexes]
+        return values
+    if isinstance(parameters, dict):
+        return list(parameters.values())
+    return list(parameters or ())
+
+
+def redact_value(value, key):
+    """
+    :param value: The bound value
+    :param bytes key: The secret key of the hash so that
+        guessable values can not be recovered by hashing
+        candidates
+    :return: A short keyed hash of the value
+    :rtype: unicode
+    """
+    if value is None:
+        return None
+    if not isinstance(value, six.binary_type):
+        value = six.text_type(value).encode('utf-8')
+    if isinstance(key, six.text_type):
+        key = key.encode('utf-8')
+    return hmac.new(key, value, hashlib.sha256).hexdigest()[:16]
+
+
+def coordinator(result):
+    """
+    :param cassandra.cluster.ResultSet result:
+    :return: The address of the host that coordinated the request or None
+    """
+    host = getattr(getattr(result, 'response_future', None), 'coordinator_host', None)
+    return None if host is None else six.text_type(host)
+
+
+def _seconds(elapsed):
+    if isinstance(elapsed, datetime.timedelta):
+        return elapsed.total_seconds()
+    return elapsed
@@ -0,0 +1,242 @@
+"""
+Renders the CQL used by the CQLManager and caches
+the prepared statements so that each shape of query
+is only parsed by cassandra once.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import re
+import threading
+
+_LOGGER = logging.getLogger(__name__)
+
+_CONDITION = re.compile(r'\sIF\s', re.IGNORECASE)
+_INCREMENT = re.compile(r'=\s*("[^"]+"|\w+)\s*[+-]\s*\?')
+
+
+def _column_cql(model, name):
+    return model._columns[name].cql
+
+
+def _where_clause(model, where_columns, in_column=None, token_range=False):
+    clauses = ['{0} = ?'.format(_column_cql(model, name)) for name in where_columns]
+    if in_column is not None:
+        clauses.append('{0} IN ?'.format(_column_cql(model, in_column)))
+    if token_range:
+        token = 'token({0})'.format(', '.join(_column_cql(model, name) for name in model._partition_keys))
+        clauses.extend(['{0} > ?'.format(token), '{0} <= ?'.format(token)])
+    if not clauses:
+        return ''
+    return ' WHERE {0}'.format(' AND '.join(clauses))
+
+
+def select_cql(model, select_columns, where_columns, limit=None, in_column=None, token_range=False):
+    """
+    Renders a SELECT statement for the model.
+
+    :param type model: The cqlengine model class
+    :param tuple select_columns: The names of the columns to return
+    :param tuple where_columns: The names of the columns that are
+        bound with equality restrictions
+    :param int limit: An optional LIMIT for the statement
+    :param unicode in_column: An optional column restricted with
+        ``IN ?`` after the where_columns.  A list is bound to it.
+    :param bool token_range: Whether to restrict the token of the
+        partition key to a range.  The exclusive start and inclusive
+        end tokens are bound after the other values.
+    :return: The CQL string with ``?`` bind markers
+    :rtype: unicode
+    """
+    cql = 'SELECT {0} FROM {1}{2}'.format(
+        ', '.join(_column_cql(model, name) for name in select_columns),
+        model.column_family_name(), _where_clause(model, where_columns, in_column=in_column,
+                                                  token_range=token_range))
+    if limit is not None:
+        cql = '{0} LIMIT {1}'.format(cql, int(limit))
+    return cql
+
+
+def aggregate_alias(function, name=None):
+    """
+    :param unicode function: The aggregate function, e.g. "max"
+    :param unicode name: The name of the column or None for ``*``
+    :return: The name of the aggregate's column in the result
+    :rtype: unicode
+    """
+    return function if name is None else '{0}_{1}'.format(function, name)
+
+
+def aggregate_cql(model, aggregates, where_columns, token_range=False, allow_filtering=False):
+    """
+    Renders a SELECT of aggregates of the model's rows.  Every
+    aggregate is selected as its ``aggregate_alias``.
+
+    :param type model: The cqlengine model class
+    :param tuple aggregates: (function, column name) tuples.  The
+        column name is None for ``count(*)``.
+    :param tuple where_columns: The names of the columns restricted to a value
+    :param bool token_range: Whether to restrict the token of the partition key
+    :param bool allow_filtering: Whether to append ``ALLOW FILTERING``
+    :return: The CQL string with ``?`` bind markers
+    :rtype: unicode
+    """
+    selectors = ['{0}({1}) AS "{2}"'.format(function, '*' if name is None else _column_cql(model, name),
+                                           aggregate_alias(function, name))
+                 for function, name in aggregates]
+    cql = 'SELECT {0} FROM {1}{2}'.format(', '.join(selectors), model.column_family_name(),
+                                          _where_clause(model, where_columns, token_range=token_range))
+    if allow_filtering:
+        cql = '{0} ALLOW FILTERING'.format(cql)
+    return cql
+
+
+def insert_cql(model, insert_columns, if_not_exists=False):
+    """
+    Renders an INSERT statement for the model
+
+    :param type model: The cqlengine model class
+    :param tuple insert_columns: The names of the columns being inserted
+    :param bool if_not_exists: Whether to append ``IF NOT EXISTS``
+    :return: The CQL string with ``?`` bind markers
+    :rtype: unicode
+    """
+    cql = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+        model.column_family_name(),
+        ', '.join(_column_cql(model, name) for name in insert_columns),
+        ', '.join('?' for _ in insert_columns))
+    if if_not_exists:
+        cql = '{0} IF NOT EXISTS'.format(cql)
+    return cql
+
+
+def update_cql(model, set_columns, where_columns, if_exists=False):
+    """
+    Renders an UPDATE statement for the model.  The set
+    columns are bound before the where columns.
+
+    :param type model: The cqlengine model class
+    :param tuple set_columns: The names of the columns being updated
+    :param tuple where_columns: The names of the columns identifying the row
+    :param bool if_exists: Whether to append ``IF EXISTS``
+    :return: The CQL string with ``?`` bind markers
+    :rtype: unicode
+    """
+    assignments = ['{0} = ?'.format(_column_cql(model, name)) for name in set_columns]
+    cql = 'UPDATE {0} SET {1}{2}'.format(model.column_family_name(),
+                                         ', '.join(assignments),
+                                         _where_clause(model, where_columns))
+    if if_exists:
+        cql = '{0} IF EXISTS'.format(cql)
+    return cql
+
+
+def counter_cql(model, counter_columns, where_columns):
+    """
+    Renders an UPDATE statement that adds the bound deltas to the
+    counter columns.  The deltas are bound before the where columns.
+
+    :param type model: The cqlengine model class
+    :param tuple counter_columns: The names of the counter columns
+    :param tuple where_columns: The names of the columns identifying the row
+    :return: The CQL string with ``?`` bind markers
+    :rtype: unicode
+    """
+    assignments = ['{0} = {0} + ?'.format(_column_cql(model, name)) for name in counter_columns]
+    return 'UPDATE {0} SET {1}{2}'.format(model.column_family_name(), ', '.join(assignments),
+                                          _where_clause(model, where_columns))
+
+
+def delete_cql(model, where_columns, if_exists=False):
+    """
+    Renders a DELETE statement for the model
+
+    :param type model: The cqlengine model class
+    :param tuple where_columns: The names of the columns identifying the row
+    :param bool if_exists: Whether to append ``IF EXISTS``
+    :return: The CQL string with ``?`` bind markers
+    :rtype: unicode
+    """
+    cql = 'DELETE FROM {0}{1}'.format(model.column_family_name(),
+                                      _where_clause(model, where_columns))
+    if if_exists:
+        cql = '{0} IF EXISTS'.format(cql)
+    return cql
+
+
+def is_idempotent_cql(cql):
+    """
+    :param unicode cql:
+    :return: False if the statement is a lightweight transaction
+        or adds to a column, e.g. a counter, since applying it
+        twice would not have the same effect as applying it once
+    :rtype: bool
+    """
+    return not _CONDITION.search(cql) and not _INCREMENT.search(cql)
+
+
+class StatementCache(object):
+    """
+    Holds one prepared statement per statement key.  A statement
+    is prepared the first time its key is requested and reused
+    afterwards.  If the session changes (for example the connection
+    was set up again) the statement is prepared again against the
+    new session.
+
+    The prepared statements are marked idempotent according to
+    ``is_idempotent_cql``.  Hits and misses are counted per key
+    and are available through :py:meth:`StatementCache.stats`
+    """
+
+    def __init__(self):
+        self._statements = {}
+        self._hits = {}
+        self._misses = {}
+        self._lock = threading.Lock()
+
+    def get(self, session, key, cql):
+        """
+        Gets the prepared statement for the key, preparing
+        the cql if it has not been prepared on this session yet.
+
+        :param cassandra.cluster.Session session: The session to prepare on
+        :param tuple key: A hashable key identifying the statement shape
+        :param unicode cql: The CQL to prepare on a miss
+        :return: The prepared statement
+        :rtype: cassandra.query.PreparedStatement
+        """
+        entry = self._statements.get(key)
+        if entry is not None and entry[0] is session:
+            with self._lock:
+                self._hits[key] = self._hits.get(key, 0) + 1
+            return entry[1]
+        _LOGGER.debug('Preparing statement %s: %s', key, cql)
+        prepared = session.prepare(cql)
+        prepared.is_idempotent = is_idempotent_cql(cql)
+        with self._lock:
+            self._statements[key] = (session, prepared)
+            self._misses[key] = self._misses.get(key, 0) + 1
+        return prepared
+
+    def stats(self):
+        """
+        :return: A dictionary keyed by statement key whose values
+            are dictionaries with ``hits`` and ``misses`` counts
+        :rtype: dict
+        """
+        with self._lock:
+            keys = set(self._hits) | set(self._misses)
+            return dict((key, dict(hits=self._hits.get(key, 0),
+                                   misses=self._misses.get(key, 0))) for key in keys)
+
+    def clear(self):
+        """
+        Drops all of the prepared statements and counters
+        """
+        with self._lock:
+            self._statements.clear()
+            self._hits.clear()
+            self._misses.clear()
@@ -0,0 +1,1579 @@
+"""
+An in-memory stand-in for a cassandra session.  It can be
+registered with cqlengine's connection layer in place of a
+real session so that the managers can be tested, profiled and
+load tested without a cluster.
+
+    session = MemorySession(latency=0.002)
+    session.create_table(MyModel)
+    connection.register_connection('memory', session=session, default=True)
+
+Partitions are kept in murmur3 token order and the rows of a
+partition in clustering order.  It understands the ``SELECT``,
+``INSERT``, ``UPDATE``, ``DELETE``, ``BATCH`` and ``TRUNCATE``
+statements that cqlengine and the CQLManager emit, both with ``?``
+bind markers and with the literals the driver binds into simple
+statements, including lightweight transactions and paging.
+``USING TTL`` and ``USING TIMESTAMP`` are accepted and ignored.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+from decimal import Decimal
+
+from cassandra import InvalidRequest
+from cassandra.cluster import ResultSet, QueryExhausted
+from cassandra.cqltypes import Int32Type, LongType, ListType, SetType
+from cassandra.encoder import Encoder
+from cassandra.metadata import Murmur3Token
+from cassandra.protocol import ColumnMetadata
+from cassandra.query import BatchStatement, BoundStatement, PreparedStatement, \
+    SimpleStatement, FETCH_SIZE_UNSET, UNSET_VALUE, bind_params, named_tuple_factory
+
+import binascii
+import bisect
+import functools
+import hashlib
+import itertools
+import operator
+import re
+import six
+import struct
+import threading
+import uuid
+
+try:
+    from cassandra.cluster import _ConfigMode
+except ImportError:  # Drivers without execution profiles do not look for it
+    _ConfigMode = None
+
+PROTOCOL_VERSION = 4
+
+_TOKENS = re.compile(r"""
+    (?P<space>\s+)
+    |(?P<string>'(?:[^']|'')*')
+    |(?P<quoted>"(?:[^"]|"")*")
+    |(?P<uuid>[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})
+    |(?P<blob>0[xX][0-9a-fA-F]*)
+    |(?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)
+    |(?P<name>[A-Za-z_][A-Za-z0-9_$]*)
+    |(?P<marker>\?)
+    |(?P<symbol><=|>=|!=|[=<>+\-,()\[\]{}:;*.])
+""", re.VERBOSE)
+
+_COMPARISONS = {
+    '=': operator.eq,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '!=': operator.ne,
+}
+
+_INTEGER_TYPES = frozenset(['tinyint', 'smallint', 'int', 'bigint', 'varint', 'counter'])
+_PAGING_STATE = struct.Struct('>Q')
+_PAGING_PART = struct.Struct('>H')
+
+
+@functools.total_ordering
+class _Descending(object):
+    """
+    Reverses the ordering of a clustering value
+    with a descending clustering order.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+
+def _sort_value(cql_type, value):
+    if value is not None and cql_type.typename == 'timeuuid':
+        return value.time, value.bytes
+    return value
+
+
+def _coerce(cql_type, value):
+    """
+    Converts a value parsed from a CQL literal to the python
+    value the driver would return for the type.
+    """
+    if value is None or cql_type is None:
+        return value
+    typename = cql_type.typename
+    try:
+        if typename in ('uuid', 'timeuuid') and isinstance(value, six.string_types):
+            value = uuid.UUID(value)
+        elif typename in ('float', 'double') and isinstance(value, Decimal):
+            value = float(value)
+        elif typename in _INTEGER_TYPES and isinstance(value, Decimal):
+            value = int(value)
+        elif typename == 'decimal' and not isinstance(value, Decimal):
+            value = Decimal(repr(value) if isinstance(value, float) else value)
+        elif typename in ('list', 'set'):
+            value = [_coerce(cql_type.subtypes[0], item) for item in value]
+        elif typename == 'map':
+            value = dict((_coerce(cql_type.subtypes[0], key), _coerce(cql_type.subtypes[1], val))
+                         for key, val in (value.items() if value else ()))
+        elif typename == 'tuple':
+            value = tuple(_coerce(subtype, item) for subtype, item in zip(cql_type.subtypes, value))
+        return cql_type.from_binary(cql_type.to_binary(value, PROTOCOL_VERSION), PROTOCOL_VERSION)
+    except (TypeError, ValueError, AttributeError, struct.error) as exc:
+        raise InvalidRequest('Invalid {0} value {1!r}: {2}'.format(typename, value, exc))
+
+
+def _empty_to_none(value):
+    if value is not None and not isinstance(value, (six.string_types, six.binary_type)) \
+            and hasattr(value, '__len__') and len(value) == 0:
+        return None
+    return value
+
+
+def _routing_key(parts):
+    if len(parts) == 1:
+        return parts[0]
+    return b''.join(struct.pack('>H', len(part)) + part + b'\x00' for part in parts)
+
+
+class _Row(object):
+    """
+    The values of a row.  ``marker`` is True if the row was
+    inserted, in which case it exists even if all of its
+    regular columns are null.
+    """
+    __slots__ = ('values', 'marker')
+
+    def __init__(self, values):
+        self.values = values
+        self.marker = False
+
+
+class _Partition(object):
+    __slots__ = ('key', 'token', 'order', 'rows')
+
+    def __init__(self, key, token):
+        self.key = key
+        self.token = token
+        self.order = []
+        self.rows = {}
+
+    def get(self, sort_key, values=None):
+        row = self.rows.get(sort_key)
+        if row is None and values is not None:
+            row = self.rows[sort_key] = _Row(values)
+            bisect.insort(self.order, sort_key)
+        return row
+
+    def remove(self, sort_key):
+        if self.rows.pop(sort_key, None) is not None:
+            del self.order[bisect.bisect_left(self.order, sort_key)]
+
+    def iter_rows(self, reverse=False, after=None):
+        """
+        Yields the (sort key, row) pairs in clustering order or
+        in reverse, starting after the ``after`` sort key if given.
+        """
+        order = self.order
+        if after is None:
+            order = reversed(order) if reverse else list(order)
+        elif reverse:
+            order = reversed(order[:bisect.bisect_left(order, after)])
+        else:
+            order = order[bisect.bisect_right(order, after):]
+        rows = self.rows
+        for sort_key in order:
+            row = rows.get(sort_key)
+            if row is not None:
+                yield sort_key, row
+
+
+class _Table(object):
+    """
+    The schema and the rows of a table.  Partitions are
+    kept in a ring sorted by their murmur3 token.
+    """
+
+    def __init__(self, keyspace, name, columns, partition_keys, clustering_keys, descending=()):
+        self.keyspace = keyspace
+        self.name = name
+        self.partition_keys = tuple(partition_keys)
+        self.clustering_keys = tuple(clustering_keys)
+        self.primary_keys = self.partition_keys + self.clustering_keys
+        self.descending = frozenset(descending)
+        ordered = list(self.primary_keys) + sorted(name for name in columns if name not in self.primary_keys)
+        self.columns = OrderedDict((name, columns[name]) for name in ordered)
+        self.regular_columns = tuple(name for name in ordered if name not in self.primary_keys)
+        self.is_counter = any(columns[name].typename == 'counter' for name in self.regular_columns)
+        self.partitions = {}
+        self.ring = []
+
+    def column_type(self, name):
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise InvalidRequest('Undefined column name {0} in table {1}.{2}'.format(
+                name, self.keyspace, self.name))
+
+    def token(self, key):
+        parts = [self.columns[name].serialize(value, PROTOCOL_VERSION)
+                 for name, value in zip(self.partition_keys, key)]
+        return Murmur3Token.hash_fn(_routing_key(parts))
+
+    def clustering_sort_key(self, values):
+        sort_key = []
+        for name in self.clustering_keys:
+            value = _sort_value(self.columns[name], values[name])
+            sort_key.append(_Descending(value) if name in self.descending else value)
+        return tuple(sort_key)
+
+    def partition(self, key, create=False):
+        partition = self.partitions.get(key)
+        if partition is None and create:
+            partition = self.partitions[key] = _Partition(key, self.token(key))
+            bisect.insort(self.ring, (partition.token, key))
+        return partition
+
+    def prune(self, partition, sort_key):
+        """
+        Drops the row if it was never inserted and
+        all of its regular columns are null and
+        drops the partition if it is empty.
+        """
+        row = partition.rows.get(sort_key)
+        if row is not None and not row.marker and \
+                all(row.values.get(name) is None for name in self.regular_columns):
+            partition.remove(sort_key)
+        if not partition.rows:
+            self.partitions.pop(partition.key, None)
+            index = bisect.bisect_left(self.ring, (partition.token, partition.key))
+            if index < len(self.ring) and self.ring[index][1] == partition.key:
+                del self.ring[index]
+
+    def iter_partitions(self, lower=None, after=None):
+        """
+        Yields the partitions in ring order from the ``lower``
+        token, or after the (token, key) ``after`` if given.
+        """
+        if after is not None:
+            start = bisect.bisect_right(self.ring, after)
+        else:
+            start = 0 if lower is None else bisect.bisect_left(self.ring, (lower,))
+        for token, key in self.ring[start:]:
+            partition = self.partitions.get(key)
+            if partition is not None:
+                yield partition
+
+    def truncate(self):
+        self.partitions.clear()
+        del self.ring[:]
+
+    def paging_state(self, partition, values, count):
+        """
+        Encodes the position of a row and the number
+        of rows returned so far as a paging_state.
+
+        :param _Partition partition: The partition of the row
+        :param dict values: The values of the row
+        :param int count: The number of rows returned so far
+        :rtype: bytes
+        """
+        parts = [self.columns[name].serialize(value, PROTOCOL_VERSION)
+                 for name, value in zip(self.partition_keys, partition.key)]
+        parts.extend(self.columns[name].serialize(values[name], PROTOCOL_VERSION)
+                     for name in self.clustering_keys)
+        return _PAGING_STATE.pack(count) + b''.join(_PAGING_PART.pack(len(part)) + part for part in parts)
+
+    def resume_position(self, paging_state):
+        """
+        Decodes a paging_state made by ``paging_state``.
+
+        :return: The (token, partition key) of the last row, its
+            clustering sort key and the number of rows returned so far
+        :rtype: tuple
+        """
+        try:
+            count, = _PAGING_STATE.unpack_from(paging_state)
+            offset = _PAGING_STATE.size
+            values = []
+            for name in self.primary_keys:
+                size, = _PAGING_PART.unpack_from(paging_state, offset)
+                offset += _PAGING_PART.size
+                part = paging_state[offset:offset + size]
+                if len(part) != size:
+                    raise ValueError('truncated')
+                values.append(self.columns[name].deserialize(part, PROTOCOL_VERSION))
+                offset += size
+        except (struct.error, ValueError, TypeError) as exc:
+            raise InvalidRequest('Invalid value for the paging state: {0}'.format(exc))
+        key = tuple(values[:len(self.partition_keys)])
+        sort_key = self.clustering_sort_key(dict(zip(self.primary_keys, values)))
+        return (self.token(key), key), sort_key, count
+
+
+class _Const(object):
+    __slots__ = ('constant',)
+
+    def __init__(self, value):
+        self.constant = value
+
+    def value(self, params):
+        return self.constant
+
+
+class _Marker(object):
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+    def value(self, params):
+        return params[self.index]
+
+
+class _Collection(object):
+    """
+    A collection literal holding bind markers
+    """
+
+    def __init__(self, kind, items, cql_type):
+        self.kind = kind
+        self.items = items
+        self.cql_type = cql_type
+
+    def value(self, params):
+        if self.kind == 'map':
+            raw = dict((key.value(params), val.value(params)) for key, val in self.items)
+        else:
+            raw = [item.value(params) for item in self.items]
+        return _coerce(self.cql_type, raw)
+
+
+class _TokenOf(object):
+    """
+    ``token(...)`` of the partition key values
+    """
+
+    def __init__(self, table, terms):
+        self.table = table
+        self.terms = terms
+
+    def value(self, params):
+        return self.table.token(tuple(term.value(params) for term in self.terms))
+
+
+class _Relation(object):
+    """
+    A restriction in a WHERE or IF clause.  column is
+    None for a restriction on the partition token.
+    """
+
+    def __init__(self, column, op, term):
+        self.column = column
+        self.op = op
+        self.term = term
+
+
+class _Tokens(object):
+    def __init__(self, cql):
+        self.tokens = []
+        position = 0
+        while position < len(cql):
+            match = _TOKENS.match(cql, position)
+            if match is None:
+                raise InvalidRequest('line 1:{0} no viable alternative at character {1!r}'.format(
+                    position, cql[position]))
+            position = match.end()
+            if match.lastgroup != 'space':
+                self.tokens.append((match.lastgroup, match.group()))
+        self.position = 0
+
+    def peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise InvalidRequest('Unexpected end of statement')
+        self.position += 1
+        return token
+
+    def is_keyword(self, word, offset=0):
+        kind, text = self.peek(offset)
+        return kind == 'name' and text.upper() == word
+
+    def keyword(self, *words):
+        if all(self.is_keyword(word, offset) for offset, word in enumerate(words)):
+            self.position += len(words)
+            return True
+        return False
+
+    def expect_keyword(self, *words):
+        if not self.keyword(*words):
+            raise InvalidRequest('Expected {0} at {1!r}'.format(' '.join(words), self.peek()[1]))
+
+    def symbol(self, symbol):
+        if self.peek() == ('symbol', symbol):
+            self.position += 1
+            return True
+        return False
+
+    def expect_symbol(self, symbol):
+        if not self.symbol(symbol):
+            raise InvalidRequest('Expected {0!r} at {1!r}'.format(symbol, self.peek()[1]))
+
+    def identifier(self):
+        kind, text = self.next()
+        if kind == 'quoted':
+            return text[1:-1].replace('""', '"')
+        if kind == 'name':
+            return text.lower()
+        raise InvalidRequest('Expected an identifier at {0!r}'.format(text))
+
+    def at_end(self):
+        while self.symbol(';'):
+            pass
+        return self.peek()[0] is None
+
+
+class _Parser(object):
+    """
+    Parses a statement, recording the type of each bind marker
+    """
+
+    def __init__(self, tables, keyspace):
+        self.tables = tables
+        self.keyspace = keyspace
+        self.markers = []
+
+    def parse(self, cql):
+        self.tokens = _Tokens(cql)
+        statement = self.statement()
+        if not self.tokens.at_end():
+            raise InvalidRequest('Unexpected input at {0!r}'.format(self.tokens.peek()[1]))
+        return statement
+
+    def statement(self):
+        tokens = self.tokens
+        if tokens.keyword('SELECT'):
+            return self.select()
+        if tokens.keyword('INSERT', 'INTO'):
+            return self.insert()
+        if tokens.keyword('UPDATE'):
+            return self.update()
+        if tokens.keyword('DELETE'):
+            return self.delete()
+        if tokens.keyword('BEGIN'):
+            return self.batch()
+        if tokens.keyword('TRUNCATE'):
+            tokens.keyword('TABLE')
+            return _Truncate(self.table())
+        raise InvalidRequest('Unsupported statement at {0!r}'.format(tokens.peek()[1]))
+
+    def table(self):
+        name = self.tokens.identifier()
+        keyspace = self.keyspace
+        if self.tokens.symbol('.'):
+            keyspace, name = name, self.tokens.identifier()
+        if keyspace is None:
+            raise InvalidRequest('No keyspace has been specified.')
+        try:
+            return self.tables[(keyspace, name)]
+        except KeyError:
+            raise InvalidRequest('unconfigured table {0}'.format(name))
+
+    def marker(self, name, cql_type):
+        self.markers.append((name, cql_type))
+        return _Marker(len(self.markers) - 1)
+
+    def term(self, name, cql_type):
+        tokens = self.tokens
+        kind, text = tokens.peek()
+        if kind == 'marker':
+            tokens.next()
+            return self.marker(name, cql_type)
+        if kind == 'symbol' and text in '[{(':
+            return self.collection(name, cql_type)
+        if kind == 'name' and tokens.peek(1) == ('symbol', '(') and text.upper() == 'NOW':
+            tokens.next()
+            tokens.expect_symbol('(')
+            tokens.expect_symbol(')')
+            return _Const(uuid.uuid1())
+        return _Const(_coerce(cql_type, self.literal()))
+
+    def literal(self):
+        kind, text = self.tokens.next()
+        if kind == 'symbol' and text == '-':
+            value = self.literal()
+            if not isinstance(value, (six.integer_types, float, Decimal)):
+                raise InvalidRequest('Invalid negation of {0!r}'.format(value))
+            return -value
+        if kind == 'string':
+            return text[1:-1].replace("''", "'")
+        if kind == 'number':
+            return int(text) if text.isdigit() else Decimal(text)
+        if kind == 'uuid':
+            return uuid.UUID(text)
+        if kind == 'blob':
+            return binascii.unhexlify(text[2:])
+        if kind == 'name':
+            upper = text.upper()
+            if upper in ('TRUE', 'FALSE'):
+                return upper == 'TRUE'
+            if upper == 'NULL':
+                return None
+            if upper == 'NAN':
+                return float('nan')
+            if upper == 'INFINITY':
+                return float('inf')
+        raise InvalidRequest('Invalid literal {0!r}'.format(text))
+
+    def collection(self, name, cql_type):
+        tokens = self.tokens
+        subtypes = getattr(cql_type, 'subtypes', None) or ()
+        opening = tokens.next()[1]
+        closing = {'[': ']', '{': '}', '(': ')'}[opening]
+        kind = {'[': 'list', '{': 'set', '(': 'tuple'}[opening]
+        items = []
+        while not tokens.symbol(closing):
+            if items:
+                tokens.expect_symbol(',')
+            if kind == 'tuple':
+                subtype = subtypes[len(items)] if len(subtypes) > len(items) else None
+            else:
+                subtype = subtypes[0] if subtypes else None
+            item = self.term(name, subtype)
+            if kind != 'list' and kind != 'tuple' and tokens.symbol(':'):
+                kind = 'map'
+            if kind == 'map':
+                item = (item, self.term(name, subtypes[1] if len(subtypes) > 1 else None))
+            items.append(item)
+        term = _Collection(kind, items, cql_type)
+        if all(isinstance(item, _Const) for pair in items
+               for item in (pair if kind == 'map' else (pair,))):
+            return _Const(term.value(()))
+        return term
+
+    def relations(self, table):
+        relations = []
+        while True:
+            relations.append(self.relation(table))
+            if not self.tokens.keyword('AND'):
+                return relations
+
+    def relation(self, table):
+        tokens = self.tokens
+        if tokens.is_keyword('TOKEN') and tokens.peek(1) == ('symbol', '('):
+            tokens.next()
+            tokens.expect_symbol('(')
+            names = [tokens.identifier()]
+            while tokens.symbol(','):
+                names.append(tokens.identifier())
+            tokens.expect_symbol(')')
+            if tuple(names) != table.partition_keys:
+                raise InvalidRequest('The token function arguments must be the partition key')
+            op = tokens.next()[1]
+            if tokens.keyword('TOKEN'):
+                tokens.expect_symbol('(')
+                terms = []
+                for index, name in enumerate(names):
+                    if index:
+                        tokens.expect_symbol(',')
+                    terms.append(self.term(name, table.column_type(name)))
+                tokens.expect_symbol(')')
+                return _Relation(None, op, _TokenOf(table, terms))
+            return _Relation(None, op, self.term('partition key token', LongType))
+        name = tokens.identifier()
+        cql_type = table.column_type(name)
+        if tokens.keyword('IN'):
+            if tokens.peek()[0] == 'marker':
+                tokens.next()
+                in_type = ListType.apply_parameters([cql_type])
+                return _Relation(name, 'IN', self.marker('in({0})'.format(name), in_type))
+            tokens.expect_symbol('(')
+            terms = []
+            while not tokens.symbol(')'):
+                if terms:
+                    tokens.expect_symbol(',')
+                terms.append(self.term(name, cql_type))
+            return _Relation(name, 'IN', _Collection('list', terms, None))
+        if tokens.keyword('CONTAINS', 'KEY'):
+            return _Relation(name, 'CONTAINS KEY', self.term(name, cql_type.subtypes[0]))
+        if tokens.keyword('CONTAINS'):
+            subtypes = cql_type.subtypes
+            return _Relation(name, 'CONTAINS', self.term(name, subtypes[-1]))
+        op = tokens.next()[1]
+        if op not in _COMPARISONS:
+            raise InvalidRequest('Unsupported operator {0}'.format(op))
+        return _Relation(name, op, self.term(name, cql_type))
+
+    def using(self):
+        tokens = self.tokens
+        if not tokens.keyword('USING'):
+            return
+        while True:
+            if tokens.keyword('TTL'):
+                self.term('[ttl]', Int32Type)
+            else:
+                tokens.expect_keyword('TIMESTAMP')
+                self.term('[timestamp]', LongType)
+            if not tokens.keyword('AND'):
+                return
+
+    def conditions(self, table):
+        """
+        :return: True for IF EXISTS, a list of relations
+            for IF conditions or None
+        """
+        tokens = self.tokens
+        if not tokens.keyword('IF'):
+            return None
+        if tokens.keyword('EXISTS'):
+            return True
+        if tokens.keyword('NOT', 'EXISTS'):
+            return False
+        return self.relations(table)
+
+    def select(self):
+        tokens = self.tokens
+        distinct = tokens.keyword('DISTINCT')
+        raw_selectors = []
+        if not tokens.symbol('*'):
+            while True:
+                raw_selectors.append(self.selector())
+                if not tokens.symbol(','):
+                    break
+        tokens.expect_keyword('FROM')
+        table = self.table()
+        relations = self.relations(table) if tokens.keyword('WHERE') else []
+        orderings = []
+        if tokens.keyword('ORDER', 'BY'):
+            while True:
+                name = tokens.identifier()
+                table.column_type(name)
+                descending = tokens.keyword('DESC')
+                if not descending:
+                    tokens.keyword('ASC')
+                orderings.append((name, descending))
+                if not tokens.symbol(','):
+                    break
+        limit = None
+        if tokens.keyword('LIMIT'):
+            limit = self.term('[limit]', Int32Type)
+        allow_filtering = tokens.keyword('ALLOW', 'FILTERING')
+        selectors = []
+        for function, name, alias in raw_selectors or [(None, name, None) for name in table.columns]:
+            if name != '*':
+                table.column_type(name)
+            selectors.append((function, name, alias))
+        return _Select(table, selectors, relations, orderings, limit, allow_filtering, distinct)
+
+    def selector(self):
+        tokens = self.tokens
+        function = None
+        if tokens.peek()[0] == 'name' and tokens.peek(1) == ('symbol', '('):
+            function = tokens.next()[1].lower()
+            if function not in _Select.aggregates:
+                raise InvalidRequest('Unknown function {0}'.format(function))
+            tokens.expect_symbol('(')
+            if tokens.symbol('*'):
+                name = '*'
+            elif tokens.peek() == ('number', '1'):
+                tokens.next()
+                name = '*'
+            else:
+                name = tokens.identifier()
+            tokens.expect_symbol(')')
+        else:
+            name = tokens.identifier()
+        alias = tokens.identifier() if tokens.keyword('AS') else None
+        return function, name, alias
+
+    def insert(self):
+        tokens = self.tokens
+        table = self.table()
+        tokens.expect_symbol('(')
+        names = [tokens.identifier()]
+        while tokens.symbol(','):
+            names.append(tokens.identifier())
+        tokens.expect_symbol(')')
+        tokens.expect_keyword('VALUES')
+        tokens.expect_symbol('(')
+        terms = []
+        for index, name in enumerate(names):
+            if index:
+                tokens.expect_symbol(',')
+            terms.append(self.term(name, table.column_type(name)))
+        tokens.expect_symbol(')')
+        if_not_exists = False
+        for _ in range(2):
+            if tokens.keyword('IF', 'NOT', 'EXISTS'):
+                if_not_exists = True
+            self.using()
+        return _Insert(table, list(zip(names, terms)), if_not_exists)
+
+    def update(self):
+        tokens = self.tokens
+        table = self.table()
+        self.using()
+        tokens.expect_keyword('SET')
+        assignments = []
+        while True:
+            assignments.append(self.assignment(table))
+            if not tokens.symbol(','):
+                break
+        tokens.expect_keyword('WHERE')
+        relations = self.relations(table)
+        conditions = self.conditions(table)
+        return _Update(table, assignments, relations, conditions)
+
+    def assignment(self, table):
+        """
+        :return: A (column, operation, key term, value term) tuple.
+            The operation is one of set, append, prepend, remove and element.
+        """
+        tokens = self.tokens
+        name = tokens.identifier()
+        cql_type = table.column_type(name)
+        if tokens.symbol('['):
+            key_type = Int32Type if cql_type.typename == 'list' else cql_type.subtypes[0]
+            key = self.term('key({0})'.format(name), key_type)
+            tokens.expect_symbol(']')
+            tokens.expect_symbol('=')
+            return name, 'element', key, self.term('value({0})'.format(name), cql_type.subtypes[-1])
+        tokens.expect_symbol('=')
+        kind, text = tokens.peek()
+        if kind in ('name', 'quoted') and text.strip('"').lower() == name.lower() \
+                and tokens.peek(1)[0] == 'symbol' and tokens.peek(1)[1] in '+-':
+            tokens.next()
+            operation = 'append' if tokens.next()[1] == '+' else 'remove'
+            value_type = cql_type
+            if cql_type.typename == 'map' and operation == 'remove':
+                value_type = SetType.apply_parameters([cql_type.subtypes[0]])
+            return name, operation, None, self.term(name, value_type)
+        value = self.term(name, cql_type)
+        if tokens.symbol('+'):
+            if tokens.identifier() != name:
+                raise InvalidRequest('Invalid operation for column {0}'.format(name))
+            return name, 'prepend', None, value
+        return name, 'set', None, value
+
+    def delete(self):
+        tokens = self.tokens
+        start = tokens.position
+        while not tokens.is_keyword('FROM'):
+            tokens.next()
+        tokens.next()
+        table = self.table()
+        end = tokens.position
+        tokens.position = start
+        selection = []
+        while not tokens.is_keyword('FROM'):
+            if selection:
+                tokens.expect_symbol(',')
+            name = tokens.identifier()
+            cql_type = table.column_type(name)
+            key = None
+            if tokens.symbol('['):
+                key_type = Int32Type if cql_type.typename == 'list' else cql_type.subtypes[0]
+                key = self.term('key({0})'.format(name), key_type)
+                tokens.expect_symbol(']')
+            selection.append((name, key))
+        tokens.position = end
+        self.using()
+        tokens.expect_keyword('WHERE')
+        relations = self.relations(table)
+        conditions = self.conditions(table)
+        return _Delete(table, selection, relations, conditions)
+
+    def batch(self):
+        tokens = self.tokens
+        tokens.keyword('UNLOGGED') or tokens.keyword('LOGGED') or tokens.keyword('COUNTER')
+        tokens.expect_keyword('BATCH')
+        self.using()
+        statements = []
+        while True:
+            while tokens.symbol(';'):
+                pass
+            if tokens.keyword('APPLY', 'BATCH'):
+                return _Batch(statements)
+            statements.append((self.statement(), None))
+
+
+class _Result(object):
+    """
+    The columns and rows returned by a statement
+    """
+
+    def __init__(self, columns=None, rows=(), paging_state=None):
+        self.columns = columns
+        self.rows = rows
+        self.paging_state = paging_state
+
+
+def _applied(table, applied, row=None, names=()):
+    columns = [('[applied]', None)]
+    values = [applied]
+    for name in names:
+        columns.append((name, table.columns[name]))
+        values.append(None if row is None else row.values.get(name))
+    return _Result(columns, [tuple(values)])
+
+
+def _matches(table, values, relations):
+    for relation, expected in relations:
+        if relation.column is None:
+            continue
+        if not _compare(table.columns[relation.column], values.get(relation.column),
+                        relation.op, expected):
+            return False
+    return True
+
+
+def _compare(cql_type, actual, op, expected):
+    if op == 'IN':
+        return actual is not None and actual in expected
+    if op == 'CONTAINS':
+        if actual is None:
+            return False
+        return expected in (actual.values() if cql_type.typename == 'map' else actual)
+    if op == 'CONTAINS KEY':
+        return actual is not None and expected in actual
+    if actual is None or expected is None:
+        return False
+    return _COMPARISONS[op](_sort_value(cql_type, actual), _sort_value(cql_type, expected))
+
+
+def _resolve(relations, params):
+    return [(relation, relation.term.value(params)) for relation in relations]
+
+
+def _key_values(table, resolved, names, required=True):
+    """
+    Gets the values of the columns restricted with = or IN
+
+    :return: A list of lists of values or None if the
+        columns are not all restricted
+    """
+    candidates = []
+    for name in names:
+        values = None
+        for relation, value in resolved:
+            if relation.column == name and relation.op in ('=', 'IN'):
+                values = [value] if relation.op == '=' else list(value)
+        if values is None:
+            if required:
+                raise InvalidRequest('Some primary key parts are missing: {0}'.format(name))
+            return None
+        if any(value is None for value in values):
+            raise InvalidRequest('Invalid null value for primary key column {0}'.format(name))
+        candidates.append(values)
+    return candidates
+
+
+def _primary_key_rows(table, resolved):
+    """
+    :return: A list of (partition key, clustering values) tuples for
+        every primary key selected by the = and IN restrictions
+    """
+    partition_candidates = _key_values(table, resolved, table.partition_keys)
+    clustering_candidates = _key_values(table, resolved, table.clustering_keys)
+    keys = []
+    for key in itertools.product(*partition_candidates):
+        for clustering in itertools.product(*clustering_candidates):
+            keys.append((key, dict(zip(table.primary_keys, key + clustering))))
+    return keys
+
+
+class _Select(object):
+    aggregates = frozenset(['count', 'min', 'max', 'sum', 'avg'])
+    conditional = False
+
+    def __init__(self, table, selectors, relations, orderings, limit, allow_filtering, distinct):
+        self.table = table
+        self.selectors = selectors
+        self.relations = relations
+        self.orderings = orderings
+        self.limit = limit
+        self.allow_filtering = allow_filtering
+        self.distinct = distinct
+        self.aggregate = any(function is not None for function, _, _ in selectors)
+        self.columns = []
+        for function, name, alias in selectors:
+            if function is None:
+                self.columns.append((alias or name, table.columns[name]))
+            elif function == 'count':
+                self.columns.append((alias or 'count', LongType))
+            else:
+                self.columns.append((alias or 'system.{0}({1})'.format(function, name), table.columns[name]))
+        partition_keys = set(table.partition_keys)
+        restricted = set(relation.column for relation in relations
+                         if relation.column is not None and relation.op in ('=', 'IN'))
+        self.by_partition = partition_keys <= restricted
+        filtered = set(relation.column for relation in relations if relation.column is not None)
+        if not self.by_partition:
+            needs_filtering = bool(filtered)
+        else:
+            needs_filtering = any(name not in table.primary_keys or
+                                  (name in partition_keys and name not in restricted)
+                                  for name in filtered)
+        if needs_filtering and not allow_filtering:
+            raise InvalidRequest('Cannot execute this query as it might involve data filtering and '
+                                 'thus may have unpredictable performance. If you want to execute '
+                                 'this query despite the performance unpredictability, use ALLOW FILTERING')
+        self.reverse = False
+        if orderings:
+            if not self.by_partition:
+                raise InvalidRequest('ORDER BY is only supported when the partition key '
+                                     'is restricted by an EQ or an IN.')
+            name, descending = orderings[0]
+            if name not in table.clustering_keys:
+                raise InvalidRequest('Order by is currently only supported on the clustered columns '
+                                     'of the PRIMARY KEY, got {0}'.format(name))
+            self.reverse = descending != (name in table.descending)
+
+    def partitions(self, resolved, after=None):
+        table = self.table
+        bounds = [(relation.op, value) for relation, value in resolved if relation.column is None]
+        if self.by_partition:
+            keys = itertools.product(*_key_values(table, resolved, table.partition_keys))
+            partitions = [table.partition(key) for key in set(keys)]
+            partitions = sorted((partition for partition in partitions if partition is not None
+                                 and (after is None or (partition.token, partition.key) >= after)),
+                                key=lambda partition: (partition.token, partition.key))
+        else:
+            lower = max([value for op, value in bounds if op in ('>', '>=')] or [None])
+            if after is not None and (lower is None or after[0] >= lower):
+                partitions = itertools.chain(filter(None, [table.partition(after[1])]),
+                                             table.iter_partitions(after=after))
+            else:
+                partitions = table.iter_partitions(lower)
+        for partition in partitions:
+            if all(_COMPARISONS[op](partition.token, value) for op, value in bounds):
+                yield partition
+            elif not self.by_partition and any(op in ('<', '<=') and not _COMPARISONS[op](partition.token, value)
+                                               for op, value in bounds):
+                return
+
+    def iter_rows(self, params, after=None):
+        """
+        Yields the (partition, values) of the selected rows.
+
+        :param tuple after: The position returned by ``resume_position``
+            of the last row already returned or None
+        """
+        resolved = _resolve(self.relations, params)
+        last_partition, last_sort_key = after or (None, None)
+        for partition in self.partitions(resolved, last_partition):
+            resume = None
+            if last_partition is not None and (partition.token, partition.key) == last_partition:
+                if self.distinct:
+                    continue
+                resume = last_sort_key
+            for _, row in partition.iter_rows(reverse=self.reverse, after=resume):
+                if _matches(self.table, row.values, resolved):
+                    yield partition, row.values
+                    if self.distinct:
+                        break
+
+    def execute(self, params, fetch_size=None, paging_state=None):
+        """
+        Selects the rows.  With a fetch_size only one page is
+        read and the paging_state of the result holds the position
+        of its last row, from which the next page resumes.
+        """
+        if self.aggregate:
+            return _Result(self.columns, [self.aggregate_row([values for _, values in self.iter_rows(params)])])
+        after, count = None, 0
+        if paging_state:
+            last_partition, last_sort_key, count = self.table.resume_position(paging_state)
+            after = last_partition, last_sort_key
+        rows = self.iter_rows(params, after)
+        if self.limit is not None:
+            limit = self.limit.value(params)
+            if limit is None or limit <= 0:
+                raise InvalidRequest('LIMIT must be strictly positive')
+            rows = itertools.islice(rows, max(limit - count, 0))
+        next_state = None
+        if fetch_size:
+            rows = list(itertools.islice(rows, fetch_size + 1))
+            if len(rows) > fetch_size:
+                rows = rows[:fetch_size]
+                next_state = self.table.paging_state(rows[-1][0], rows[-1][1], count + fetch_size)
+        names = [name for _, name, _ in self.selectors]
+        return _Result(self.columns, [tuple(values.get(name) for name in names) for _, values in rows],
+                       paging_state=next_state)
+
+    def aggregate_row(self, rows):
+        values = []
+        for function, name, _ in self.selectors:
+            column = [row.get(name) for row in rows] if name != '*' else [True] * len(rows)
+            present = [value for value in column if value is not None]
+            if function is None:
+                values.append(column[0] if column else None)
+            elif function == 'count':
+                values.append(len(present))
+            elif function == 'min':
+                values.append(min(present) if present else None)
+            elif function == 'max':
+                values.append(max(present) if present else None)
+            elif function == 'sum':
+                values.append(sum(present) if present else 0)
+            else:
+                values.append(type(present[0])(sum(present) / len(present)) if present else 0)
+        return tuple(values)
+
+
+class _Insert(object):
+    def __init__(self, table, assignments, if_not_exists):
+        self.table = table
+        self.assignments = assignments
+        self.conditional = if_not_exists
+        names = [name for name, _ in assignments]
+        missing = [name for name in table.primary_keys if name not in names]
+        if missing:
+            raise InvalidRequest('Some primary key parts are missing: {0}'.format(', '.join(missing)))
+        if table.is_counter:
+            raise InvalidRequest('INSERT statements are not allowed on counter tables, use UPDATE instead')
+
+    def target(self, params):
+        table = self.table
+        values = dict((name, term.value(params)) for name, term in self.assignments)
+        for name in table.primary_keys:
+            if values[name] is None or values[name] is UNSET_VALUE:
+                raise InvalidRequest('Invalid null value in condition for column {0}'.format(name))
+        key = tuple(values[name] for name in table.partition_keys)
+        return key, values
+
+    def check(self, params):
+        key, values = self.target(params)
+        partition = self.table.partition(key)
+        row = None
+        if partition is not None:
+            row = partition.rows.get(self.table.clustering_sort_key(values))
+        if row is None:
+            return None
+        return _applied(self.table, False, row, self.table.columns)
+
+    def apply(self, params):
+        table = self.table
+        key, values = self.target(params)
+        partition = table.partition(key, create=True)
+        sort_key = table.clustering_sort_key(values)
+        row = partition.get(sort_key, dict((name, values[name]) for name in table.primary_keys))
+        row.marker = True
+        for name, value in six.iteritems(values):
+            if name not in table.primary_keys and value is not UNSET_VALUE:
+                row.values[name] = _empty_to_none(value)
+
+    def execute(self, params):
+        if self.conditional:
+            failed = self.check(params)
+            if failed is not None:
+                return failed
+        self.apply(params)
+        return _applied(self.table, True) if self.conditional else _Result()
+
+
+class _Write(object):
+    """
+    The shared handling of the conditions of an UPDATE or DELETE
+    """
+
+    def __init__(self, table, relations, conditions):
+        self.table = table
+        self.relations = relations
+        self.conditions = conditions
+        self.conditional = conditions is not None
+
+    def check(self, params):
+        table = self.table
+        keys = _primary_key_rows(table, _resolve(self.relations, params))
+        conditions = None if self.conditions is True else _resolve(self.conditions, params)
+        for key, values in keys:
+            partition = table.partition(key)
+            row = None if partition is None else partition.rows.get(table.clustering_sort_key(values))
+            if self.conditions is True:
+                if row is None:
+                    return _applied(table, False)
+                continue
+            if row is None or not _matches(table, row.values, conditions):
+                names = []
+                for relation, _ in conditions:
+                    if relation.column not in names:
+                        names.append(relation.column)
+                return _applied(table, False, row, names)
+        return None
+
+    def execute(self, params):
+        if self.conditional:
+            failed = self.check(params)
+            if failed is not None:
+                return failed
+        self.apply(params)
+        return _applied(self.table, True) if self.conditional else _Result()
+
+
+class _Update(_Write):
+    def __init__(self, table, assignments, relations, conditions):
+        super(_Update, self).__init__(table, relations, conditions)
+        self.assignments = assignments
+        for name, _, _, _ in assignments:
+            if name in table.primary_keys:
+                raise InvalidRequest('PRIMARY KEY part {0} found in SET part'.format(name))
+
+    def apply(self, params):
+        table = self.table
+        assignments = [(name, operation, key and key.value(params), term.value(params))
+                       for name, operation, key, term in self.assignments]
+        for key, values in _primary_key_rows(table, _resolve(self.relations, params)):
+            partition = table.partition(key, create=True)
+            sort_key = table.clustering_sort_key(values)
+            row = partition.get(sort_key, values)
+            for name, operation, element, value in assignments:
+                if value is UNSET_VALUE:
+                    continue
+                current = row.values.get(name)
+                row.values[name] = _empty_to_none(
+                    self.assign(table.columns[name], current, operation, element, value))
+            table.prune(partition, sort_key)
+
+    @staticmethod
+    def assign(cql_type, current, operation, element, value):
+        typename = cql_type.typename
+        if operation == 'set':
+            return value
+        if operation == 'element':
+            if typename == 'map':
+                updated = dict(current or {})
+                if value is None:
+                    updated.pop(element, None)
+                else:
+                    updated[element] = value
+                return _coerce(cql_type, updated)
+            updated = list(current or [])
+            if not 0 <= element < len(updated):
+                raise InvalidRequest('List index {0} out of bound, list has size {1}'.format(
+                    element, len(updated)))
+            updated[element] = value
+            return updated
+        if typename == 'counter':
+            current = current or 0
+            return current + (value or 0) if operation == 'append' else current - (value or 0)
+        if value is None:
+            return current
+        if typename == 'list':
+            if operation == 'append':
+                return list(current or []) + list(value)
+            if operation == 'prepend':
+                return list(value) + list(current or [])
+            return [item for item in current or [] if item not in value]
+        if typename == 'set':
+            current = set(current or ())
+            updated = current | set(value) if operation == 'append' else current - set(value)
+            return _coerce(cql_type, updated)
+        if typename == 'map':
+            updated = dict(current or {})
+            if operation == 'append':
+                updated.update(value)
+            else:
+                for key in value:
+                    updated.pop(key, None)
+            return _coerce(cql_type, updated)
+        raise InvalidRequest('Invalid operation for {0} column'.format(typename))
+
+
+class _Delete(_Write):
+    def __init__(self, table, selection, relations, conditions):
+        super(_Delete, self).__init__(table, relations, conditions)
+        self.selection = selection
+
+    def apply(self, params):
+        table = self.table
+        resolved = _resolve(self.relations, params)
+        partitions = _key_values(table, resolved, table.partition_keys)
+        selection = [(name, key and key.value(params)) for name, key in self.selection]
+        for key in itertools.product(*partitions):
+            partition = table.partition(key)
+            if partition is None:
+                continue
+            for _, row in list(partition.iter_rows()):
+                if not _matches(table, row.values, resolved):
+                    continue
+                sort_key = table.clustering_sort_key(row.values)
+                if not selection:
+                    partition.remove(sort_key)
+                    continue
+                for name, element in selection:
+                    if element is None:
+                        row.values[name] = None
+                    elif row.values.get(name) is not None:
+                        current = row.values[name]
+                        if table.columns[name].typename == 'map':
+                            current = dict(current)
+                            current.pop(element, None)
+                        else:
+                            current = [item for index, item in enumerate(current) if index != element]
+                        row.values[name] = _empty_to_none(_coerce(table.columns[name], current))
+                table.prune(partition, sort_key)
+            if not partition.rows:
+                table.prune(partition, ())
+
+
+class _Batch(object):
+    """
+    :param list statements: A list of (statement, params) tuples.
+        The params are None for the statements of a BEGIN BATCH
+        statement which share the parameters of the batch.
+    """
+
+    def __init__(self, statements):
+        self.statements = statements
+        self.conditional = any(statement.conditional for statement, _ in statements)
+        for statement, _ in statements:
+            if not isinstance(statement, (_Insert, _Write)):
+                raise InvalidRequest('Only INSERT, UPDATE and DELETE statements are allowed in a batch')
+
+    def execute(self, params):
+        statements = [(statement, params if statement_params is None else statement_params)
+                      for statement, statement_params in self.statements]
+        conditional = self.conditional
+        if conditional:
+            for statement, statement_params in statements:
+                if statement.conditional and statement.check(statement_params) is not None:
+                    return _Result([('[applied]', None)], [(False,)])
+        for statement, statement_params in statements:
+            statement.apply(statement_params)
+        return _Result([('[applied]', None)], [(True,)]) if conditional else _Result()
+
+
+class _Truncate(object):
+    conditional = False
+
+    def __init__(self, table):
+        self.table = table
+
+    def execute(self, params):
+        self.table.truncate()
+        return _Result()
+
+
+class MemoryCluster(object):
+    """
+    The parts of a cassandra.cluster.Cluster that
+    cqlengine and the managers use.
+    """
+    protocol_version = PROTOCOL_VERSION
+    _config_mode = getattr(_ConfigMode, 'LEGACY', None)
+
+    def __init__(self, session):
+        self.sessions = [session]
+        self.metadata = None
+
+    def register_user_type(self, keyspace, user_type, klass):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class MemoryResponseFuture(object):
+    """
+    Stands in for a cassandra.cluster.ResponseFuture.  The
+    callbacks are called on a timer thread when the session
+    has a latency and immediately otherwise.
+    """
+    _continuous_paging_session = None
+    custom_payload = None
+    warnings = None
+
+    def __init__(self, session, query, statement, params, fetch_size, paging_state):
+        self.session = session
+        self.query = query
+        self.row_factory = session.row_factory
+        self._statement = statement
+        self._params = params
+        self._fetch_size = fetch_size
+        self._paging_state = paging_state
+        self._col_names = None
+        self._col_types = None
+        self._final_result = None
+        self._final_exception = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._errbacks = []
+
+    @property
+    def has_more_pages(self):
+        return bool(self._paging_state)
+
+    def _start(self):
+        delay = self.session.delay(self.query)
+        if delay > 0:
+            timer = threading.Timer(delay, self._run)
+            timer.daemon = True
+            timer.start()
+        else:
+            self._run()
+
+    def _run(self):
+        try:
+            result = self.session._run(self._statement, self._params, self._fetch_size, self._paging_state)
+        except Exception as exc:
+            self._set_exception(exc)
+            return
+        rows = result.rows
+        self._paging_state = result.paging_state
+        if result.columns is None:
+            self._col_names = self._col_types = None
+            self._set_result([])
+        else:
+            self._col_names = [name for name, _ in result.columns]
+            self._col_types = [cql_type for _, cql_type in result.columns]
+            self._set_result(self.row_factory(self._col_names, rows))
+
+    def _set_result(self, result):
+        with self._lock:
+            self._final_result = result
+            self._event.set()
+            callbacks = list(self._callbacks)
+        for fn, args, kwargs in callbacks:
+            fn(result, *args, **kwargs)
+
+    def _set_exception(self, exc):
+        with self._lock:
+            self._final_exception = exc
+            self._event.set()
+            errbacks = list(self._errbacks)
+        for fn, args, kwargs in errbacks:
+            fn(exc, *args, **kwargs)
+
+    def start_fetching_next_page(self):
+        if not self._paging_state:
+            raise QueryExhausted()
+        self._event.clear()
+        self._final_result = None
+        self._start()
+
+    def result(self):
+        self._event.wait()
+        if self._final_exception is not None:
+            raise self._final_exception
+        return ResultSet(self, self._final_result)
+
+    def add_callback(self, fn, *args, **kwargs):
+        with self._lock:
+            self._callbacks.append((fn, args, kwargs))
+            done = self._event.is_set() and self._final_exception is None
+        if done:
+            fn(self._final_result, *args, **kwargs)
+        return self
+
+    def add_errback(self, fn, *args, **kwargs):
+        with self._lock:
+            self._errbacks.append((fn, args, kwargs))
+            failed = self._event.is_set() and self._final_exception is not None
+        if failed:
+            fn(self._final_exception, *args, **kwargs)
+        return self
+
+    def add_callbacks(self, callback, errback, callback_args=(), callback_kwargs=None,
+                      errback_args=(), errback_kwargs=None):
+        self.add_callback(callback, *callback_args, **(callback_kwargs or {}))
+        self.add_errback(errback, *errback_args, **(errback_kwargs or {}))
+
+    def clear_callbacks(self):
+        with self._lock:
+            self._callbacks = []
+            self._errbacks = []
+
+    def get_query_trace(self, *args, **kwargs):
+        return None
+
+    def get_all_query_traces(self, *args, **kwargs):
+        return []
+
+
+class MemorySession(object):
+    """
+    An in-memory stand-in for a cassandra.cluster.Session.
+    Tables are created from cqlengine models with
+    :py:meth:`MemorySession.create_table`.
+
+    :param latency: The seconds every request takes to complete,
+        or a function that takes the statement and returns them.
+    """
+    default_fetch_size = 5000
+    default_timeout = 10.0
+    default_consistency_level = None
+    default_serial_consistency_level = None
+
+    def __init__(self, latency=0, keyspace=None):
+        self.latency = latency
+        self.keyspace = keyspace
+        self.hosts = []
+        self.cluster = MemoryCluster(self)
+        self.encoder = Encoder()
+        self.row_factory = named_tuple_factory
+        self.tables = {}
+        self.prepared = {}
+        self.request_count = 0
+        self._lock = threading.RLock()
+
+    def create_table(self, model):
+        """
+        Creates the table for the cqlengine model.  The
+        table is emptied if it already exists.
+
+        :param type model: The cqlengine model class
+        """
+        columns = dict((column.db_field_name, column.cql_type) for column in model._columns.values())
+        partition_keys = [column.db_field_name for column in model._partition_keys.values()]
+        clustering_keys = [column.db_field_name for column in model._clustering_keys.values()]
+        descending = [column.db_field_name for column in model._clustering_keys.values()
+                      if (column.clustering_order or '').upper() == 'DESC']
+        keyspace = model._get_keyspace()
+        name = model._raw_column_family_name()
+        with self._lock:
+            self.tables[(keyspace, name)] = _Table(keyspace, name, columns, partition_keys,
+                                                   clustering_keys, descending)
+
+    def drop_table(self, model):
+        with self._lock:
+            self.tables.pop((model._get_keyspace(), model._raw_column_family_name()), None)
+
+    def set_keyspace(self, keyspace):
+        self.keyspace = keyspace
+
+    def delay(self, query):
+        latency = self.latency
+        return latency(query) if callable(latency) else latency
+
+    def prepare(self, query, custom_payload=None, keyspace=None):
+        """
+        Parses the query and returns a real PreparedStatement
+        so that binding and batching go through the driver.
+
+        :rtype: cassandra.query.PreparedStatement
+        """
+        parser = _Parser(self.tables, keyspace or self.keyspace)
+        with self._lock:
+            statement = parser.parse(query)
+        table = getattr(statement, 'table', None)
+        keyspace_name = table.keyspace if table is not None else keyspace or self.keyspace
+        table_name = table.name if table is not None else None
+        column_metadata = [ColumnMetadata(keyspace_name, table_name, name, cql_type)
+                           for name, cql_type in parser.markers]
+        result_metadata = None
+        if isinstance(statement, _Select):
+            result_metadata = [ColumnMetadata(keyspace_name, table_name, name, cql_type)
+                               for name, cql_type in statement.columns]
+        query_id = hashlib.md5(query.encode('utf-8')).digest()
+        self.prepared[query_id] = statement, parser.markers
+        return PreparedStatement(column_metadata, query_id, self._routing_key_indexes(statement),
+                                 query, keyspace_name, PROTOCOL_VERSION, result_metadata, None)
+
+    @staticmethod
+    def _routing_key_indexes(statement):
+        table = getattr(statement, 'table', None)
+        if table is None:
+            return None
+        if isinstance(statement, _Insert):
+            terms = dict(statement.assignments)
+        else:
+            terms = dict((relation.column, relation.term) for relation in statement.relations
+                         if relation.op == '=' and relation.column is not None)
+        indexes = [getattr(terms.get(name), 'index', None) for name in table.partition_keys]
+        return None if None in indexes else indexes
+
+    def execute(self, query, parameters=None, timeout=None, trace=False, custom_payload=None,
+                execution_profile=None, paging_state=None, host=None, execute_as=None):
+        return self.execute_async(query, parameters, paging_state=paging_state).result()
+
+    def execute_async(self, query, parameters=None, trace=False, custom_payload=None,
+                      timeout=None, execution_profile=None, paging_state=None,
+                      host=None, execute_as=None):
+        """
+        :rtype: MemoryResponseFuture
+        """
+        if isinstance(query, six.string_types):
+            query = SimpleStatement(query)
+        elif isinstance(query, PreparedStatement):
+            query = query.bind(parameters)
+        statement, params = self._statement(query, parameters)
+        fetch_size = query.fetch_size
+        if fetch_size is FETCH_SIZE_UNSET:
+            fetch_size = self.default_fetch_size
+        future = MemoryResponseFuture(self, query, statement, params, fetch_size, paging_state)
+        future._start()
+        return future
+
+    def _statement(self, query, parameters):
+        """
+        :return: The parsed statement and its parameters
+        """
+        if isinstance(query, BoundStatement):
+            return self._bound(query.prepared_statement.query_id, query.values)
+        if isinstance(query, BatchStatement):
+            statements = []
+            for is_prepared, statement, values in query._statements_and_parameters:
+                if is_prepared:
+                    statements.append(self._bound(statement, values))
+                else:
+                    statements.append((self._parse(statement, query.keyspace), ()))
+            return _Batch(statements), ()
+        query_string = query.query_string
+        if parameters:
+            query_string = bind_params(query_string, parameters, self.encoder)
+        return self._parse(query_string, query.keyspace), ()
+
+    def _parse(self, query_string, keyspace):
+        with self._lock:
+            return _Parser(self.tables, keyspace or self.keyspace).parse(query_string)
+
+    def _bound(self, query_id, values):
+        try:
+            statement, markers = self.prepared[query_id]
+        except KeyError:
+            raise InvalidRequest('Prepared query with ID {0} not found'.format(
+                binascii.hexlify(query_id).decode('ascii')))
+        params = []
+        for value, (_, cql_type) in zip(values, markers):
+            if value is UNSET_VALUE or value is None:
+                params.append(value)
+            else:
+                params.append(cql_type.from_binary(value, PROTOCOL_VERSION))
+        return statement, params
+
+    def _run(self, statement, params, fetch_size=None, paging_state=None):
+        with self._lock:
+            self.request_count += 1
+            if isinstance(statement, _Select):
+                return statement.execute(params, fetch_size, paging_state)
+            result = statement.execute(params)
+            result.rows = list(result.rows)
+            return result
+
+    def submit(self, fn, *args, **kwargs):
+        thread = threading.Thread(target=fn, args=args, kwargs=kwargs)
+        thread.daemon = True
+        thread.start()
+
+    def shutdown(self):
+        pass
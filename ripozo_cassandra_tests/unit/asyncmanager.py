@@ -0,0 +1,288 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra import OperationTimedOut
+from ripozo.exceptions import NotFoundException
+
+from ripozo_cassandra.limits import AdaptiveLimiter, SaturatedException
+from ripozo_cassandra.metrics import MemorySink
+from ripozo_cassandra.retries import RetryPolicy
+from ripozo_cassandra.slowlog import SlowQueryLog
+from cassandra.cqlengine import connection
+
+from ripozo_cassandra_tests.memory import MemorySession
+from ripozo_cassandra_tests.unit.cqlmanager import UnitCounterModel, UnitModel
+from ripozo_cassandra_tests.unit.memory import MemoryModel, _CONNECTION
+
+import mock
+import sys
+import threading
+import unittest2
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from ripozo_cassandra.asyncmanager import AsyncCQLManager
+
+    class AsyncUnitManager(AsyncCQLManager):
+        model = UnitModel
+        fields = ('id', 'value',)
+        create_fields = ('id', 'value',)
+        update_fields = ('value',)
+
+    class AsyncCounterManager(AsyncCQLManager):
+        model = UnitCounterModel
+        fields = ('id', 'day', 'hits',)
+        update_fields = ('hits',)
+
+    class AsyncMemoryManager(AsyncCQLManager):
+        model = MemoryModel
+        fields = ('id', 'created', 'value',)
+        create_fields = ('id', 'created', 'value',)
+        stream_fetch_size = 2
+        scan_splits = 4
+
+
+def _response_future(*pages):
+    """
+    A stand in for the driver's ResponseFuture
+    that returns the pages one at a time.
+    """
+    pages = list(pages)
+    response_future = mock.MagicMock(_col_names=None, _col_types=None)
+    response_future.has_more_pages = len(pages) > 1
+    callbacks = []
+
+    def _next_page():
+        response_future.has_more_pages = len(pages) > 1
+        callbacks[0](pages.pop(0))
+
+    def _add_callbacks(callback, errback):
+        callbacks.append(callback)
+        _next_page()
+
+    response_future.add_callbacks.side_effect = _add_callbacks
+    response_future.start_fetching_next_page.side_effect = _next_page
+    return response_future
+
+
+@unittest2.skipIf(sys.version_info < (3, 5), 'asyncio coroutines require python 3.5')
+class TestAsyncCQLManager(unittest2.TestCase):
+    def setUp(self):
+        AsyncUnitManager._statement_cache = None
+        self.session = mock.MagicMock()
+        patcher = mock.patch.object(AsyncUnitManager, '_get_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def run_coroutine(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_retrieve(self):
+        self.session.execute_async.return_value = _response_future([dict(id='a', value='b')])
+        resp = self.run_coroutine(AsyncUnitManager().retrieve(dict(id='a')))
+        self.assertDictEqual(resp, dict(id='a', value='b'))
+        self.assertFalse(self.session.execute.called)
+
+    def test_retrieve_not_found(self):
+        self.session.execute_async.return_value = _response_future([])
+        self.assertRaises(NotFoundException, self.run_coroutine,
+                          AsyncUnitManager().retrieve(dict(id='a')))
+
+    def test_retrieve_many(self):
+        self.session.execute_async.side_effect = [_response_future([dict(id='a', value='b')]),
+                                                  _response_future([])]
+        results = self.run_coroutine(AsyncUnitManager().retrieve_many([dict(id='a'), dict(id='b')]))
+        self.assertListEqual(results, [dict(id='a', value='b'), None])
+
+    def test_retrieve_list_all_pages(self):
+        self.session.execute_async.return_value = _response_future(
+            [dict(id='a', value='1')], [dict(id='b', value='2')])
+        models, meta = self.run_coroutine(AsyncUnitManager().retrieve_list({'count': 5}))
+        self.assertListEqual(models, [dict(id='a', value='1'), dict(id='b', value='2')])
+        self.assertIsNone(meta['next'])
+        self.assertEqual(meta['count'], 5)
+
+    def test_update(self):
+        self.session.execute_async.side_effect = [_response_future([dict(id='a', value='b')]),
+                                                  _response_future([])]
+        resp = self.run_coroutine(AsyncUnitManager().update(dict(id='a'), dict(value='c')))
+        self.assertDictEqual(resp, dict(id='a', value='c'))
+        self.assertEqual(self.session.execute_async.call_count, 2)
+
+    def test_increment(self):
+        self.session.execute_async.side_effect = [_response_future([dict(id='a', day=1)]),
+                                                  _response_future([]), _response_future([])]
+        with mock.patch.object(AsyncCounterManager, '_get_session', return_value=self.session):
+            resp = self.run_coroutine(AsyncCounterManager().increment(dict(id='a'), dict(hits=2)))
+            self.run_coroutine(AsyncCounterManager().update(dict(id='a', day=1), dict(hits=3)))
+        self.assertDictEqual(resp, dict(id='a', day=1))
+        self.assertEqual(self.session.execute_async.call_count, 3)
+        self.assertListEqual([call[0][0] for call in self.session.prepare.return_value.bind.call_args_list],
+                             [['a'], [2, 'a', 1], [3, 'a', 1]])
+
+    def test_delete(self):
+        self.session.execute_async.side_effect = [_response_future([dict(id='a', value='b')]),
+                                                  _response_future([])]
+        self.assertDictEqual(self.run_coroutine(AsyncUnitManager().delete(dict(id='a'))), {})
+
+    def test_error(self):
+        response_future = mock.MagicMock()
+        response_future.add_callbacks.side_effect = lambda callback, errback: errback(ValueError())
+        self.session.execute_async.return_value = response_future
+        self.assertRaises(ValueError, self.run_coroutine, AsyncUnitManager().retrieve(dict(id='a')))
+
+    def test_metrics(self):
+        manager = AsyncUnitManager()
+        manager.metrics_sink = MemorySink()
+        self.session.execute_async.return_value = _response_future([dict(id='a', value='b')])
+        self.run_coroutine(manager.retrieve(dict(id='a')))
+        response_future = mock.MagicMock()
+        response_future.add_callbacks.side_effect = lambda callback, errback: errback(ValueError())
+        self.session.execute_async.return_value = response_future
+        self.assertRaises(ValueError, self.run_coroutine, manager.retrieve(dict(id='a')))
+        stats = manager.metrics_sink.snapshot()['retrieve']['UnitModel']
+        self.assertEqual(stats['calls'], 1)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['total']['count'], 2)
+        self.assertEqual(stats['query']['count'], 1)
+        self.assertNotIn('decode', stats)
+        self.assertEqual(stats['serialize']['count'], 1)
+
+    def test_fan_out(self):
+        manager = AsyncUnitManager()
+        manager.fail_create_if_exists = False
+        copy = mock.MagicMock()
+        self.session.execute_async.side_effect = lambda *args, **kwargs: _response_future([])
+        with mock.patch.object(manager, '_fan_out_inserts', return_value=[copy]):
+            with mock.patch('ripozo_cassandra.asyncmanager.batch_statement') as batch_statement:
+                self.run_coroutine(manager.create(dict(id='a', value='b')))
+                self.assertEqual(self.session.execute_async.call_count, 1)
+                self.assertIs(self.session.execute_async.call_args[0][0], batch_statement.return_value)
+                self.assertIs(batch_statement.call_args[0][0][1], copy)
+                manager.fan_out_batches = False
+                self.run_coroutine(manager.create(dict(id='b', value='c')))
+        self.assertEqual(self.session.execute_async.call_count, 3)
+        self.assertIs(self.session.execute_async.call_args[0][0], copy)
+
+    def test_limiter(self):
+        manager = AsyncUnitManager()
+        manager.limiter = AdaptiveLimiter(limit=1, max_limit=1, max_wait=5)
+        self.session.execute_async.side_effect = lambda *args, **kwargs: _response_future([dict(id='a')])
+        started = manager.limiter.acquire()
+        timer = threading.Timer(0.01, manager.limiter.release, (started,))
+        timer.start()
+        self.addCleanup(timer.join)
+        self.assertDictEqual(self.run_coroutine(manager.retrieve(dict(id='a'))), dict(id='a', value=None))
+        self.assertEqual(manager.limiter.in_flight, 0)
+        manager.limiter.max_wait = 0
+        manager.limiter.acquire()
+        self.assertRaises(SaturatedException, self.run_coroutine, manager.retrieve(dict(id='a')))
+        self.assertEqual(self.session.execute_async.call_count, 1)
+
+    def test_limiter_cancelled(self):
+        manager = AsyncUnitManager()
+        manager.limiter = AdaptiveLimiter(limit=1, max_limit=1, max_wait=None)
+        started = manager.limiter.acquire()
+
+        # No async syntax so that the module still compiles on python 2
+        waiter = asyncio.ensure_future(manager._acquire_async(), loop=self.loop)
+        self.run_coroutine(asyncio.sleep(0.01))
+        waiter.cancel()
+        self.run_coroutine(asyncio.sleep(0))
+        self.assertTrue(waiter.cancelled())
+        manager.limiter.release(started)
+        self.assertEqual(manager.limiter.in_flight, 0)
+        self.assertListEqual(manager.limiter._listeners, [])
+
+    def test_slow_query_log(self):
+        manager = AsyncUnitManager()
+        manager.slow_query_log = SlowQueryLog(threshold=0)
+        self.session.execute_async.return_value = _response_future([dict(id='a', value='b')])
+        with mock.patch('ripozo_cassandra.slowlog._LOGGER'):
+            self.run_coroutine(manager.retrieve(dict(id='a')))
+            manager.slow_query_log.trace_sample = 1
+            self.session.execute_async.return_value = _response_future([dict(id='a', value='b')])
+            self.run_coroutine(manager.retrieve(dict(id='a')))
+            # The traced entry is recorded in the default executor
+            for _ in range(100):
+                if len(manager.slow_query_log.entries()) == 2:
+                    break
+                self.run_coroutine(asyncio.sleep(0.01))
+        self.assertTrue(self.session.execute_async.call_args[1]['trace'])
+        first, traced = manager.slow_query_log.entries()
+        self.assertEqual(first.rows, 1)
+        self.assertIsNone(first.trace)
+        self.assertEqual(traced.rows, 1)
+
+    def test_retry_policy(self):
+        manager = AsyncUnitManager()
+        manager.retry_policy = RetryPolicy(base_delay=0)
+        failed = mock.MagicMock()
+        failed.add_callbacks.side_effect = lambda callback, errback: errback(OperationTimedOut())
+        self.session.execute_async.side_effect = [failed, _response_future([dict(id='a', value='b')])]
+        self.assertDictEqual(self.run_coroutine(manager.retrieve(dict(id='a'))), dict(id='a', value='b'))
+        self.assertEqual(self.session.execute_async.call_count, 2)
+        self.session.prepare.return_value.bind.return_value.is_idempotent = False
+        self.session.execute_async.side_effect = [failed, _response_future([])]
+        self.assertRaises(OperationTimedOut, self.run_coroutine, manager.create(dict(id='a', value='b')))
+        self.assertEqual(self.session.execute_async.call_count, 3)
+
+
+@unittest2.skipIf(sys.version_info < (3, 5), 'asyncio coroutines require python 3.5')
+class TestAsyncBlockingOperations(unittest2.TestCase):
+    def setUp(self):
+        AsyncMemoryManager._statement_cache = None
+        self.session = MemorySession()
+        self.session.create_table(MemoryModel)
+        connection.register_connection(_CONNECTION, session=self.session)
+        self.addCleanup(connection.unregister_connection, _CONNECTION)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.manager = AsyncMemoryManager()
+        values_list = [dict(id='a', created=created, value='v') for created in range(5)]
+        values_list.append(dict(id='b', created=1, value='w'))
+        results = self.run_coroutine(self.manager.bulk_create(values_list))
+        self.assertTrue(all(result.error is None for result in results))
+
+    def run_coroutine(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def collect(self, iterator):
+        # No async syntax so that the module still compiles on python 2
+        items = []
+        while True:
+            try:
+                items.append(self.run_coroutine(iterator.__anext__()))
+            except StopAsyncIteration:
+                return items
+
+    def test_iter_list(self):
+        with mock.patch.object(self.session, 'execute', wraps=self.session.execute) as blocking:
+            with mock.patch.object(self.session, 'execute_async', wraps=self.session.execute_async) as execute:
+                models = self.collect(self.manager.iter_list({'id': 'a'}))
+        self.assertListEqual([model['created'] for model in models], [4, 3, 2, 1, 0])
+        self.assertEqual(execute.call_count, 3)
+        self.assertFalse(blocking.called)
+
+    def test_scan(self):
+        models = self.collect(self.manager.scan())
+        self.assertEqual(len(models), 6)
+        pages = self.collect(self.manager.scan_pages())
+        self.assertEqual(sum(len(page.models) for page in pages), 6)
+
+    def test_count_and_aggregate(self):
+        self.assertEqual(self.run_coroutine(self.manager.count({})), 6)
+        self.assertEqual(self.run_coroutine(self.manager.count({'id': 'a'})), 5)
+        aggregates = self.run_coroutine(self.manager.aggregate({'id': 'a'}, 'created'))
+        self.assertEqual(aggregates['max'], 4)
+
+    def test_bulk_and_columns(self):
+        results = self.run_coroutine(self.manager.bulk_delete([dict(id='b', created=1)]))
+        self.assertIsNone(results[0].error)
+        columns, meta = self.run_coroutine(self.manager.retrieve_columns({'id': 'a', 'count': 2}))
+        self.assertListEqual(list(columns['created']), [4, 3])
+        self.assertEqual(self.run_coroutine(self.manager.count({})), 5)
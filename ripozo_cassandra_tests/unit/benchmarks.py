@@ -0,0 +1,38 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra.cqlengine import connection
+
+import json
+import mock
+import os
+import runpy
+import six
+import sys
+import unittest2
+
+_BENCHMARKS = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, 'benchmarks')
+
+
+class TestOperationsBenchmark(unittest2.TestCase):
+    def run_benchmark(self, *args):
+        argv = ['operations.py', '--iterations', '3', '--warmup', '1', '--rows', '20',
+                '--page-sizes', '5'] + list(args)
+        output = six.StringIO()
+        with mock.patch.object(sys, 'argv', argv):
+            with mock.patch.object(sys, 'stdout', output):
+                runpy.run_path(os.path.join(_BENCHMARKS, 'operations.py'), run_name='__main__')
+        return json.loads(output.getvalue())
+
+    def test_canned(self):
+        report = self.run_benchmark()
+        self.assertEqual(report['session'], 'canned')
+        self.assertIn('retrieve_list[count=5]', report['results'])
+
+    def test_memory(self):
+        self.addCleanup(connection.unregister_connection, 'benchmarks')
+        report = self.run_benchmark('--session', 'memory')
+        self.assertEqual(report['session'], 'memory')
+        self.assertIn('delete', report['results'])
@@ -0,0 +1,36 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra.query import BatchStatement, BatchType, SimpleStatement
+
+from ripozo_cassandra.bulk import batch_statement, partition_batches
+
+import unittest2
+
+
+class TestBulk(unittest2.TestCase):
+    def test_partition_batches(self):
+        entries = [('a', 1), ('b', 2), ('a', 3), ('a', 4), ('c', 5)]
+        batches = partition_batches(entries, lambda entry: entry[0], 2)
+        self.assertListEqual(batches, [[('a', 1), ('a', 3)], [('a', 4)],
+                                       [('b', 2)], [('c', 5)]])
+
+    def test_batch_statement_single(self):
+        statement = SimpleStatement('DELETE FROM blah')
+        self.assertIs(batch_statement([statement]), statement)
+
+    def test_batch_statement(self):
+        statements = [SimpleStatement('DELETE FROM blah'), SimpleStatement('DELETE FROM duh')]
+        batch = batch_statement(statements)
+        self.assertIsInstance(batch, BatchStatement)
+        self.assertEqual(len(batch), 2)
+
+    def test_batch_statement_idempotent(self):
+        statements = [SimpleStatement('DELETE FROM blah', is_idempotent=True),
+                      SimpleStatement('DELETE FROM duh', is_idempotent=True)]
+        self.assertTrue(batch_statement(statements).is_idempotent)
+        self.assertFalse(batch_statement(statements, batch_type=BatchType.COUNTER).is_idempotent)
+        statements.append(SimpleStatement('DELETE FROM meh'))
+        self.assertFalse(batch_statement(statements).is_idempotent)
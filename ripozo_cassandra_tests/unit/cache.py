@@ -0,0 +1,74 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from ripozo_cassandra.cache import ClientCache, LRUCache, make_key
+
+import mock
+import unittest2
+
+
+class TestLRUCache(unittest2.TestCase):
+    def test_get_set_delete(self):
+        cache = LRUCache()
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', dict(x=1))
+        self.assertDictEqual(cache.get('a'), dict(x=1))
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+        self.assertDictEqual(cache.stats(), dict(hits=1, misses=2, evictions=0))
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_ttl(self):
+        now = [100]
+        cache = LRUCache(ttl=10, timer=lambda: now[0])
+        cache.set('a', 1)
+        now[0] = 109
+        self.assertEqual(cache.get('a'), 1)
+        now[0] = 110
+        self.assertIsNone(cache.get('a'))
+        self.assertDictEqual(cache.stats(), dict(hits=1, misses=1, evictions=1))
+
+
+class TestClientCache(unittest2.TestCase):
+    def test_delegates_to_client(self):
+        client = mock.MagicMock()
+        client.get.side_effect = [None, dict(x=1)]
+        cache = ClientCache(client, ttl=30)
+        cache.set('a', dict(x=1))
+        client.set.assert_called_once_with('a', dict(x=1), 30)
+        self.assertIsNone(cache.get('a'))
+        self.assertDictEqual(cache.get('a'), dict(x=1))
+        cache.delete('a')
+        client.delete.assert_called_once_with('a')
+        self.assertDictEqual(cache.stats(), dict(hits=1, misses=1, evictions=0))
+
+
+class TestMakeKey(unittest2.TestCase):
+    def test_make_key(self):
+        key = make_key('ks.table', ('a', 1))
+        self.assertTrue(key.startswith('ks.table:'))
+        self.assertEqual(key, make_key('ks.table', ('a', 1)))
+        self.assertNotEqual(key, make_key('ks.table', ('a', 2)))
+        self.assertNotIn(' ', key)
+
+    def test_make_key_is_canonical(self):
+        # The same on every python version so that processes can share a cache
+        self.assertEqual(make_key('ks.table', ('a', 1)), 'ks.table:5dd7d1bee2c44f5bc81a777e224916b0845a36c5')
+        self.assertNotEqual(make_key('ks.table', ('a',)), make_key('ks.table', (b'a',)))
+        self.assertNotEqual(make_key('ks.table', ('1',)), make_key('ks.table', (1,)))
+        self.assertNotEqual(make_key('ks.table', ('ab', 'c')), make_key('ks.table', ('a', 'bc')))
+        self.assertNotEqual(make_key('ks.table', (True,)), make_key('ks.table', (1,)))
+        self.assertEqual(make_key('ks.table', [1.5, None]), make_key('ks.table', (1.5, None)))
@@ -0,0 +1,78 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra.cqlengine import connection
+
+from ripozo_cassandra import columnar
+from ripozo_cassandra.columnar import column_length, numpy_session, pages_to_columns, rows_to_columns
+from ripozo_cassandra_tests.memory import MemorySession
+from ripozo_cassandra_tests.unit.memory import MemoryManager, MemoryModel, _CONNECTION
+
+import mock
+import unittest2
+
+
+class TestColumnar(unittest2.TestCase):
+    def test_rows_to_columns(self):
+        columns = rows_to_columns([dict(id='a', value=1), dict(id='b', value=None)], ['id', 'value'])
+        self.assertDictEqual(columns, dict(id=['a', 'b'], value=[1, None]))
+        self.assertEqual(column_length(columns), 2)
+        self.assertEqual(column_length({}), 0)
+
+    @unittest2.skipIf(columnar.numpy is None, 'numpy is not installed')
+    def test_pages_to_columns(self):
+        numpy = columnar.numpy
+        pages = [dict(id=numpy.array(['a', 'b'])), dict(id=numpy.array(['c']))]
+        self.assertListEqual(list(pages_to_columns(pages, ['id'])['id']), ['a', 'b', 'c'])
+        self.assertEqual(len(pages_to_columns([], ['id'])['id']), 0)
+
+    def test_numpy_session_unavailable(self):
+        with mock.patch.object(columnar, 'NumpyProtocolHandler', None):
+            self.assertRaises(ImportError, numpy_session, mock.MagicMock())
+
+
+class TestManagerColumns(unittest2.TestCase):
+    def setUp(self):
+        MemoryManager._statement_cache = None
+        self.session = MemorySession()
+        self.session.create_table(MemoryModel)
+        connection.register_connection(_CONNECTION, session=self.session)
+        self.addCleanup(connection.unregister_connection, _CONNECTION)
+        for created in range(5):
+            MemoryModel.create(id='a', created=created, value=str(created))
+
+    def _assert_same_pages(self, manager, filters):
+        models, meta = manager.retrieve_list(dict(filters))
+        columns, column_meta = manager.retrieve_columns(dict(filters))
+        self.assertDictEqual(column_meta, meta)
+        self.assertListEqual(sorted(columns), sorted(manager.fields))
+        self.assertListEqual([dict((name, columns[name][index]) for name in columns)
+                              for index in range(len(models))], models)
+        return meta
+
+    def test_pagination_pks(self):
+        manager = MemoryManager()
+        manager.paging_state_cursors = False
+        meta = self._assert_same_pages(manager, {'count': 2})
+        self.assertListEqual(meta['pagination_pk'], ['a', 2])
+        self._assert_same_pages(manager, {'count': 10})
+
+    def test_cursors(self):
+        manager = MemoryManager()
+        meta = self._assert_same_pages(manager, {'count': 3})
+        meta = self._assert_same_pages(manager, {'count': 3, 'cursor': meta['cursor']})
+        self.assertIsNone(meta['cursor'])
+
+    def test_columnar_session(self):
+        manager = MemoryManager()
+        manager.columnar_session = mock.MagicMock()
+        manager.columnar_session.execute.return_value.current_rows = []
+        manager.columnar_session.execute.return_value.paging_state = None
+        with mock.patch('ripozo_cassandra.cqlmanager.pages_to_columns',
+                        return_value=dict(id=[], created=[], value=[])) as pages:
+            columns, meta = manager.retrieve_columns({'count': 3})
+        self.assertDictEqual(columns, dict(id=[], created=[], value=[]))
+        pages.assert_called_once_with([], ['id', 'created', 'value'])
+        self.assertNotIn('execution_profile', manager.columnar_session.execute.call_args[1])
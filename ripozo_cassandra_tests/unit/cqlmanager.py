@@ -3,13 +3,416 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from cassandra import ConsistencyLevel
+from cassandra.cluster import FETCH_SIZE_UNSET
+from cassandra.concurrent import ExecutionResult
+from cassandra.cqlengine import columns
+from cassandra.cqlengine.models import Model
+from cassandra.cqlengine.query import LWTException
+from cassandra.query import BoundStatement
+
+from ripozo.exceptions import NotFoundException, ValidationException
+
+from ripozo_cassandra.cache import LRUCache
 from ripozo_cassandra.cqlmanager import CQLManager
 
 import mock
+import six
 import unittest2
 
 
+class UnitModel(Model):
+    __keyspace__ = 'ks'
+    __table_name__ = 'unit_model'
+    id = columns.Text(primary_key=True)
+    value = columns.Text()
+
+
+class UnitClusteredModel(Model):
+    __keyspace__ = 'ks'
+    __table_name__ = 'unit_clustered_model'
+    id = columns.Text(partition_key=True)
+    created = columns.Integer(primary_key=True)
+    value = columns.Text()
+    payload = columns.Blob()
+
+
+class UnitCounterModel(Model):
+    __keyspace__ = 'ks'
+    __table_name__ = 'unit_counter_model'
+    id = columns.Text(partition_key=True)
+    day = columns.Integer(primary_key=True)
+    hits = columns.Counter()
+    misses = columns.Counter()
+
+
+class UnitManager(CQLManager):
+    model = UnitModel
+    fields = ('id', 'value',)
+    create_fields = ('id', 'value',)
+    update_fields = ('value',)
+
+
 class TestCQLManager(unittest2.TestCase):
+    def setUp(self):
+        UnitManager._statement_cache = None
+        self.session = mock.MagicMock()
+        patcher = mock.patch.object(UnitManager, '_get_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_create_prepared(self):
+        self.session.execute.return_value.was_applied = True
+        resp = UnitManager().create(dict(id='a', value='b', other='c'))
+        self.assertDictEqual(resp, dict(id='a', value='b'))
+        self.session.prepare.assert_called_once_with(
+            'INSERT INTO ks.unit_model ("id", "value") VALUES (?, ?) IF NOT EXISTS')
+        self.session.prepare.return_value.bind.assert_called_once_with(['a', 'b'])
+
+    def test_create_already_exists(self):
+        self.session.execute.return_value.was_applied = False
+        self.session.execute.return_value.one.return_value = dict(id='a')
+        self.assertRaises(LWTException, UnitManager().create, dict(id='a'))
+
+    def test_retrieve_prepared(self):
+        self.session.execute.return_value = [dict(id='a', value='b')]
+        manager = UnitManager()
+        self.assertDictEqual(manager.retrieve(dict(id='a')), dict(id='a', value='b'))
+        self.assertDictEqual(manager.retrieve(dict(id='a')), dict(id='a', value='b'))
+        self.assertEqual(self.session.prepare.call_count, 1)
+        stats = UnitManager.statement_cache.stats()
+        self.assertEqual(list(stats.values()), [dict(hits=1, misses=1)])
+
+    def test_retrieve_not_found(self):
+        self.session.execute.return_value = []
+        self.assertRaises(NotFoundException, UnitManager().retrieve, dict(id='a'))
+
+    def test_retrieve_list(self):
+        self.session.execute.return_value = [dict(id='a', value='1'), dict(id='b', value='2')]
+        models, meta = UnitManager().retrieve_list({'count': 1})
+        self.assertListEqual(models, [dict(id='a', value='1')])
+        self.assertListEqual(meta['pagination_pk'], ['b'])
+        self.assertEqual(meta['next'], 'count=1&pagination_pk=b')
+        statement = self.session.execute.call_args[0][0]
+        self.assertIn('LIMIT 2', statement.query_string)
+
+    def test_retrieve_list_paging_state(self):
+        class CursorManager(UnitManager):
+            paging_state_cursors = True
+            cursor_secret = b'secret'
+            allow_filtering = True
+
+        result = mock.MagicMock(current_rows=[dict(id='a', value='1')], paging_state=b'state')
+        self.session.execute.return_value = result
+        manager = CursorManager()
+        models, meta = manager.retrieve_list({'count': 1, 'value': '1'})
+        self.assertListEqual(models, [dict(id='a', value='1')])
+        cursor = meta['cursor']
+        self.assertEqual(meta['next'], 'count=1&value=1&cursor={0}'.format(cursor))
+        statement = self.session.execute.call_args[0][0]
+        self.assertEqual(statement.fetch_size, 1)
+        self.assertNotIn('LIMIT', statement.query_string)
+
+        result.paging_state = None
+        models, meta = manager.retrieve_list({'count': 1, 'value': '1', 'cursor': cursor})
+        self.assertEqual(self.session.execute.call_args[1]['paging_state'], b'state')
+        self.assertIsNone(meta['cursor'])
+        self.assertIsNone(meta['next'])
+        self.assertRaises(ValidationException, manager.retrieve_list,
+                          {'count': 1, 'value': '2', 'cursor': cursor})
+        for count in (0, -1):
+            self.assertRaises(ValidationException, manager.retrieve_list, {'count': count, 'value': '1'})
+        self.assertEqual(self.session.execute.call_count, 2)
+
+    def test_reads_project_fields(self):
+        class ProjectedManager(CQLManager):
+            model = UnitClusteredModel
+            fields = ('value',)
+
+        self.session.execute.return_value = [dict(id='a', created=1, value='b')]
+        with mock.patch.object(ProjectedManager, '_get_session', return_value=self.session):
+            manager = ProjectedManager()
+            self.assertDictEqual(manager.retrieve(dict(id='a', created=1)), dict(value='b'))
+            self.session.prepare.assert_called_with(
+                'SELECT "id", "created", "value" FROM ks.unit_clustered_model '
+                'WHERE "created" = ? AND "id" = ? LIMIT 2')
+            manager.retrieve_list(dict(id='a'))
+            statement = self.session.execute.call_args[0][0]
+            self.assertTrue(statement.query_string.startswith(
+                'SELECT "id", "created", "value" FROM'))
+            manager.delete(dict(id='a', created=1))
+            self.session.prepare.assert_any_call(
+                'SELECT "id", "created" FROM ks.unit_clustered_model '
+                'WHERE "created" = ? AND "id" = ? LIMIT 2')
+
+    def test_update_reads_full_model(self):
+        class ProjectedManager(CQLManager):
+            model = UnitClusteredModel
+            fields = ('value',)
+
+        self.session.execute.return_value = [dict(id='a', created=1, value='b')]
+        with mock.patch.object(ProjectedManager, '_get_session', return_value=self.session):
+            ProjectedManager().update(dict(id='a', created=1), dict(value='c'))
+        self.session.prepare.assert_any_call(
+            'SELECT "id", "created", "value", "payload" FROM ks.unit_clustered_model '
+            'WHERE "created" = ? AND "id" = ? LIMIT 2')
+
+    def test_retrieve_cache(self):
+        class CachedManager(UnitManager):
+            retrieve_cache = LRUCache()
+
+        self.session.execute.return_value = [dict(id='a', value='b')]
+        manager = CachedManager()
+        self.assertDictEqual(manager.retrieve(dict(id='a')), dict(id='a', value='b'))
+        self.assertDictEqual(manager.retrieve(dict(id='a')), dict(id='a', value='b'))
+        self.assertEqual(self.session.execute.call_count, 1)
+        self.assertDictEqual(CachedManager.retrieve_cache.stats(),
+                             dict(hits=1, misses=1, evictions=0))
+
+        manager.update(dict(id='a'), dict(value='c'))
+        calls = self.session.execute.call_count
+        self.assertDictEqual(manager.retrieve(dict(id='a')), dict(id='a', value='c'))
+        self.assertEqual(self.session.execute.call_count, calls)
+
+        manager.delete(dict(id='a'))
+        calls = self.session.execute.call_count
+        manager.retrieve(dict(id='a'))
+        self.assertEqual(self.session.execute.call_count, calls + 1)
+
+    def test_retrieve_cache_shared_between_managers(self):
+        cache = LRUCache()
+
+        class WideManager(CQLManager):
+            model = UnitClusteredModel
+            fields = ('id', 'created', 'value', 'payload',)
+            update_fields = ('value',)
+            retrieve_cache = cache
+
+        class NarrowManager(WideManager):
+            fields = ('id', 'value',)
+
+        self.session.execute.side_effect = lambda *args, **kwargs: [dict(id='a', created=1, value='b',
+                                                                         payload=None)]
+        with mock.patch.object(WideManager, '_get_session', return_value=self.session):
+            WideManager().retrieve(dict(id='a', created=1))
+            self.assertDictEqual(NarrowManager().retrieve(dict(id='a', created=1)), dict(id='a', value='b'))
+            self.assertEqual(self.session.execute.call_count, 1)
+            self.assertEqual(len(cache), 1)
+
+            NarrowManager().update(dict(id='a', created=1), dict(value='c'))
+            calls = self.session.execute.call_count
+            self.assertDictEqual(WideManager().retrieve(dict(id='a', created=1)),
+                                 dict(id='a', created=1, value='b', payload=None))
+            self.assertEqual(self.session.execute.call_count, calls + 1)
+
+            NarrowManager().delete(dict(id='a', created=1))
+            self.assertEqual(len(cache), 0)
+
+    def test_retrieve_cache_skips_partial_keys(self):
+        class CachedManager(CQLManager):
+            model = UnitClusteredModel
+            fields = ('id', 'created', 'value',)
+            retrieve_cache = LRUCache()
+
+        self.session.execute.return_value = [dict(id='a', created=1, value='b')]
+        with mock.patch.object(CachedManager, '_get_session', return_value=self.session):
+            CachedManager().retrieve(dict(id='a'))
+            CachedManager().retrieve(dict(id='a'))
+            self.assertEqual(self.session.execute.call_count, 2)
+            CachedManager().retrieve(dict(id='a', created=1))
+            self.assertEqual(self.session.execute.call_count, 2)
+
+    def test_create_refreshes_cache(self):
+        class CachedManager(UnitManager):
+            retrieve_cache = LRUCache()
+
+        self.session.execute.return_value.was_applied = True
+        CachedManager().create(dict(id='a', value='b'))
+        self.assertDictEqual(CachedManager().retrieve(dict(id='a')), dict(id='a', value='b'))
+        self.assertEqual(self.session.execute.call_count, 1)
+
+    def test_upsert_evicts_cache(self):
+        class CachedManager(UnitManager):
+            retrieve_cache = LRUCache()
+            fail_create_if_exists = False
+
+        manager = CachedManager()
+        manager.retrieve_cache.set(manager._cache_key(dict(id='a')), dict(id='a', value='b'))
+        self.assertDictEqual(manager.create(dict(id='a')), dict(id='a', value=None))
+        self.assertIsNone(manager.retrieve_cache.get(manager._cache_key(dict(id='a'))))
+
+    def test_blind_update(self):
+        class BlindManager(UnitManager):
+            blind_writes = True
+            blind_writes_if_exists = True
+
+        self.session.execute.return_value.was_applied = True
+        resp = BlindManager().update(dict(id='a'), dict(value='c'))
+        self.assertDictEqual(resp, dict(id='a', value='c'))
+        self.assertEqual(self.session.execute.call_count, 1)
+        self.session.prepare.assert_called_once_with(
+            'UPDATE ks.unit_model SET "value" = ? WHERE "id" = ? IF EXISTS')
+        self.session.prepare.return_value.bind.assert_called_once_with(['c', 'a'])
+
+        self.session.execute.return_value.was_applied = False
+        self.assertRaises(NotFoundException, BlindManager().update, dict(id='a'), dict(value='c'))
+
+    def test_blind_update_without_existence_check(self):
+        class BlindManager(CQLManager):
+            model = UnitClusteredModel
+            fields = ('id', 'created', 'value', 'payload',)
+            update_fields = ('value',)
+            blind_writes = True
+
+        with mock.patch.object(BlindManager, '_get_session', return_value=self.session):
+            resp = BlindManager().update(dict(id='a', created=1), dict(value='c'))
+            BlindManager.fields = ('payload',)
+            unwritten = BlindManager().update(dict(id='a', created=1), dict(value='c'))
+        self.assertDictEqual(resp, dict(id='a', created=1, value='c'))
+        self.assertDictEqual(unwritten, {})
+        self.session.prepare.assert_called_once_with(
+            'UPDATE ks.unit_clustered_model SET "value" = ? WHERE "id" = ? AND "created" = ?')
+
+    def test_blind_update_falls_back_to_read(self):
+        class BlindManager(CQLManager):
+            model = UnitClusteredModel
+            fields = ('id', 'created', 'value',)
+            blind_writes = True
+
+        self.session.execute.return_value = [dict(id='a', created=1, value='b')]
+        with mock.patch.object(BlindManager, '_get_session', return_value=self.session):
+            resp = BlindManager().update(dict(id='a'), dict(value='c'))
+        self.assertDictEqual(resp, dict(id='a', created=1, value='c'))
+        self.assertEqual(self.session.execute.call_count, 2)
+
+    def test_blind_delete(self):
+        class BlindManager(UnitManager):
+            blind_writes = True
+            blind_writes_if_exists = True
+
+        self.session.execute.return_value.was_applied = True
+        self.assertDictEqual(BlindManager().delete(dict(id='a')), {})
+        self.assertEqual(self.session.execute.call_count, 1)
+        self.session.prepare.assert_called_once_with(
+            'DELETE FROM ks.unit_model WHERE "id" = ? IF EXISTS')
+
+        self.session.execute.return_value.was_applied = False
+        self.assertRaises(NotFoundException, BlindManager().delete, dict(id='a'))
+
+    def test_iter_list(self):
+        first = mock.MagicMock(current_rows=[dict(id='0', value='v'), dict(id='1', value='v')],
+                               paging_state=b'next')
+        last = mock.MagicMock(current_rows=[dict(id='2', value='v')], paging_state=None)
+        self.session.execute.side_effect = [first, last]
+        rows = UnitManager().iter_list({'count': 1, 'pagination_pk': 'a'})
+        self.assertFalse(self.session.execute.called)
+        self.assertDictEqual(next(rows), dict(id='0', value='v'))
+        statement = self.session.execute.call_args[0][0]
+        self.assertEqual(statement.fetch_size, UnitManager.stream_fetch_size)
+        self.assertNotIn('LIMIT', statement.query_string)
+        self.assertNotIn('WHERE', statement.query_string)
+        self.assertEqual(self.session.execute.call_count, 1)
+        self.assertListEqual(list(rows), [dict(id='1', value='v'), dict(id='2', value='v')])
+        self.assertEqual(self.session.execute.call_count, 2)
+        args, kwargs = self.session.execute.call_args
+        self.assertIs(args[0], statement)
+        self.assertEqual(kwargs['paging_state'], b'next')
+
+    def test_bulk_create_groups_partitions(self):
+        class ClusteredManager(CQLManager):
+            model = UnitClusteredModel
+            fields = ('id', 'created', 'value',)
+            fail_create_if_exists = False
+
+        values_list = [dict(id='a', created=1), dict(id='b', created=1), dict(id='a', created=2)]
+        with mock.patch.object(ClusteredManager, '_get_session', return_value=self.session):
+            with mock.patch.object(ClusteredManager, '_execute_concurrent') as execute:
+                execute.side_effect = lambda statements, **kwargs: [ExecutionResult(True, None)] * len(statements)
+                results = ClusteredManager().bulk_create(values_list)
+        self.assertEqual(execute.call_count, 1)
+        self.assertEqual(len(execute.call_args[0][0]), 2)
+        self.assertListEqual([result.value for result in results],
+                             [dict(id='a', created=1, value=None),
+                              dict(id='b', created=1, value=None),
+                              dict(id='a', created=2, value=None)])
+
+    def test_bulk_create_retries_failed_lwt_batch(self):
+        class ClusteredManager(CQLManager):
+            model = UnitClusteredModel
+            fields = ('id', 'created', 'value',)
+
+        applied = mock.MagicMock(was_applied=True)
+        not_applied = mock.MagicMock(was_applied=False)
+        with mock.patch.object(ClusteredManager, '_get_session', return_value=self.session):
+            with mock.patch.object(ClusteredManager, '_execute_concurrent') as execute:
+                execute.side_effect = [[ExecutionResult(True, not_applied)],
+                                       [ExecutionResult(True, applied),
+                                        ExecutionResult(True, not_applied)]]
+                results = ClusteredManager().bulk_create([dict(id='a', created=1),
+                                                          dict(id='a', created=2)])
+        self.assertDictEqual(results[0].value, dict(id='a', created=1, value=None))
+        self.assertIsNone(results[0].error)
+        self.assertIsInstance(results[1].error, LWTException)
+
+    def test_bulk_update(self):
+        found = ExecutionResult(True, [dict(id='a', value='b')])
+        missing = ExecutionResult(True, [])
+        with mock.patch.object(UnitManager, '_execute_concurrent') as execute:
+            execute.side_effect = [[found, missing], [ExecutionResult(True, None)]]
+            results = UnitManager().bulk_update([(dict(id='a'), dict(value='c')),
+                                                 (dict(id='z'), dict(value='c'))])
+        self.assertDictEqual(results[0].value, dict(id='a', value='c'))
+        self.assertIsInstance(results[1].error, NotFoundException)
+
+    def test_bulk_delete(self):
+        error = Exception()
+        with mock.patch.object(UnitManager, '_execute_concurrent') as execute:
+            execute.side_effect = [[ExecutionResult(True, [dict(id='a', value='b')]),
+                                    ExecutionResult(False, error)],
+                                   [ExecutionResult(True, None)]]
+            results = UnitManager().bulk_delete([dict(id='a'), dict(id='b')])
+        self.assertDictEqual(results[0].value, {})
+        self.assertIs(results[1].error, error)
+
+    def test_retrieve_many_in_query(self):
+        class ManyManager(UnitManager):
+            model = UnitClusteredModel
+            fields = ('id', 'created', 'value',)
+
+        with mock.patch.object(ManyManager, '_execute_concurrent') as execute:
+            execute.return_value = [ExecutionResult(True, [dict(id='a', created=2, value='y'),
+                                                           dict(id='a', created=1, value='x')])]
+            results = ManyManager().retrieve_many([dict(id='a', created=1), dict(id='a', created=3),
+                                                   dict(id='a', created=2)])
+        self.assertListEqual(results, [dict(id='a', created=1, value='x'), None,
+                                       dict(id='a', created=2, value='y')])
+        self.session.prepare.assert_called_once_with(
+            'SELECT "id", "created", "value" FROM ks.unit_clustered_model '
+            'WHERE "id" = ? AND "created" IN ?')
+        self.session.prepare.return_value.bind.assert_called_once_with(['a', [1, 3, 2]])
+
+    def test_retrieve_many_single_lookups(self):
+        with mock.patch.object(UnitManager, '_execute_concurrent') as execute:
+            execute.return_value = [ExecutionResult(True, []),
+                                    ExecutionResult(True, [dict(id='b', value='c')])]
+            results = UnitManager().retrieve_many([dict(id='a'), dict(id='b')])
+        self.assertListEqual(results, [None, dict(id='b', value='c')])
+        self.assertEqual(len(execute.call_args[0][0]), 2)
+
+    def test_update_only_changed_columns(self):
+        self.session.execute.return_value = [dict(id='a', value='b')]
+        resp = UnitManager().update(dict(id='a'), dict(value='c', id='z'))
+        self.assertDictEqual(resp, dict(id='a', value='c'))
+        self.session.prepare.assert_called_with(
+            'UPDATE ks.unit_model SET "value" = ? WHERE "id" = ?')
+        self.session.prepare.return_value.bind.assert_called_with(['c', 'a'])
+
+    def test_delete_prepared(self):
+        self.session.execute.return_value = [dict(id='a', value='b')]
+        self.assertDictEqual(UnitManager().delete(dict(id='a')), {})
+        self.session.prepare.assert_called_with('DELETE FROM ks.unit_model WHERE "id" = ?')
+        self.session.prepare.return_value.bind.assert_called_with(['a'])
+
     def test_serialize_model(self):
         """
         Dumb test for explosions.
@@ -18,9 +421,92 @@ class TestCQLManager(unittest2.TestCase):
         resp = CQLManager().serialize_model(x, fields_list=['x'])
         self.assertDictEqual(x, resp)
 
-    # def test_pagination_filtration(self):
-    #     assert False
-    #
+    def test_serialize_rows(self):
+        self.session.execute.side_effect = [[dict(id='a', value='1'), dict(id='b', value='2')],
+                                            [dict(id='a', value='1')]]
+        with mock.patch.object(UnitModel, '_construct_instance', wraps=UnitModel._construct_instance) as construct:
+            models, meta = UnitManager().retrieve_list({'count': 1})
+            self.assertDictEqual(UnitManager().retrieve(dict(id='a')), dict(id='a', value='1'))
+        self.assertListEqual(models, [dict(id='a', value='1')])
+        self.assertListEqual(meta['pagination_pk'], ['b'])
+        # Only the first model of the next page is built
+        self.assertEqual(construct.call_count, 1)
+
+        class ModelManager(UnitManager):
+            def serialize_model(self, obj, fields_list=None):
+                return dict(super(ModelManager, self).serialize_model(obj, fields_list=fields_list), x=1)
+
+        self.session.execute.side_effect = None
+        self.session.execute.return_value = [dict(id='a', value='1')]
+        self.assertDictEqual(ModelManager().retrieve(dict(id='a')), dict(id='a', value='1', x=1))
+        manager = UnitManager()
+        manager.serialize_rows = False
+        with mock.patch.object(UnitModel, '_construct_instance', wraps=UnitModel._construct_instance) as construct:
+            self.assertDictEqual(manager.retrieve(dict(id='a')), dict(id='a', value='1'))
+        self.assertEqual(construct.call_count, 1)
+
+    def test_increment(self):
+        class CounterManager(UnitManager):
+            model = UnitCounterModel
+            fields = ('id', 'day', 'hits', 'misses',)
+            update_fields = ('hits', 'misses',)
+
+        resp = CounterManager().increment(dict(id='a', day=1), dict(misses=2, hits=1, other=3))
+        self.assertDictEqual(resp, dict(id='a', day=1))
+        self.session.prepare.assert_called_once_with(
+            'UPDATE ks.unit_counter_model SET "hits" = "hits" + ?, "misses" = "misses" + ? '
+            'WHERE "id" = ? AND "day" = ?')
+        self.session.prepare.return_value.bind.assert_called_once_with([1, 2, 'a', 1])
+        CounterManager().update(dict(id='a', day=1), dict(hits=5))
+        CounterManager().decrement(dict(id='a', day=1), dict(hits=5))
+        self.assertListEqual([call[0][0] for call in self.session.prepare.return_value.bind.call_args_list[1:]],
+                             [[5, 'a', 1], [-5, 'a', 1]])
+        self.assertEqual(self.session.execute.call_count, 3)
+        CounterManager.fields = ('hits',)
+        self.assertDictEqual(CounterManager().increment(dict(id='a', day=1), dict(hits=1)), {})
+
+    def test_execution_options(self):
+        class ProfileManager(UnitManager):
+            read_consistency = ConsistencyLevel.LOCAL_ONE
+            write_consistency = ConsistencyLevel.LOCAL_QUORUM
+            read_execution_profile = 'reads'
+            write_execution_profile = 'writes'
+            request_timeout = 2.5
+
+        self.session.prepare.side_effect = lambda cql: mock.MagicMock(bind=lambda values: BoundStatement(
+            mock.MagicMock(consistency_level=None, serial_consistency_level=None, retry_policy=None,
+                           fetch_size=FETCH_SIZE_UNSET, routing_key_indexes=None, keyspace=None,
+                           custom_payload=None, is_idempotent=False, result_metadata=None)))
+        self.session.execute.return_value = [dict(id='a', value='b')]
+        ProfileManager().update(dict(id='a'), dict(value='c'))
+        (read, _), read_kwargs = self.session.execute.call_args_list[0]
+        (write, _), write_kwargs = self.session.execute.call_args_list[1]
+        self.assertEqual(read.consistency_level, ConsistencyLevel.LOCAL_ONE)
+        self.assertTrue(read.is_idempotent)
+        self.assertEqual(read_kwargs['execution_profile'], 'reads')
+        self.assertEqual(read_kwargs['timeout'], 2.5)
+        self.assertEqual(write.consistency_level, ConsistencyLevel.LOCAL_QUORUM)
+        self.assertFalse(write.is_idempotent)
+        self.assertEqual(write_kwargs['execution_profile'], 'writes')
+
+    def test_pagination_filtration(self):
+        class ClusteredManager(CQLManager):
+            model = UnitClusteredModel
+            fields = ('id', 'created', 'value',)
+
+        manager = ClusteredManager()
+        queryset = manager.pagination_filtration(manager.queryset, ['a', 3], {})
+        self.assertEqual(six.text_type(queryset._select_query()),
+                         'SELECT * FROM ks.unit_clustered_model WHERE token("id") >= token(%(0)s) '
+                         'AND "created" >= %(1)s LIMIT 10000')
+        queryset = manager.queryset.filter(id='a')
+        queryset = manager.pagination_filtration(queryset, ['a', 3], {'id': 'a'})
+        self.assertIn('WHERE "id" = %(0)s AND "created" >= %(1)s LIMIT',
+                      six.text_type(queryset._select_query()))
+        self.assertEqual(len(ClusteredManager._pagination_plans), 2)
+        queryset = manager.queryset
+        self.assertIs(manager.pagination_filtration(queryset, None, {}), queryset)
+
     # def test_get_next_query_args(self):
     #     assert False
     #
@@ -0,0 +1,40 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from ripozo.exceptions import ValidationException
+
+from ripozo_cassandra.cursors import _constant_time_compare, decode_cursor, encode_cursor
+
+import unittest2
+
+
+class TestCursors(unittest2.TestCase):
+    def test_round_trip(self):
+        cursor = encode_cursor(b'\x00\x01paging', b'secret', 'SELECT')
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor, b'secret', 'SELECT'), b'\x00\x01paging')
+
+    def test_wrong_secret(self):
+        cursor = encode_cursor(b'paging', b'secret', 'SELECT')
+        self.assertRaises(ValidationException, decode_cursor, cursor, b'other', 'SELECT')
+
+    def test_wrong_context(self):
+        cursor = encode_cursor(b'paging', 'secret', 'SELECT')
+        self.assertRaises(ValidationException, decode_cursor, cursor, 'secret', 'SELECT 2')
+
+    def test_tampered(self):
+        cursor = encode_cursor(b'paging', b'secret', 'SELECT')
+        tampered = cursor[:-2] + ('AA' if cursor[-2:] != 'AA' else 'BB')
+        self.assertRaises(ValidationException, decode_cursor, tampered, b'secret', 'SELECT')
+
+    def test_garbage(self):
+        for cursor in ['', '!!!', 'abc']:
+            self.assertRaises(ValidationException, decode_cursor, cursor, b'secret', 'SELECT')
+
+    def test_compare_fallback(self):
+        self.assertTrue(_constant_time_compare(b'abc', b'abc'))
+        self.assertFalse(_constant_time_compare(b'abc', b'abd'))
+        self.assertFalse(_constant_time_compare(b'abc', b'ab'))
+        self.assertTrue(_constant_time_compare(b'', b''))
@@ -0,0 +1,147 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra.cqlengine import columns, connection
+from cassandra.cqlengine.models import Model
+from cassandra.query import BatchStatement
+
+from ripozo_cassandra import CQLManager
+from ripozo_cassandra.fanout import CopyLayout, changed_columns, copy_layout, copy_sources, fan_out_table
+from ripozo_cassandra_tests.memory import MemorySession
+from ripozo_cassandra_tests.unit.memory import _CONNECTION
+
+import mock
+import unittest2
+
+
+class FanOutUser(Model):
+    __keyspace__ = 'ks'
+    __table_name__ = 'fan_out_user'
+    __connection__ = _CONNECTION
+    id = columns.Text(primary_key=True)
+    email = columns.Text()
+    name = columns.Text()
+    age = columns.Integer()
+
+
+class UserByEmail(Model):
+    __keyspace__ = 'ks'
+    __table_name__ = 'user_by_email'
+    __connection__ = _CONNECTION
+    email = columns.Text(partition_key=True)
+    id = columns.Text()
+    age = columns.Integer()
+
+
+class UserByName(Model):
+    __keyspace__ = 'ks'
+    __table_name__ = 'user_by_name'
+    __connection__ = _CONNECTION
+    username = columns.Text(partition_key=True)
+    id = columns.Text(primary_key=True)
+
+
+class FanOutManager(CQLManager):
+    model = FanOutUser
+    fields = ('id', 'email', 'name', 'age',)
+    create_fields = ('id', 'email', 'name', 'age',)
+    update_fields = ('email', 'name', 'age',)
+    fan_out_tables = (UserByEmail, fan_out_table(UserByName, {'username': 'name'}))
+
+
+class TestCopyLayout(unittest2.TestCase):
+    def test_copy_layout(self):
+        layout = copy_layout(FanOutUser, UserByEmail)
+        self.assertEqual(layout, CopyLayout(UserByEmail, (('email', 'email'), ('id', 'id'), ('age', 'age')),
+                                            (('email', 'email'),)))
+        self.assertIs(copy_layout(FanOutUser, UserByEmail), layout)
+        self.assertIs(FanOutUser.__dict__['_copy_layouts'][UserByEmail], layout)
+        layout = copy_layout(FanOutUser, fan_out_table(UserByName, {'username': 'name'}))
+        self.assertEqual(layout.primary_keys, (('username', 'name'), ('id', 'id')))
+        self.assertRaises(ValueError, copy_layout, FanOutUser, UserByName)
+
+    def test_copy_sources(self):
+        layouts = [copy_layout(FanOutUser, table) for table in FanOutManager.fan_out_tables]
+        self.assertSetEqual(copy_sources(layouts), set(['email', 'name', 'id']))
+
+    def test_changed_columns(self):
+        layout = copy_layout(FanOutUser, UserByEmail)
+        self.assertEqual(changed_columns(layout, set(['age', 'name'])), ((('age', 'age'),), False))
+        self.assertEqual(changed_columns(layout, set(['email'])), ((('email', 'email'),), True))
+        self.assertEqual(changed_columns(layout, set(['name'])), ((), False))
+
+
+class TestManagerFanOut(unittest2.TestCase):
+    def setUp(self):
+        FanOutManager._statement_cache = None
+        self.session = MemorySession()
+        for model in (FanOutUser, UserByEmail, UserByName):
+            self.session.create_table(model)
+        connection.register_connection(_CONNECTION, session=self.session)
+        self.addCleanup(connection.unregister_connection, _CONNECTION)
+
+    def assertCopies(self, by_email, by_name):
+        self.assertListEqual(sorted((obj.email, obj.id, obj.age) for obj in UserByEmail.objects.all()),
+                             by_email)
+        self.assertListEqual(sorted((obj.username, obj.id) for obj in UserByName.objects.all()), by_name)
+
+    def test_create_update_delete(self):
+        manager = FanOutManager()
+        manager.create(dict(id='1', email='a@x', name='a', age=1))
+        manager.create(dict(id='2', name='b'))
+        self.assertCopies([('a@x', '1', 1)], [('a', '1'), ('b', '2')])
+        manager.update(dict(id='1'), dict(age=2))
+        manager.update(dict(id='2'), dict(email='b@x', name='c'))
+        self.assertCopies([('a@x', '1', 2), ('b@x', '2', None)], [('a', '1'), ('c', '2')])
+        manager.update(dict(id='1'), dict(email='d@x', age=None))
+        self.assertCopies([('b@x', '2', None), ('d@x', '1', None)], [('a', '1'), ('c', '2')])
+        manager.delete(dict(id='2'))
+        self.assertCopies([('d@x', '1', None)], [('a', '1')])
+
+    def test_statements(self):
+        manager = FanOutManager()
+        with mock.patch.object(manager, '_execute', wraps=manager._execute) as execute:
+            manager.create(dict(id='1', email='a@x', name='a'))
+        statement = execute.call_args_list[-1][0][0]
+        self.assertIsInstance(statement, BatchStatement)
+        self.assertEqual(len(statement._statements_and_parameters), 2)
+        manager.fan_out_batches = False
+        manager.fail_create_if_exists = False
+        with mock.patch.object(manager, '_execute_concurrent', wraps=manager._execute_concurrent) as concurrent:
+            manager.create(dict(id='2', email='b@x', name='b'))
+        self.assertEqual(len(concurrent.call_args[0][0]), 3)
+        self.assertCopies([('a@x', '1', None), ('b@x', '2', None)], [('a', '1'), ('b', '2')])
+
+    def test_blind_writes(self):
+        manager = FanOutManager()
+        manager.blind_writes = True
+        manager.create(dict(id='1', email='a@x', name='a'))
+        manager.update(dict(id='1'), dict(email='b@x'))
+        self.assertCopies([('b@x', '1', None)], [('a', '1')])
+        manager.delete(dict(id='1'))
+        self.assertCopies([], [])
+
+    def test_cqlengine_writes(self):
+        manager = FanOutManager()
+        manager.prepare_statements = False
+        manager.create(dict(id='1', email='a@x', name='a'))
+        manager.update(dict(id='1'), dict(name='b'))
+        self.assertCopies([('a@x', '1', None)], [('b', '1')])
+        manager.delete(dict(id='1'))
+        self.assertCopies([], [])
+
+    def test_bulk(self):
+        manager = FanOutManager()
+        results = manager.bulk_create([dict(id='1', email='a@x', name='a'), dict(id='2', name='b'),
+                                       dict(id='3', age='x')])
+        self.assertIsNone(results[1].error)
+        self.assertIsNotNone(results[2].error)
+        self.assertCopies([('a@x', '1', None)], [('a', '1'), ('b', '2')])
+        manager.bulk_update([(dict(id='1'), dict(name='c')), (dict(id='2'), dict(email='b@x'))])
+        self.assertCopies([('a@x', '1', None), ('b@x', '2', None)], [('b', '2'), ('c', '1')])
+        results = manager.bulk_delete([dict(id='1'), dict(id='3')])
+        self.assertIsNone(results[0].error)
+        self.assertIsNotNone(results[1].error)
+        self.assertCopies([('b@x', '2', None)], [('b', '2')])
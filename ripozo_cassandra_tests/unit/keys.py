@@ -0,0 +1,149 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra.cqlengine import columns, connection
+from cassandra.cqlengine.models import Model
+from cassandra.cqlengine.query import QueryException
+
+from ripozo_cassandra import CQLManager
+from ripozo_cassandra.keys import KeyLayout, PaginationPlan, key_layout, pagination_plan, route_query
+from ripozo_cassandra_tests.memory import MemorySession
+from ripozo_cassandra_tests.unit.memory import _CONNECTION
+
+import unittest2
+
+
+class KeysModel(Model):
+    __keyspace__ = 'ks'
+    __table_name__ = 'keys_model'
+    region = columns.Text(partition_key=True)
+    id = columns.Text(partition_key=True)
+    created = columns.Integer(primary_key=True)
+    sequence = columns.Integer(primary_key=True)
+    value = columns.Text()
+
+
+class RoutedModel(Model):
+    __keyspace__ = 'ks'
+    __table_name__ = 'routed_model'
+    __connection__ = _CONNECTION
+    id = columns.Text(primary_key=True)
+    owner = columns.Text()
+    value = columns.Text()
+
+
+class RoutedByOwner(Model):
+    __keyspace__ = 'ks'
+    __table_name__ = 'routed_by_owner'
+    __connection__ = _CONNECTION
+    owner = columns.Text(partition_key=True)
+    id = columns.Text(primary_key=True)
+    value = columns.Text()
+
+
+class RoutedByOwnerValue(Model):
+    __keyspace__ = 'ks'
+    __table_name__ = 'routed_by_owner_value'
+    __connection__ = _CONNECTION
+    owner = columns.Text(partition_key=True)
+    value = columns.Text(primary_key=True)
+    id = columns.Text(primary_key=True)
+
+
+class RoutedKeysOnly(Model):
+    __keyspace__ = 'ks'
+    __table_name__ = 'routed_keys_only'
+    owner = columns.Text(partition_key=True)
+    id = columns.Text(primary_key=True)
+
+
+class RoutedManager(CQLManager):
+    model = RoutedModel
+    fields = ('id', 'owner', 'value',)
+    create_fields = ('id', 'owner', 'value',)
+    query_tables = (RoutedByOwner,)
+
+
+class TestKeys(unittest2.TestCase):
+    def test_key_layout(self):
+        layout = key_layout(KeysModel)
+        self.assertEqual(layout, KeyLayout(('region', 'id'), ('created', 'sequence'),
+                                           ('region', 'id', 'created', 'sequence')))
+        self.assertIs(key_layout(KeysModel), layout)
+        self.assertIs(KeysModel.__dict__['_key_layout'], layout)
+
+    def test_pagination_plan_token(self):
+        plan = pagination_plan(key_layout(KeysModel), frozenset(['value']))
+        self.assertEqual(plan, PaginationPlan((), 2, ((2, 'created'), (3, 'sequence'))))
+
+    def test_pagination_plan_partition_filter(self):
+        plan = pagination_plan(key_layout(KeysModel), frozenset(['region', 'created']))
+        self.assertEqual(plan, PaginationPlan(((1, 'id'),), None, ((3, 'sequence'),)))
+
+    def test_route_query(self):
+        columns = ('id', 'owner', 'value')
+        tables = (RoutedKeysOnly, RoutedByOwner)
+        self.assertIs(route_query(RoutedModel, tables, frozenset(['owner']), columns), RoutedByOwner)
+        self.assertIs(route_query(RoutedModel, tables, frozenset(['owner', 'id']), columns), RoutedModel)
+        self.assertIs(route_query(RoutedModel, tables, frozenset(['value']), columns), RoutedModel)
+        self.assertIs(route_query(RoutedModel, tables, frozenset(), columns), RoutedModel)
+        self.assertIs(route_query(RoutedModel, tables, frozenset(['owner']), ('id', 'owner')), RoutedKeysOnly)
+        self.assertIs(route_query(RoutedModel, tables, frozenset(['owner']), columns, ordered=True), RoutedModel)
+
+
+class TestManagerRouting(unittest2.TestCase):
+    def setUp(self):
+        RoutedManager._statement_cache = None
+        self.session = MemorySession()
+        self.session.create_table(RoutedModel)
+        self.session.create_table(RoutedByOwner)
+        self.session.create_table(RoutedByOwnerValue)
+        connection.register_connection(_CONNECTION, session=self.session)
+        self.addCleanup(connection.unregister_connection, _CONNECTION)
+        for index in range(5):
+            values = dict(id=str(index), owner='x' if index % 2 else 'y', value=str(index))
+            RoutedModel.create(**values)
+            RoutedByOwner.create(**values)
+            RoutedByOwnerValue.create(**values)
+
+    def test_retrieve_list(self):
+        unrouted = type(str('UnroutedManager'), (RoutedManager,), dict(query_tables=()))()
+        self.assertRaises(QueryException, unrouted.retrieve_list, {'owner': 'y'})
+        manager = RoutedManager()
+        models, meta = manager.retrieve_list({'owner': 'y', 'count': 2})
+        self.assertListEqual(models, [dict(id='0', owner='y', value='0'), dict(id='2', owner='y', value='2')])
+        self.assertListEqual(meta['pagination_pk'], ['y', '4'])
+        models, meta = manager.retrieve_list({'owner': 'y', 'count': 2, 'pagination_pk': meta['pagination_pk']})
+        self.assertListEqual(models, [dict(id='4', owner='y', value='4')])
+        self.assertIsNone(meta['pagination_pk'])
+
+    def test_cursors(self):
+        manager = RoutedManager()
+        manager.paging_state_cursors = True
+        models, meta = manager.retrieve_list({'owner': 'x', 'count': 1})
+        self.assertListEqual(models, [dict(id='1', owner='x', value='1')])
+        models, meta = manager.retrieve_list({'owner': 'x', 'count': 1, 'cursor': meta['cursor']})
+        self.assertListEqual(models, [dict(id='3', owner='x', value='3')])
+        self.assertEqual(len(list(manager.iter_list({'owner': 'x'}))), 2)
+
+    def test_view_keys_not_in_fields(self):
+        manager = type(str('NarrowManager'), (RoutedManager,),
+                       dict(fields=('id', 'owner'), query_tables=(RoutedByOwnerValue,)))()
+        self.assertTupleEqual(manager._query_columns(RoutedByOwnerValue), ('id', 'owner', 'value'))
+        models, meta = manager.retrieve_list({'owner': 'y', 'count': 2})
+        self.assertListEqual(models, [dict(id='0', owner='y'), dict(id='2', owner='y')])
+        self.assertListEqual(meta['pagination_pk'], ['y', '4', '4'])
+        self.assertIn('pagination_pk=4&pagination_pk=4', meta['next'])
+        models, meta = manager.retrieve_list({'owner': 'y', 'count': 2, 'pagination_pk': meta['pagination_pk']})
+        self.assertListEqual(models, [dict(id='4', owner='y')])
+        self.assertIsNone(meta['pagination_pk'])
+        columns, meta = manager.retrieve_columns({'owner': 'y', 'count': 2})
+        self.assertListEqual(list(columns['id']), ['0', '2'])
+        self.assertListEqual(meta['pagination_pk'], ['y', '4', '4'])
+
+    def test_order_by_not_routed(self):
+        manager = type(str('OrderedManager'), (RoutedManager,), dict(order_by='id'))()
+        self.assertIs(manager._query_model({'owner': 'y'}), RoutedModel)
+        self.assertIs(manager._query_model({'owner': 'y'}, ordered=False), RoutedByOwner)
@@ -0,0 +1,151 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra import InvalidRequest, OperationTimedOut
+from cassandra.cqlengine import connection
+
+from ripozo_cassandra.limits import AdaptiveLimiter, SaturatedException, execute_limited, permit
+from ripozo_cassandra_tests.memory import MemorySession
+from ripozo_cassandra_tests.unit.memory import MemoryManager, MemoryModel, _CONNECTION
+
+import mock
+import threading
+import unittest2
+
+
+class TestAdaptiveLimiter(unittest2.TestCase):
+    def test_additive_increase(self):
+        limiter = AdaptiveLimiter(limit=2, max_limit=3)
+        for _ in range(4):
+            limiter.release(limiter.acquire())
+        self.assertEqual(limiter.limit, 3)
+        for _ in range(10):
+            limiter.release(limiter.acquire())
+        self.assertEqual(limiter.limit, 3)
+
+    def test_multiplicative_decrease(self):
+        limiter = AdaptiveLimiter(limit=16, min_limit=2, latency_target=0.01)
+        first, second = limiter.acquire(), limiter.acquire()
+        limiter.release(first - 1)
+        self.assertEqual(limiter.limit, 8)
+        limiter.release(second, OperationTimedOut())
+        self.assertEqual(limiter.limit, 8)
+        limiter.release(limiter.acquire(), OperationTimedOut())
+        self.assertEqual(limiter.limit, 4)
+        limiter.release(limiter.acquire(), OperationTimedOut())
+        limiter.release(limiter.acquire(), OperationTimedOut())
+        self.assertEqual(limiter.limit, 2)
+        limiter.release(limiter.acquire(), InvalidRequest('bad'))
+        self.assertEqual(limiter.limit, 2)
+
+    def test_fail_fast(self):
+        limiter = AdaptiveLimiter(limit=1)
+        started = limiter.try_acquire()
+        self.assertIsNotNone(started)
+        self.assertIsNone(limiter.try_acquire())
+        with self.assertRaises(SaturatedException) as context:
+            limiter.acquire()
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertEqual(limiter.snapshot(), dict(limit=1, in_flight=1, rejected=1))
+
+    def test_wait(self):
+        limiter = AdaptiveLimiter(limit=1, max_limit=1, max_wait=5)
+        started = limiter.acquire()
+        timer = threading.Timer(0.01, limiter.release, (started,))
+        timer.start()
+        self.addCleanup(timer.join)
+        limiter.release(limiter.acquire())
+        self.assertEqual(limiter.snapshot()['in_flight'], 0)
+        limiter.max_wait = 0.01
+        limiter.acquire()
+        self.assertRaises(SaturatedException, limiter.acquire)
+
+    def test_permit(self):
+        limiter = AdaptiveLimiter(limit=8)
+        with self.assertRaises(OperationTimedOut):
+            with permit(limiter):
+                self.assertEqual(limiter.in_flight, 1)
+                raise OperationTimedOut()
+        self.assertEqual(limiter.snapshot(), dict(limit=4, in_flight=0, rejected=0))
+        with self.assertRaises(ValueError):
+            with permit(limiter):
+                raise ValueError()
+        self.assertEqual(limiter.in_flight, 0)
+        with permit(None):
+            self.assertEqual(limiter.in_flight, 0)
+
+    def test_listener(self):
+        limiter = AdaptiveLimiter(limit=1)
+        listener = mock.Mock()
+        limiter.add_listener(listener)
+        limiter.release(limiter.acquire())
+        self.assertEqual(listener.call_count, 1)
+        limiter.remove_listener(listener)
+        limiter.release(limiter.acquire())
+        self.assertEqual(listener.call_count, 1)
+        self.assertIsInstance(limiter.reject(), SaturatedException)
+        self.assertEqual(limiter.rejected, 1)
+
+
+class TestManagerLimiter(unittest2.TestCase):
+    def setUp(self):
+        MemoryManager._statement_cache = None
+        self.session = MemorySession()
+        self.session.create_table(MemoryModel)
+        connection.register_connection(_CONNECTION, session=self.session)
+        self.addCleanup(connection.unregister_connection, _CONNECTION)
+
+    def test_limiter(self):
+        manager = MemoryManager()
+        manager.limiter = AdaptiveLimiter(limit=1, max_limit=1)
+        manager.create(dict(id='a', created=1, value='b'))
+        self.assertListEqual(manager.retrieve_many([dict(id='a', created=1)]),
+                             [dict(id='a', created=1, value='b')])
+        self.assertEqual(manager.limiter.in_flight, 0)
+        started = manager.limiter.acquire()
+        self.assertRaises(SaturatedException, manager.retrieve, dict(id='a', created=1))
+        manager.limiter.release(started)
+        self.assertEqual(manager.retrieve(dict(id='a', created=1))['value'], 'b')
+
+    def test_permit_per_statement(self):
+        manager = MemoryManager()
+        manager.limiter = AdaptiveLimiter(limit=4, max_limit=4, max_wait=5)
+        in_flight = []
+        execute_async = self.session.execute_async
+
+        def _execute_async(*args, **kwargs):
+            in_flight.append(manager.limiter.in_flight)
+            return execute_async(*args, **kwargs)
+
+        values = [dict(id=str(i), created=1) for i in range(10)]
+        with mock.patch.object(self.session, 'execute_async', side_effect=_execute_async):
+            results = manager.bulk_create(values)
+        self.assertTrue(all(result.error is None for result in results))
+        self.assertEqual(len(in_flight), 10)
+        self.assertLessEqual(max(in_flight), 4)
+        self.assertEqual(manager.limiter.in_flight, 0)
+
+    def test_execute_limited(self):
+        limiter = AdaptiveLimiter(limit=1, max_limit=1, max_wait=5)
+        statements = [mock.Mock(), mock.Mock()]
+        session = mock.MagicMock()
+        futures = [mock.MagicMock(), mock.MagicMock()]
+        futures[0].add_callbacks.side_effect = lambda callback, errback, callback_args, errback_args: \
+            callback([], *callback_args)
+        futures[1].add_callbacks.side_effect = lambda callback, errback, callback_args, errback_args: \
+            errback(OperationTimedOut(), *errback_args)
+        futures[1].result.side_effect = OperationTimedOut()
+        session.execute_async.side_effect = futures
+        outcomes = execute_limited(session, statements, limiter, 2, timeout=1)
+        self.assertEqual(outcomes[0], (True, futures[0].result.return_value))
+        self.assertFalse(outcomes[1][0])
+        self.assertIsInstance(outcomes[1][1], OperationTimedOut)
+        session.execute_async.assert_called_with(statements[1], timeout=1)
+        self.assertEqual(limiter.in_flight, 0)
+        limiter.max_wait = 0
+        started = limiter.acquire()
+        outcomes = execute_limited(session, statements[:1], limiter, 2)
+        self.assertIsInstance(outcomes[0][1], SaturatedException)
+        limiter.release(started)
@@ -0,0 +1,213 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra import InvalidRequest
+from cassandra.cqlengine import columns, connection
+from cassandra.cqlengine.models import Model
+from cassandra.cqlengine.query import LWTException
+from cassandra.query import BatchStatement, SimpleStatement, dict_factory
+
+from ripozo_cassandra import CQLManager
+from ripozo_cassandra_tests.memory import MemorySession
+
+import threading
+import unittest2
+
+_CONNECTION = 'ripozo_memory_tests'
+
+
+class MemoryModel(Model):
+    __keyspace__ = 'ks'
+    __table_name__ = 'memory_model'
+    __connection__ = _CONNECTION
+    id = columns.Text(primary_key=True)
+    created = columns.Integer(primary_key=True, clustering_order='DESC')
+    value = columns.Text()
+    tags = columns.Set(columns.Text)
+
+
+class MemoryCounter(Model):
+    __keyspace__ = 'ks'
+    __table_name__ = 'memory_counter'
+    __connection__ = _CONNECTION
+    id = columns.Text(primary_key=True)
+    hits = columns.Counter()
+
+
+class MemoryManager(CQLManager):
+    model = MemoryModel
+    fields = ('id', 'created', 'value',)
+    create_fields = ('id', 'created', 'value',)
+    update_fields = ('value',)
+    paging_state_cursors = True
+
+
+class CounterManager(CQLManager):
+    model = MemoryCounter
+    fields = ('id', 'hits',)
+    update_fields = ('hits',)
+
+
+class TestMemorySession(unittest2.TestCase):
+    def setUp(self):
+        MemoryManager._statement_cache = None
+        self.session = MemorySession()
+        self.session.create_table(MemoryModel)
+        self.session.create_table(MemoryCounter)
+        connection.register_connection(_CONNECTION, session=self.session)
+        self.addCleanup(connection.unregister_connection, _CONNECTION)
+
+    def test_register_connection(self):
+        self.assertIs(self.session.row_factory, dict_factory)
+        MemoryModel.create(id='a', created=1, value='b', tags=set(['x']))
+        obj = MemoryModel.get(id='a', created=1)
+        self.assertEqual(obj.value, 'b')
+        self.assertEqual(obj.tags, set(['x']))
+        MemoryModel.objects(id='a', created=1).update(tags__add=set(['y']))
+        self.assertEqual(MemoryModel.get(id='a', created=1).tags, set(['x', 'y']))
+        self.assertEqual(MemoryModel.objects.count(), 1)
+        MemoryModel.objects(id='a', created=1).delete()
+        self.assertEqual(MemoryModel.objects.count(), 0)
+
+    def test_clustering_and_token_order(self):
+        for key in ('a', 'b', 'c', 'd'):
+            for created in (1, 3, 2):
+                MemoryModel.create(id=key, created=created)
+        rows = list(self.session.execute('SELECT id, created FROM ks.memory_model'))
+        self.assertListEqual([row['created'] for row in rows], [3, 2, 1] * 4)
+        tokens = [self.session.tables[('ks', 'memory_model')].token((row['id'],)) for row in rows[::3]]
+        self.assertListEqual(tokens, sorted(tokens))
+        rows = self.session.execute('SELECT created FROM ks.memory_model WHERE id = %s '
+                                    'ORDER BY created ASC', ['a'])
+        self.assertListEqual([row['created'] for row in rows], [1, 2, 3])
+
+    def test_token_range(self):
+        for key in ('a', 'b', 'c', 'd'):
+            MemoryModel.create(id=key, created=1)
+        table = self.session.tables[('ks', 'memory_model')]
+        tokens = sorted(token for token, _ in table.ring)
+        prepared = self.session.prepare('SELECT id FROM ks.memory_model '
+                                        'WHERE token(id) > ? AND token(id) <= ?')
+        rows = self.session.execute(prepared.bind([tokens[0], tokens[2]]))
+        self.assertListEqual([table.token((row['id'],)) for row in rows], tokens[1:3])
+
+    def test_if_not_exists(self):
+        prepared = self.session.prepare('INSERT INTO ks.memory_model (id, created, value) '
+                                        'VALUES (?, ?, ?) IF NOT EXISTS')
+        self.assertTrue(self.session.execute(prepared.bind(['a', 1, 'b'])).was_applied)
+        result = self.session.execute(prepared.bind(['a', 1, 'c']))
+        self.assertFalse(result.was_applied)
+        self.assertEqual(result.one()['value'], 'b')
+        self.assertRaises(LWTException, MemoryModel.if_not_exists().create, id='a', created=1)
+
+    def test_routing_key_indexes(self):
+        prepared = self.session.prepare('SELECT * FROM ks.memory_model WHERE id = ? AND created = ?')
+        self.assertListEqual(prepared.routing_key_indexes, [0])
+        self.assertEqual(prepared.bind(['a', 1]).routing_key, b'a')
+
+    def test_paging(self):
+        for created in range(5):
+            MemoryModel.create(id='a', created=created)
+        result = self.session.execute(SimpleStatement('SELECT created FROM ks.memory_model', fetch_size=2))
+        self.assertEqual(len(result.current_rows), 2)
+        self.assertIsNotNone(result.paging_state)
+        self.assertListEqual([row['created'] for row in result], [4, 3, 2, 1, 0])
+        resumed = self.session.execute(SimpleStatement('SELECT created FROM ks.memory_model', fetch_size=2),
+                                       paging_state=self.session.execute(
+                                           SimpleStatement('SELECT created FROM ks.memory_model',
+                                                           fetch_size=4)).paging_state)
+        self.assertListEqual([row['created'] for row in resumed.current_rows], [0])
+        self.assertFalse(resumed.has_more_pages)
+
+    def test_paging_resumes_after_last_row(self):
+        for id_ in ('a', 'b', 'c'):
+            for created in range(3):
+                MemoryModel.create(id=id_, created=created)
+        query = 'SELECT id, created FROM ks.memory_model'
+        first = self.session.execute(SimpleStatement(query, fetch_size=4))
+        seen = [(row['id'], row['created']) for row in first.current_rows]
+        last_id, last_created = seen[-1]
+        MemoryModel.objects(id=seen[0][0], created=seen[0][1]).delete()
+        MemoryModel.create(id=last_id, created=last_created + 10)
+        MemoryModel.create(id=last_id, created=-1)
+        rest = self.session.execute(SimpleStatement(query, fetch_size=4), paging_state=first.paging_state)
+        remaining = [(row['id'], row['created']) for row in rest]
+        self.assertEqual(len(set(seen) | set(remaining)), 10)
+        self.assertFalse(set(seen) & set(remaining))
+        self.assertNotIn((last_id, last_created + 10), remaining)
+        self.assertIn((last_id, -1), remaining)
+
+    def test_paging_order_and_limit(self):
+        for created in range(5):
+            MemoryModel.create(id='a', created=created)
+        query = SimpleStatement('SELECT created FROM ks.memory_model WHERE id = %s ORDER BY created ASC LIMIT 3',
+                                fetch_size=2)
+        first = self.session.execute(query, ['a'])
+        self.assertListEqual([row['created'] for row in first.current_rows], [0, 1])
+        rest = self.session.execute(query, ['a'], paging_state=first.paging_state)
+        self.assertListEqual([row['created'] for row in rest.current_rows], [2])
+        self.assertFalse(rest.has_more_pages)
+        self.assertRaises(InvalidRequest, self.session.execute, query, ['a'], paging_state=b'\x00')
+
+    def test_batch(self):
+        prepared = self.session.prepare('INSERT INTO ks.memory_model (id, created) VALUES (?, ?)')
+        batch = BatchStatement()
+        batch.add(prepared, ['a', 1])
+        batch.add(SimpleStatement('UPDATE ks.memory_model SET value = %s WHERE id = %s AND created = %s'),
+                  ['b', 'a', 2])
+        self.session.execute(batch)
+        self.assertEqual(MemoryModel.objects(id='a').count(), 2)
+
+    def test_counter(self):
+        MemoryCounter.objects(id='a').update(hits=2)
+        statement = self.session.prepare('UPDATE ks.memory_counter SET hits = hits + ? WHERE id = ?')
+        self.session.execute(statement.bind([3, 'a']))
+        self.assertEqual(MemoryCounter.get(id='a').hits, 5)
+
+    def test_filtering(self):
+        self.assertRaises(InvalidRequest, self.session.execute,
+                          "SELECT * FROM ks.memory_model WHERE value = 'a'")
+        MemoryModel.create(id='a', created=1, value='a')
+        rows = self.session.execute("SELECT * FROM ks.memory_model WHERE value = 'a' ALLOW FILTERING")
+        self.assertEqual(len(rows.current_rows), 1)
+        self.assertRaises(InvalidRequest, self.session.execute, 'SELECT * FROM ks.missing')
+
+    def test_latency(self):
+        self.session.latency = 0.01
+        future = self.session.execute_async("SELECT * FROM ks.memory_model WHERE id = 'a'")
+        done = threading.Event()
+        future.add_callbacks(lambda rows: done.set(), lambda exc: None)
+        self.assertFalse(done.is_set())
+        self.assertTrue(done.wait(1))
+        self.assertListEqual(future.result().current_rows, [])
+
+    def test_manager(self):
+        manager = MemoryManager()
+        for created in range(3):
+            manager.create(dict(id='a', created=created, value=str(created)))
+        self.assertRaises(LWTException, manager.create, dict(id='a', created=0))
+        self.assertDictEqual(manager.update(dict(id='a', created=1), dict(value='x')),
+                             dict(id='a', created=1, value='x'))
+        models, meta = manager.retrieve_list({'count': 2})
+        self.assertListEqual([model['created'] for model in models], [2, 1])
+        models, meta = manager.retrieve_list({'count': 2, 'cursor': meta['cursor']})
+        self.assertListEqual(models, [dict(id='a', created=0, value='0')])
+        self.assertIsNone(meta['cursor'])
+        manager.delete(dict(id='a', created=0))
+        self.assertListEqual(manager.retrieve_many([dict(id='a', created=0), dict(id='a', created=1)]),
+                             [None, dict(id='a', created=1, value='x')])
+
+    def test_manager_counters(self):
+        manager = CounterManager()
+        self.assertDictEqual(manager.increment(dict(id='a'), dict(hits=3)), dict(id='a'))
+        manager.decrement(dict(id='a'), dict(hits=1))
+        manager.update(dict(id='a'), dict(hits='4'))
+        self.assertEqual(manager.retrieve(dict(id='a'))['hits'], 6)
+        results = manager.bulk_increment([(dict(id='a'), dict(hits=1)), (dict(id='b'), dict(hits=2)),
+                                          (dict(id='a'), dict(hits='x'))])
+        self.assertListEqual([result.value for result in results[:2]], [dict(id='a'), dict(id='b')])
+        self.assertIsNotNone(results[2].error)
+        self.assertEqual(manager.retrieve(dict(id='a'))['hits'], 7)
+        self.assertEqual(manager.retrieve(dict(id='b'))['hits'], 2)
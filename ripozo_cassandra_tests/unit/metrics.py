@@ -0,0 +1,160 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra.cqlengine import connection
+from ripozo.exceptions import NotFoundException
+
+from ripozo_cassandra import CQLManager
+from ripozo_cassandra_tests.memory import MemorySession
+from ripozo_cassandra.metrics import Histogram, MemorySink, NULL_SINK, current_operation, \
+    estimate_bytes, measure, start_operation, finish_operation
+from ripozo_cassandra_tests.unit.memory import MemoryModel, _CONNECTION
+
+import threading
+import unittest2
+
+
+class MetricsManager(CQLManager):
+    model = MemoryModel
+    fields = ('id', 'created', 'value',)
+    create_fields = ('id', 'created', 'value',)
+    update_fields = ('value',)
+
+
+class TestHistogram(unittest2.TestCase):
+    def test_snapshot(self):
+        histogram = Histogram((1, 2, 4, 8))
+        for value in (1, 1, 3, 3, 3, 3, 3, 3, 3, 20):
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 10)
+        self.assertEqual(snapshot['sum'], 43)
+        self.assertEqual(snapshot['min'], 1)
+        self.assertEqual(snapshot['max'], 20)
+        self.assertEqual(snapshot['p50'], 4)
+        self.assertEqual(snapshot['p90'], 4)
+        self.assertEqual(snapshot['p99'], 20)
+
+    def test_empty(self):
+        snapshot = Histogram((1,)).snapshot()
+        self.assertEqual(snapshot['count'], 0)
+        self.assertIsNone(snapshot['mean'])
+        self.assertIsNone(snapshot['p99'])
+
+
+class TestMemorySink(unittest2.TestCase):
+    def test_snapshot(self):
+        sink = MemorySink()
+        sink.increment('retrieve', 'Model', 'calls')
+        sink.increment('retrieve', 'Model', 'errors')
+        sink.timing('retrieve', 'Model', 'query', 0.001)
+        sink.observe('retrieve', 'Model', 'rows', 3)
+        stats = sink.snapshot()['retrieve']['Model']
+        self.assertEqual(stats['calls'], 1)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['query']['count'], 1)
+        self.assertEqual(stats['rows']['sum'], 3)
+        sink.reset()
+        self.assertDictEqual(sink.snapshot(), {})
+
+    def test_threads(self):
+        sink = MemorySink()
+
+        def _record():
+            for _ in range(1000):
+                sink.increment('create', 'Model', 'calls')
+                sink.timing('create', 'Model', 'total', 0.001)
+
+        threads = [threading.Thread(target=_record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = sink.snapshot()['create']['Model']
+        self.assertEqual(stats['calls'], 4000)
+        self.assertEqual(stats['total']['count'], 4000)
+
+    def test_measure(self):
+        sink = MemorySink()
+        with measure(sink, MemoryModel, 'decode'):
+            pass
+        self.assertDictEqual(sink.snapshot(), {})
+        state = start_operation('retrieve')
+        self.assertEqual(current_operation(), 'retrieve')
+        with measure(sink, MemoryModel, 'decode'):
+            pass
+        with measure(NULL_SINK, MemoryModel, 'decode'):
+            pass
+        finish_operation(sink, 'retrieve', 'MemoryModel', state)
+        self.assertIsNone(current_operation())
+        stats = sink.snapshot()['retrieve']['MemoryModel']
+        self.assertEqual(stats['decode']['count'], 1)
+        self.assertEqual(stats['total']['count'], 1)
+        self.assertEqual(stats['calls'], 1)
+
+    def test_estimate_bytes(self):
+        self.assertEqual(estimate_bytes([dict(id='abc', created=1, value=None, tags=set(['x', 'yz']))]), 14)
+        self.assertEqual(estimate_bytes([('ab', b'c')]), 3)
+
+
+class TestManagerMetrics(unittest2.TestCase):
+    def setUp(self):
+        MetricsManager._statement_cache = None
+        self.session = MemorySession()
+        self.session.create_table(MemoryModel)
+        connection.register_connection(_CONNECTION, session=self.session)
+        self.addCleanup(connection.unregister_connection, _CONNECTION)
+
+    def test_default_sink(self):
+        self.assertIs(MetricsManager.metrics_sink, NULL_SINK)
+        MetricsManager().create(dict(id='a', created=1))
+        self.assertDictEqual(MetricsManager.metrics_sink.snapshot(), {})
+
+    def test_operations(self):
+        manager = MetricsManager()
+        manager.metrics_sink = MemorySink()
+        for created in range(3):
+            manager.create(dict(id='a', created=created, value='abc'))
+        manager.retrieve(dict(id='a', created=1))
+        self.assertRaises(NotFoundException, manager.retrieve, dict(id='a', created=5))
+        manager.retrieve_list({'count': 2})
+        list(manager.iter_list({}))
+        snapshot = manager.metrics_sink.snapshot()
+
+        create = snapshot['create']['MemoryModel']
+        self.assertEqual(create['calls'], 3)
+        self.assertEqual(create['query']['count'], 3)
+        self.assertEqual(create['serialize']['count'], 3)
+        self.assertNotIn('rows', create)
+
+        retrieve = snapshot['retrieve']['MemoryModel']
+        self.assertEqual(retrieve['calls'], 1)
+        self.assertEqual(retrieve['errors'], 1)
+        self.assertEqual(retrieve['total']['count'], 2)
+        self.assertNotIn('decode', retrieve)
+        self.assertEqual(retrieve['rows']['sum'], 1)
+        self.assertEqual(retrieve['bytes']['sum'], 12)
+
+        retrieve_list = snapshot['retrieve_list']['MemoryModel']
+        self.assertEqual(retrieve_list['rows']['max'], 3)
+        for phase in ('total', 'query', 'serialize'):
+            self.assertEqual(retrieve_list[phase]['count'], 1)
+        self.assertNotIn('decode', retrieve_list)
+
+        iter_list = snapshot['iter_list']['MemoryModel']
+        self.assertEqual(iter_list['calls'], 1)
+        self.assertEqual(iter_list['rows']['sum'], 3)
+
+    def test_model_phases(self):
+        manager = MetricsManager()
+        manager.metrics_sink = MemorySink()
+        manager.serialize_rows = False
+        manager.create(dict(id='a', created=1, value='abc'))
+        manager.retrieve(dict(id='a', created=1))
+        manager.retrieve_list({})
+        snapshot = manager.metrics_sink.snapshot()
+        for operation in ('retrieve', 'retrieve_list'):
+            for phase in ('total', 'query', 'decode', 'serialize'):
+                self.assertEqual(snapshot[operation]['MemoryModel'][phase]['count'], 1)
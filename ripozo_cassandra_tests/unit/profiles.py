@@ -0,0 +1,30 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra import ConsistencyLevel
+from cassandra.policies import ConstantSpeculativeExecutionPolicy, TokenAwarePolicy
+from cassandra.query import dict_factory
+
+from ripozo_cassandra.profiles import execution_profile
+
+import unittest2
+
+
+class TestProfiles(unittest2.TestCase):
+    def test_execution_profile(self):
+        profile = execution_profile(ConsistencyLevel.LOCAL_ONE, local_dc='dc1', speculative_delay=0.02,
+                                    speculative_attempts=2, request_timeout=1.5)
+        self.assertEqual(profile.consistency_level, ConsistencyLevel.LOCAL_ONE)
+        self.assertEqual(profile.request_timeout, 1.5)
+        self.assertIs(profile.row_factory, dict_factory)
+        self.assertIsInstance(profile.load_balancing_policy, TokenAwarePolicy)
+        self.assertEqual(profile.load_balancing_policy._child_policy.local_dc, 'dc1')
+        self.assertIsInstance(profile.speculative_execution_policy, ConstantSpeculativeExecutionPolicy)
+        self.assertEqual(profile.speculative_execution_policy.delay, 0.02)
+        self.assertEqual(profile.speculative_execution_policy.max_attempts, 2)
+
+    def test_no_speculative_execution(self):
+        profile = execution_profile(ConsistencyLevel.LOCAL_QUORUM)
+        self.assertNotIsInstance(profile.speculative_execution_policy, ConstantSpeculativeExecutionPolicy)
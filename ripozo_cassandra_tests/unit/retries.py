@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra import InvalidRequest, OperationTimedOut
+from cassandra.cqlengine import connection
+from cassandra.query import SimpleStatement
+
+from ripozo_cassandra_tests.memory import MemorySession
+from ripozo_cassandra.retries import RetryPolicy
+from ripozo_cassandra_tests.unit.memory import CounterManager, MemoryCounter, MemoryManager, MemoryModel, \
+    _CONNECTION
+
+import mock
+import unittest2
+
+
+class TestRetryPolicy(unittest2.TestCase):
+    def test_next_delay(self):
+        policy = RetryPolicy(max_attempts=3, base_delay=0.1, max_delay=0.15)
+        deadline = policy.start()
+        error = OperationTimedOut()
+        self.assertLessEqual(policy.next_delay(error, True, 1, deadline), 0.1)
+        self.assertLessEqual(policy.next_delay(error, True, 2, deadline), 0.15)
+        self.assertIsNone(policy.next_delay(error, True, 3, deadline))
+        self.assertIsNone(policy.next_delay(error, False, 1, deadline))
+        self.assertIsNone(policy.next_delay(InvalidRequest(), True, 1, deadline))
+        policy.base_delay = 1
+        self.assertIsNone(policy.next_delay(error, True, 1, policy.start() - 2))
+
+    def test_call(self):
+        policy = RetryPolicy(base_delay=0)
+        function = mock.Mock(side_effect=[OperationTimedOut(), OperationTimedOut(), 'result'])
+        self.assertEqual(policy.call(function, True), 'result')
+        self.assertEqual(function.call_count, 3)
+        function = mock.Mock(side_effect=[OperationTimedOut(), 'result'])
+        self.assertRaises(OperationTimedOut, policy.call, function, False)
+        self.assertEqual(function.call_count, 1)
+        function = mock.Mock(side_effect=[OperationTimedOut()] * 3 + ['result'])
+        self.assertRaises(OperationTimedOut, policy.call, function, True)
+        self.assertEqual(function.call_count, 3)
+
+    def test_call_many(self):
+        policy = RetryPolicy(base_delay=0)
+        statements = [SimpleStatement('a', is_idempotent=True), SimpleStatement('b', is_idempotent=True),
+                      SimpleStatement('c'), SimpleStatement('d', is_idempotent=True)]
+        error = OperationTimedOut()
+        execute = mock.Mock(side_effect=[[(True, 'a'), (False, error), (False, error), (False, ValueError())],
+                                         [(True, 'b')]])
+        outcomes = policy.call_many(execute, statements)
+        self.assertListEqual(outcomes[:3], [(True, 'a'), (True, 'b'), (False, error)])
+        self.assertIsInstance(outcomes[3][1], ValueError)
+        self.assertListEqual(execute.call_args[0][0], [statements[1]])
+
+    def test_driver_retries(self):
+        policy = RetryPolicy()
+        query = SimpleStatement('a', is_idempotent=True)
+        self.assertEqual(policy.on_write_timeout(query, 1, 'SIMPLE', 1, 0, 0), (policy.RETRY_NEXT_HOST, 1))
+        self.assertEqual(policy.on_read_timeout(query, 1, 1, 0, False, 1), (policy.RETHROW, None))
+        self.assertEqual(policy.on_unavailable(SimpleStatement('a'), 1, 1, 0, 0), (policy.RETHROW, None))
+        self.assertEqual(policy.on_request_error(query, 1, OperationTimedOut(), 0),
+                         (policy.RETRY_NEXT_HOST, 1))
+        policy.next_host = False
+        self.assertEqual(policy.on_request_error(query, 1, OperationTimedOut(), 0), (policy.RETHROW, None))
+
+
+class TestManagerRetries(unittest2.TestCase):
+    def setUp(self):
+        MemoryManager._statement_cache = None
+        CounterManager._statement_cache = None
+        self.session = MemorySession()
+        self.session.create_table(MemoryModel)
+        self.session.create_table(MemoryCounter)
+        connection.register_connection(_CONNECTION, session=self.session)
+        self.addCleanup(connection.unregister_connection, _CONNECTION)
+        execute = self.session.execute
+        self.failures = []
+
+        def _execute(*args, **kwargs):
+            if self.failures:
+                raise self.failures.pop()
+            return execute(*args, **kwargs)
+
+        patcher = mock.patch.object(self.session, 'execute', side_effect=_execute)
+        self.execute = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retries(self):
+        manager = MemoryManager()
+        manager.retry_policy = RetryPolicy(base_delay=0)
+        manager.create(dict(id='a', created=1, value='b'))
+        self.failures = [OperationTimedOut()]
+        self.assertEqual(manager.retrieve(dict(id='a', created=1))['value'], 'b')
+        self.failures = [OperationTimedOut()]
+        manager.update(dict(id='a', created=1), dict(value='c'))
+        self.assertEqual(self.execute.call_args[0][0].retry_policy, manager.retry_policy)
+        self.failures = [OperationTimedOut()]
+        self.assertRaises(OperationTimedOut, manager.create, dict(id='b', created=1))
+        manager.fail_create_if_exists = False
+        self.failures = [OperationTimedOut()]
+        manager.create(dict(id='b', created=1))
+        self.assertEqual(len(manager.retrieve_many([dict(id='a', created=1), dict(id='b', created=1)])), 2)
+
+    def test_counters(self):
+        manager = CounterManager()
+        manager.retry_policy = RetryPolicy(base_delay=0)
+        self.failures = [OperationTimedOut()]
+        self.assertRaises(OperationTimedOut, manager.increment, dict(id='a'), dict(hits=1))
+        self.assertEqual(self.execute.call_count, 1)
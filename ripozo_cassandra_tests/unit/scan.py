@@ -0,0 +1,129 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra.cqlengine import connection
+
+from ripozo_cassandra.cache import LRUCache
+from ripozo_cassandra_tests.memory import MemorySession
+from ripozo_cassandra.scan import MAX_TOKEN, MIN_TOKEN, TokenRange, combine_aggregates, sample_ranges, \
+    scan_pages, split_ring
+from ripozo_cassandra_tests.unit.memory import MemoryManager, MemoryModel, _CONNECTION
+
+import threading
+import unittest2
+
+
+class TestScan(unittest2.TestCase):
+    def test_split_ring(self):
+        ranges = split_ring(4)
+        self.assertEqual(len(ranges), 4)
+        self.assertEqual(ranges[0].start, MIN_TOKEN)
+        self.assertEqual(ranges[-1].end, MAX_TOKEN)
+        for previous, current in zip(ranges, ranges[1:]):
+            self.assertEqual(previous.end, current.start)
+        self.assertListEqual(split_ring(2, 0, 10), [TokenRange(0, 5, None), TokenRange(5, 10, None)])
+
+    def test_scan_pages(self):
+        in_flight = []
+        lock = threading.Lock()
+
+        def _fetch(token_range):
+            with lock:
+                in_flight.append(token_range.start)
+            page = token_range.paging_state or 0
+            resume = token_range._replace(paging_state=page + 1) if page < 2 else None
+            return [(token_range.start, page)], resume
+
+        pages = list(scan_pages(_fetch, split_ring(5, 0, 50), 2))
+        self.assertEqual(len(pages), 15)
+        models = sorted(model for page in pages for model in page.models)
+        self.assertListEqual(models, [(start, page) for start in range(0, 50, 10) for page in range(3)])
+        self.assertTrue(all(page.resume is None for page in pages if page.models[0][1] == 2))
+
+    def test_scan_pages_error(self):
+        def _fetch(token_range):
+            raise ValueError(token_range)
+
+        self.assertRaises(ValueError, list, scan_pages(_fetch, split_ring(3), 2))
+
+
+    def test_sample_ranges(self):
+        ranges = split_ring(8)
+        self.assertListEqual(sample_ranges(ranges, 4), ranges[::2])
+        self.assertListEqual(sample_ranges(ranges, 3), [ranges[0], ranges[2], ranges[5]])
+        self.assertListEqual(sample_ranges(ranges, 10), ranges)
+
+    def test_combine_aggregates(self):
+        self.assertEqual(combine_aggregates('count', [1, 2, 0]), 3)
+        self.assertEqual(combine_aggregates('sum', [1, None, 2], scale=2.5), 8)
+        self.assertEqual(combine_aggregates('sum', [1.5], scale=2), 3.0)
+        self.assertEqual(combine_aggregates('min', [None, 3, 2]), 2)
+        self.assertEqual(combine_aggregates('max', [None, 3, 2]), 3)
+        self.assertIsNone(combine_aggregates('max', [None]))
+
+
+class TestManagerScan(unittest2.TestCase):
+    def setUp(self):
+        MemoryManager._statement_cache = None
+        self.session = MemorySession()
+        self.session.create_table(MemoryModel)
+        connection.register_connection(_CONNECTION, session=self.session)
+        self.addCleanup(connection.unregister_connection, _CONNECTION)
+        for index in range(40):
+            for created in range(3):
+                MemoryModel.create(id=str(index), created=created, value='v')
+
+    def test_scan(self):
+        manager = MemoryManager()
+        manager.scan_splits = 7
+        manager.stream_fetch_size = 5
+        models = list(manager.scan())
+        self.assertEqual(len(models), 120)
+        self.assertSetEqual(set((model['id'], model['created']) for model in models),
+                            set((str(index), created) for index in range(40) for created in range(3)))
+
+    def test_scan_resume(self):
+        manager = MemoryManager()
+        manager.scan_splits = 3
+        manager.scan_concurrency = 1
+        manager.stream_fetch_size = 10
+        ranges = split_ring(manager.scan_splits)
+        pages = manager.scan_pages(ranges=ranges)
+        first = next(pages)
+        pages.close()
+        self.assertIsNotNone(first.resume)
+        self.assertEqual(len(first.models), 10)
+        remaining = [first.resume] + ranges[1:]
+        rest = [model for page in manager.scan_pages(ranges=remaining) for model in page.models]
+        self.assertEqual(len(first.models) + len(rest), 120)
+
+    def test_count(self):
+        manager = MemoryManager()
+        requests = self.session.request_count
+        self.assertEqual(manager.count({}), 120)
+        self.assertEqual(manager.count({'id': '7', 'count': 1}), 3)
+        self.assertEqual(manager.count({'id': '7', 'created': '2'}), 1)
+        self.assertEqual(self.session.request_count - requests, manager.scan_splits + 2)
+
+    def test_aggregate(self):
+        manager = MemoryManager()
+        self.assertDictEqual(manager.aggregate({}, 'created'), dict(count=120, min=0, max=2, sum=120))
+        self.assertDictEqual(manager.aggregate({'id': '7'}, 'created', functions=('max',)),
+                             dict(count=3, max=2))
+        manager.allow_filtering = True
+        self.assertDictEqual(manager.aggregate({'created': 1}, 'created'), dict(count=40, min=1, max=1, sum=40))
+
+    def test_approximate_count(self):
+        manager = MemoryManager()
+        manager.count_cache = LRUCache()
+        manager.count_sample = 16
+        requests = self.session.request_count
+        count = manager.count({}, approximate=True)
+        self.assertEqual(count % 4, 0)
+        self.assertEqual(self.session.request_count - requests, 16)
+        MemoryModel.objects(id='1').delete()
+        self.assertEqual(manager.count({}, approximate=True), count)
+        self.assertEqual(self.session.request_count - requests, 17)
+        self.assertEqual(manager.count({}), 117)
@@ -0,0 +1,81 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra.cqlengine import columns
+from cassandra.cqlengine.models import Model
+
+from ripozo.utilities import make_json_safe
+
+from ripozo_cassandra.serializers import compile_row_serializer, compile_serializer
+
+import datetime
+import decimal
+import unittest2
+import uuid
+
+
+class SerializerModel(Model):
+    __keyspace__ = 'ks'
+    id = columns.UUID(primary_key=True)
+    created = columns.TimeUUID()
+    name = columns.Text()
+    amount = columns.Decimal()
+    updated = columns.DateTime()
+    tags = columns.Set(columns.Text)
+    history = columns.List(columns.Decimal)
+    attributes = columns.Map(columns.Text, columns.DateTime)
+    point = columns.Tuple(columns.Integer, columns.Decimal)
+    label = columns.Text(db_field='lbl')
+
+
+class TestCompileSerializer(unittest2.TestCase):
+    def setUp(self):
+        self.obj = SerializerModel(id=uuid.uuid4(), created=uuid.uuid1(), name='blah',
+                                   amount=decimal.Decimal('1.5'),
+                                   updated=datetime.datetime(2015, 6, 30, 10, 47),
+                                   tags=set(['a', 'b']), history=[decimal.Decimal('2.5')],
+                                   attributes=dict(first=datetime.datetime(2015, 1, 1)),
+                                   point=(1, decimal.Decimal('3.5')))
+
+    def test_matches_make_json_safe(self):
+        fields_list = list(SerializerModel._columns)
+        serialized = compile_serializer(SerializerModel, fields_list)(self.obj)
+        expected = make_json_safe(dict(self.obj))
+        self.assertEqual(sorted(serialized.pop('tags')), sorted(expected.pop('tags')))
+        self.assertDictEqual(serialized, expected)
+
+    def test_null_values(self):
+        obj = SerializerModel(id=uuid.uuid4())
+        fields_list = list(SerializerModel._columns)
+        serialized = compile_serializer(SerializerModel, fields_list)(obj)
+        self.assertDictEqual(serialized, make_json_safe(dict(obj)))
+
+    def test_only_fields(self):
+        serialized = compile_serializer(SerializerModel, ('name', 'amount', 'related.id'))(self.obj)
+        self.assertDictEqual(serialized, dict(name='blah', amount=1.5))
+
+
+class TestCompileRowSerializer(unittest2.TestCase):
+    def assertRowSerialized(self, row, fields_list):
+        serialized = compile_row_serializer(SerializerModel, fields_list)(row)
+        expected = compile_serializer(SerializerModel, fields_list)(SerializerModel._construct_instance(row))
+        self.assertDictEqual(serialized, expected)
+
+    def test_matches_model(self):
+        row = dict(id=uuid.uuid4(), created=uuid.uuid1(), name='blah', amount=decimal.Decimal('1.5'),
+                   updated=datetime.datetime(2015, 6, 30, 10, 47), tags=['a'],
+                   history=[decimal.Decimal('2.5')], attributes=dict(first=datetime.datetime(2015, 1, 1)),
+                   point=(1, decimal.Decimal('3.5')), lbl='x')
+        self.assertRowSerialized(row, list(SerializerModel._columns))
+
+    def test_null_values(self):
+        row = dict((column.db_field_name, None) for column in SerializerModel._columns.values())
+        self.assertRowSerialized(row, list(SerializerModel._columns))
+        self.assertRowSerialized(dict(id=uuid.uuid4()), list(SerializerModel._columns))
+
+    def test_only_fields(self):
+        serialized = compile_row_serializer(SerializerModel, ('label', 'amount', 'related.id'))(
+            dict(id=uuid.uuid4(), lbl='x', amount=decimal.Decimal('1.5'), name='blah'))
+        self.assertDictEqual(serialized, dict(label='x', amount=1.5))
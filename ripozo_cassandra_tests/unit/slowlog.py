@@ -0,0 +1,168 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra import InvalidRequest
+from cassandra.cqlengine import connection
+from cassandra.query import BatchStatement, SimpleStatement, TraceEvent
+
+from ripozo_cassandra_tests.memory import MemorySession
+from ripozo_cassandra.slowlog import SlowQueryLog, TraceStep, bound_values, redact_value, statement_cql, watch
+from ripozo_cassandra_tests.unit.memory import MemoryManager, MemoryModel, _CONNECTION
+
+import mock
+import time
+import unittest2
+import uuid
+
+
+class TestSlowQueryLog(unittest2.TestCase):
+    def setUp(self):
+        patcher = mock.patch('ripozo_cassandra.slowlog._LOGGER')
+        self.logger = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = MemorySession()
+        self.session.create_table(MemoryModel)
+        self.prepared = self.session.prepare('SELECT * FROM ks.memory_model WHERE "id" = ? AND "created" = ?')
+
+    def test_statement_cql(self):
+        self.assertEqual(statement_cql(self.prepared.bind(['a', 1])), self.prepared.query_string)
+        self.assertEqual(statement_cql(SimpleStatement('SELECT 1')), 'SELECT 1')
+        batch = BatchStatement()
+        batch.add(SimpleStatement('SELECT 1'))
+        self.assertEqual(statement_cql(batch), 'BATCH of 1 statements')
+
+    def test_bound_values(self):
+        self.assertListEqual(bound_values(self.prepared.bind(['a', 1])), ['a'])
+        self.assertListEqual(bound_values(SimpleStatement('SELECT'), {'0': 'a', '1': 2}), ['a', 2])
+        self.assertListEqual(bound_values(SimpleStatement('SELECT')), [])
+
+    def test_redact_value(self):
+        self.assertEqual(redact_value('a', b'key'), redact_value(b'a', 'key'))
+        self.assertNotEqual(redact_value('a', b'key'), redact_value('b', b'key'))
+        self.assertNotEqual(redact_value('a', b'key'), redact_value('a', b'other'))
+        self.assertEqual(len(redact_value(1, b'key')), 16)
+        self.assertIsNone(redact_value(None, b'key'))
+        self.assertNotEqual(SlowQueryLog().redact_key, SlowQueryLog().redact_key)
+
+    def test_observe(self):
+        log = SlowQueryLog(threshold=0.1, max_entries=2)
+        statement = self.prepared.bind(['a', 1])
+        self.assertIsNone(log.observe(MemoryModel, statement, None, 0.05))
+        result = mock.MagicMock(current_rows=[dict(id='a')])
+        result.response_future.coordinator_host = '10.0.0.1:9042'
+        entry = log.observe(MemoryModel, statement, None, 0.2, result=result)
+        self.assertEqual(entry.model, 'MemoryModel')
+        self.assertEqual(entry.values, ['a'])
+        self.assertIsNone(entry.fetch_size)
+        self.assertEqual(entry.rows, 1)
+        self.assertEqual(entry.coordinator, '10.0.0.1:9042')
+        self.assertIsNone(entry.trace)
+        self.assertFalse(result.get_query_trace.called)
+        self.assertEqual(self.logger.warning.call_count, 1)
+        error = InvalidRequest('bad')
+        log.observe(MemoryModel, SimpleStatement('SELECT', fetch_size=10), {'0': 'b'}, 0.3, error=error)
+        log.observe(MemoryModel, statement, None, 0.4)
+        entries = log.entries()
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[0].fetch_size, 10)
+        self.assertIs(entries[0].error, error)
+        self.assertIsNone(entries[0].coordinator)
+        log.clear()
+        self.assertListEqual(log.entries(), [])
+
+    def test_trace(self):
+        executor = mock.MagicMock()
+        log = SlowQueryLog(threshold=0, trace_sample=1, redact=True, redact_key=b'key', executor=executor)
+        self.assertTrue(log.sample_trace())
+        self.assertFalse(SlowQueryLog().sample_trace())
+        trace = mock.MagicMock(events=[TraceEvent('Parsing', uuid.uuid1(), '10.0.0.1', 1500, 'Native-1')])
+        result = mock.MagicMock(current_rows=[])
+        result.get_query_trace.return_value = trace
+        entry = log.observe(MemoryModel, self.prepared.bind(['a', 1]), None, 0.1, result=result, traced=True)
+        # The trace is fetched on the executor, not in the request path
+        self.assertFalse(result.get_query_trace.called)
+        self.assertIsNone(entry.trace)
+        self.assertListEqual(entry.values, [redact_value('a', b'key')])
+        function, args = executor.submit.call_args[0][0], executor.submit.call_args[0][1:]
+        function(*args)
+        self.assertTupleEqual(log.entries()[0].trace, (TraceStep('Parsing', '10.0.0.1', 0.0015, 'Native-1'),))
+        result.get_query_trace.side_effect = Exception('unavailable')
+        log.observe(MemoryModel, self.prepared.bind(['a', 1]), None, 0.1, result=result, traced=True)
+        function, args = executor.submit.call_args[0][0], executor.submit.call_args[0][1:]
+        function(*args)
+        self.assertIsNone(log.entries()[1].trace)
+
+    def test_trace_thread(self):
+        log = SlowQueryLog(threshold=0)
+        result = mock.MagicMock(current_rows=[])
+        result.get_query_trace.return_value = mock.MagicMock(events=[])
+        log.observe(MemoryModel, SimpleStatement('SELECT'), None, 0.1, result=result, traced=True)
+        for _ in range(100):
+            if log.entries()[0].trace is not None:
+                break
+            time.sleep(0.01)
+        self.assertTupleEqual(log.entries()[0].trace, ())
+
+    def test_watch(self):
+        log = SlowQueryLog(threshold=0)
+        statement = SimpleStatement('SELECT')
+        with watch(log, MemoryModel, statement) as watched:
+            self.assertFalse(watched.trace)
+        self.assertEqual(watched.stop().statement, 'SELECT')
+        with self.assertRaises(InvalidRequest):
+            with watch(log, MemoryModel, statement):
+                raise InvalidRequest('bad')
+        self.assertIsInstance(log.entries()[-1].error, InvalidRequest)
+        with watch(None, MemoryModel, statement) as watched:
+            self.assertFalse(watched.trace)
+        self.assertIsNone(watched.stop())
+
+
+class TestManagerSlowQueryLog(unittest2.TestCase):
+    def setUp(self):
+        patcher = mock.patch('ripozo_cassandra.slowlog._LOGGER')
+        self.logger = patcher.start()
+        self.addCleanup(patcher.stop)
+        MemoryManager._statement_cache = None
+        self.session = MemorySession(latency=lambda query: 0.02 if 'SELECT' in statement_cql(query) else 0)
+        self.session.create_table(MemoryModel)
+        connection.register_connection(_CONNECTION, session=self.session)
+        self.addCleanup(connection.unregister_connection, _CONNECTION)
+
+    def test_slow_reads(self):
+        manager = MemoryManager()
+        manager.slow_query_log = SlowQueryLog(threshold=0.01)
+        manager.create(dict(id='a', created=1, value='b'))
+        self.assertListEqual(manager.slow_query_log.entries(), [])
+        manager.retrieve(dict(id='a', created=1))
+        manager.retrieve_list({'id': 'a', 'count': 5})
+        retrieve, retrieve_list = manager.slow_query_log.entries()
+        self.assertTrue(retrieve.statement.startswith('SELECT "id", "created", "value" FROM ks.memory_model'))
+        self.assertListEqual(retrieve.values, ['a'])
+        self.assertEqual(retrieve.rows, 1)
+        self.assertGreaterEqual(retrieve.latency, 0.01)
+        self.assertEqual(retrieve_list.fetch_size, 5)
+        self.assertListEqual(retrieve_list.values, ['a'])
+
+    def test_trace_sample(self):
+        manager = MemoryManager()
+        manager.slow_query_log = SlowQueryLog(threshold=1, trace_sample=1)
+        with mock.patch.object(self.session, 'execute', wraps=self.session.execute) as execute:
+            manager.create(dict(id='a', created=1, value='b'))
+            manager.slow_query_log.trace_sample = 0
+            manager.retrieve(dict(id='a', created=1))
+        self.assertTrue(execute.call_args_list[0][1]['trace'])
+        self.assertNotIn('trace', execute.call_args_list[1][1])
+        self.assertListEqual(manager.slow_query_log.entries(), [])
+
+    def test_slow_error(self):
+        manager = MemoryManager()
+        manager.slow_query_log = SlowQueryLog(threshold=0)
+        with mock.patch.object(self.session, 'execute', side_effect=InvalidRequest('bad')):
+            self.assertRaises(InvalidRequest, manager.retrieve, dict(id='a', created=1))
+        entry, = manager.slow_query_log.entries()
+        self.assertIsInstance(entry.error, InvalidRequest)
+        self.assertIsNone(entry.rows)
+
@@ -0,0 +1,105 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from cassandra.cqlengine import columns
+from cassandra.cqlengine.models import Model
+
+from ripozo_cassandra.statements import StatementCache, select_cql, \
+    insert_cql, update_cql, delete_cql, counter_cql, is_idempotent_cql, aggregate_cql
+
+import mock
+import unittest2
+
+
+class StatementModel(Model):
+    __keyspace__ = 'ks'
+    __table_name__ = 'statement_model'
+    id = columns.Text(primary_key=True)
+    created = columns.Integer(primary_key=True, clustering_order='DESC')
+    value = columns.Text(db_field='val')
+
+
+class TestStatements(unittest2.TestCase):
+    def test_select_cql(self):
+        cql = select_cql(StatementModel, ('id', 'value'), ('id', 'created'), limit=2)
+        self.assertEqual(cql, 'SELECT "id", "val" FROM ks.statement_model '
+                              'WHERE "id" = ? AND "created" = ? LIMIT 2')
+
+    def test_select_cql_in(self):
+        cql = select_cql(StatementModel, ('id', 'created'), ('id',), in_column='created')
+        self.assertEqual(cql, 'SELECT "id", "created" FROM ks.statement_model '
+                              'WHERE "id" = ? AND "created" IN ?')
+
+    def test_select_cql_token_range(self):
+        cql = select_cql(StatementModel, ('id',), (), token_range=True)
+        self.assertEqual(cql, 'SELECT "id" FROM ks.statement_model '
+                              'WHERE token("id") > ? AND token("id") <= ?')
+
+    def test_aggregate_cql(self):
+        cql = aggregate_cql(StatementModel, (('count', None), ('max', 'value')), ('id',))
+        self.assertEqual(cql, 'SELECT count(*) AS "count", max("val") AS "max_value" '
+                              'FROM ks.statement_model WHERE "id" = ?')
+        cql = aggregate_cql(StatementModel, (('sum', 'created'),), ('value',), token_range=True,
+                            allow_filtering=True)
+        self.assertEqual(cql, 'SELECT sum("created") AS "sum_created" FROM ks.statement_model '
+                              'WHERE "val" = ? AND token("id") > ? AND token("id") <= ? ALLOW FILTERING')
+
+    def test_insert_cql(self):
+        cql = insert_cql(StatementModel, ('id', 'created'), if_not_exists=True)
+        self.assertEqual(cql, 'INSERT INTO ks.statement_model ("id", "created") '
+                              'VALUES (?, ?) IF NOT EXISTS')
+
+    def test_counter_cql(self):
+        cql = counter_cql(StatementModel, ('value',), ('id', 'created'))
+        self.assertEqual(cql, 'UPDATE ks.statement_model SET "val" = "val" + ? '
+                              'WHERE "id" = ? AND "created" = ?')
+
+    def test_update_cql(self):
+        cql = update_cql(StatementModel, ('value',), ('id', 'created'))
+        self.assertEqual(cql, 'UPDATE ks.statement_model SET "val" = ? '
+                              'WHERE "id" = ? AND "created" = ?')
+
+    def test_delete_cql(self):
+        cql = delete_cql(StatementModel, ('id', 'created'))
+        self.assertEqual(cql, 'DELETE FROM ks.statement_model '
+                              'WHERE "id" = ? AND "created" = ?')
+
+    def test_is_idempotent_cql(self):
+        where = ('id', 'created')
+        self.assertTrue(is_idempotent_cql(select_cql(StatementModel, ('value',), where)))
+        self.assertTrue(is_idempotent_cql(insert_cql(StatementModel, where)))
+        self.assertTrue(is_idempotent_cql(update_cql(StatementModel, ('value',), where)))
+        self.assertTrue(is_idempotent_cql(delete_cql(StatementModel, where)))
+        self.assertFalse(is_idempotent_cql(insert_cql(StatementModel, where, if_not_exists=True)))
+        self.assertFalse(is_idempotent_cql(update_cql(StatementModel, ('value',), where, if_exists=True)))
+        self.assertFalse(is_idempotent_cql(delete_cql(StatementModel, where, if_exists=True)))
+        self.assertFalse(is_idempotent_cql(counter_cql(StatementModel, ('value',), where)))
+
+
+class TestStatementCache(unittest2.TestCase):
+    def test_prepares_once(self):
+        cache = StatementCache()
+        session = mock.MagicMock()
+        first = cache.get(session, ('a',), 'SELECT')
+        second = cache.get(session, ('a',), 'SELECT')
+        self.assertIs(first, second)
+        self.assertEqual(session.prepare.call_count, 1)
+        self.assertDictEqual(cache.stats(), {('a',): dict(hits=1, misses=1)})
+        self.assertTrue(first.is_idempotent)
+        self.assertFalse(cache.get(session, ('b',), 'DELETE FROM t WHERE "id" = ? IF EXISTS').is_idempotent)
+
+    def test_new_session_prepares_again(self):
+        cache = StatementCache()
+        cache.get(mock.MagicMock(), ('a',), 'SELECT')
+        session = mock.MagicMock()
+        prepared = cache.get(session, ('a',), 'SELECT')
+        self.assertIs(prepared, session.prepare.return_value)
+        self.assertDictEqual(cache.stats(), {('a',): dict(hits=0, misses=2)})
+
+    def test_clear(self):
+        cache = StatementCache()
+        cache.get(mock.MagicMock(), ('a',), 'SELECT')
+        cache.clear()
+        self.assertDictEqual(cache.stats(), {})
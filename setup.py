@@ -23,6 +23,7 @@ setup(
                  ' easily create cassandra backed Hypermedia/HATEOAS/REST apis'),
     install_requires=[
         'cassandra-driver',
+        'futures; python_version < "3"',
         'ripozo',
         'six',
     ],